@@ -0,0 +1,30 @@
+"""Shared pytest configuration"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    """Adds --benchmark, which runs the (slow) benchmark tests"""
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Also run tests marked @pytest.mark.benchmark",
+    )
+
+
+def pytest_configure(config):
+    """Registers the benchmark marker"""
+    config.addinivalue_line(
+        "markers", "benchmark: timing comparison; skipped unless --benchmark is set"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skips benchmarks unless --benchmark is set"""
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark; run with --benchmark")
+    for item in items:
+        if item.get_closest_marker("benchmark"):
+            item.add_marker(skip)
@@ -6,6 +6,7 @@ from dateutil import parser as dateparser
 
 from protohaven_api.automation.membership import clearances as c
 from protohaven_api.config import tz
+from protohaven_api.integrations.data.local_db import MEMORY
 from protohaven_api.testing import d
 
 
@@ -238,3 +239,53 @@ def test_build_recert_env(mocker):
     }  # Note neon ID, not email
     assert result.reservations == mock_reservations
     assert result.contact_info == {"123": ("Test", "test@example.com")}
+
+
+def test_structured_reservations_booked_call_count(mocker):
+    """Repeated reservation lookups within a clearance sync share one fetch of
+    the Booked resource catalog, rather than one per lookup"""
+    mocker.patch.object(c.booked, "get_connector")
+    mocker.patch.object(
+        c.booked, "reservation_store", c.booked.ReservationWindowStore(MEMORY)
+    )
+    req = c.booked.get_connector().booked_request
+
+    def _request(_, url, **_kwargs):
+        if url == "/Resources/":
+            return {
+                "resources": [
+                    {
+                        "customAttributes": [{"id": 3, "value": "ABC"}],
+                        "resourceId": 1,
+                        "name": "Saw",
+                    }
+                ]
+            }
+        if url == "/Users/":
+            return {"users": []}
+        return {"reservations": []}
+
+    req.side_effect = _request
+    mocker.patch.object(c.booked, "get_config", return_value=3)
+
+    def resource_calls():
+        return sum(1 for call in req.call_args_list if call.args[1] == "/Resources/")
+
+    def sync(invalidate):
+        c.booked.catalog.invalidate()
+        req.reset_mock()
+        for _ in range(3):
+            if invalidate:  # Simulates the prior uncached behavior
+                c.booked.catalog.invalidate()
+            c._structured_reservations(  # pylint: disable=protected-access
+                d(0), d(30), {}
+            )
+            if invalidate:
+                c.booked.catalog.invalidate()
+            list(c.booked.get_reservations_for_areas((d(0), d(30)), {"ABC"}, "1"))
+        return resource_calls()
+
+    before, after = sync(invalidate=True), sync(invalidate=False)
+    assert before == 6
+    assert after == 1
+    c.booked.catalog.invalidate()
@@ -474,35 +474,15 @@ def as_member(data, send):  # pylint: disable=too-many-statements,too-many-local
 
     try:
         send("Checking reservations...", 65)
-        # Get all today's reservations
-        now = tznow()
-        all_reservations = []
-        booked_id = m.booked_id
-        for r in booked.cache.get_next_24h_reservations():
-            start = r["startDate"]
-            end = r["endDate"]
-            open_time = now.replace(hour=10, minute=0, second=0, microsecond=0)
-            close_time = now.replace(hour=22, minute=0, second=0, microsecond=0)
-            tool_area, tool_name = [t.strip() for t in r["resourceName"].split("-", 1)]
-
-            # Format times
-            start_str = "open" if start < open_time else start.strftime("%-I:%M %p")
-            end_str = "close" if end > close_time else end.strftime("%-I:%M %p")
-
-            # Check if this reservation belongs to the signing-in member
-            is_member_reservation = booked_id and str(r["userId"]) == str(booked_id)
-
-            all_reservations.append(
-                {
-                    "id": r["referenceNumber"],
-                    "resource": tool_name,
-                    "area": tool_area,
-                    "start": start_str,
-                    "end": end_str,
-                    "name": f"{r.get('firstName', '')} {r.get('lastName', '')}".strip(),
-                    "is_signed_in_member": is_member_reservation,
-                }
-            )
+        # Display strings are precomputed by the cache, which also indexes
+        # reservations by member so we can flag the signing-in member's own.
+        mine = {r.ref for r in booked.cache.get_for_neon_id(m.neon_id)}
+        if m.booked_id:
+            mine.update(r.ref for r in booked.cache.get_for_booked_user(m.booked_id))
+        all_reservations = [
+            {**r.as_display(), "is_signed_in_member": r.ref in mine}
+            for r in booked.cache.get_views()
+        ]
 
         result["reservations"] = all_reservations
     except Exception:  # pylint: disable=broad-exception-caught
@@ -706,6 +706,69 @@ def test_as_member_violations(mocker):
     )
 
 
+def test_as_member_reservations(mocker):
+    """The member's own reservations are flagged, whether matched by their
+    Booked user ID or by the Neon account their Booked user resolves to"""
+    mocker.patch.object(s, "_apply_async")
+    mocker.patch.object(s, "notify_async")
+    mocker.patch.object(
+        s.neon,
+        "cache",
+        {
+            "a@b.com": {
+                12345: mocker.MagicMock(
+                    neon_id=12345,
+                    booked_id=8,
+                    account_current_membership_status="Active",
+                    roles=[],
+                    fname="First",
+                    clearances=[],
+                    account_automation_ran="",
+                    waiver_accepted=(None, None),
+                    member_agreement_accepted=(None, None),
+                    announcements_acknowledged=None,
+                ),
+            }
+        },
+    )
+    mocker.patch.object(s.airtable.cache, "announcements_after", return_value=[])
+    mocker.patch.object(s.airtable.cache, "violations_for", return_value=[])
+    mocker.patch.object(s.booked, "get_config", return_value=3)
+    mocker.patch.object(
+        s.booked.neon,
+        "cached_neon_ids_from_booked_ids",
+        return_value={7: "12345", 8: None, 9: "999"},
+    )
+    cache = s.booked.ReservationCache()
+    cache.set_reservations(
+        [
+            {
+                "referenceNumber": f"R{uid}",
+                "userId": uid,
+                "resourceName": "Area - Tool",
+                "startDate": d(0, 12),
+                "endDate": d(0, 14),
+            }
+            for uid in (7, 8, 9)
+        ]
+    )
+    mocker.patch.object(s.booked, "cache", cache)
+    rep = s.as_member(
+        {
+            "person": "member",
+            "waiver_ack": True,
+            "email": "a@b.com",
+            "dependent_info": "DEP_INFO",
+        },
+        mocker.MagicMock(),
+    )
+    assert {r["id"]: r["is_signed_in_member"] for r in rep["reservations"]} == {
+        "R7": True,
+        "R8": True,
+        "R9": False,
+    }
+
+
 def test_as_member_wrong_time(mocker):
     """Active members outside their membership window get a dismissible warning field"""
     mocker.patch.object(s, "_apply_async")
@@ -956,12 +1019,7 @@ def test_as_member_company_id(mocker):
     mocker.patch.object(s.airtable.cache, "announcements_after", return_value=[])
     mocker.patch.object(s.airtable.cache, "violations_for", return_value=[])
     mocker.patch.object(s.airtable, "get_tools", return_value=[])
-    # Mock booked.cache properly
-    mock_booked_cache = mocker.MagicMock()
-    mock_booked_cache.__getitem__ = mocker.MagicMock(
-        side_effect=lambda key: [] if key == "reservations" else None
-    )
-    mocker.patch.object(s.booked, "cache", mock_booked_cache)
+    mocker.patch.object(s.booked.cache, "get_views", return_value=[])
     rep = s.as_member(
         {
             "person": "member",
@@ -0,0 +1,190 @@
+"""Snapshots of ops report indicators over time, for trend charts.
+
+Each numeric OpsItem value is recorded as a point in a series keyed by its
+category and label. Points are rolled up into hourly and daily buckets as
+they're written, and each resolution is kept for its own retention period -
+so a range query reads at most a few hundred pre-aggregated rows no matter
+how long the range is.
+"""
+
+import datetime
+import logging
+import re
+import time
+
+from protohaven_api.automation.reporting import ops_report
+from protohaven_api.integrations.data.local_db import LocalDB
+from protohaven_api.integrations.data.warm_cache import WarmDict
+
+log = logging.getLogger("automation.reporting.ops_history")
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+SNAPSHOT_PD_SEC = HOUR
+
+# (bucket size in seconds, retention in seconds); 0 is the raw snapshots
+RESOLUTIONS = (
+    (0, 14 * DAY),
+    (HOUR, 120 * DAY),
+    (DAY, 5 * 365 * DAY),
+)
+
+# Range queries pick the finest resolution that returns at most this many points
+MAX_POINTS = 500
+
+NUMBER_RE = re.compile(r"^-?[\d,]*\.?\d+")
+
+
+def parse_value(value) -> float | None:
+    """Extracts the number from an OpsItem value like "12", "$1,234.50" or
+    "3 overdue"; returns None if there isn't one"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = NUMBER_RE.match(str(value or "").strip().lstrip("$"))
+    if m is None:
+        return None
+    return float(m.group(0).replace(",", ""))
+
+
+class OpsHistory(LocalDB):
+    """Time-series store of ops report values"""
+
+    NAME = "ops_history"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS series (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            label TEXT NOT NULL,
+            UNIQUE (category, label)
+        );
+        CREATE TABLE IF NOT EXISTS points (
+            series INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            total REAL NOT NULL,
+            n INTEGER NOT NULL,
+            lo REAL NOT NULL,
+            hi REAL NOT NULL,
+            PRIMARY KEY (series, resolution, ts)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        self._series: dict[tuple[str, str], int] = {}
+
+    def _series_id(self, category, label) -> int:
+        key = (category or "", label or "")
+        sid = self._series.get(key)
+        if sid is None:
+            self.execute(
+                "INSERT OR IGNORE INTO series (category, label) VALUES (?, ?)", key
+            )
+            sid = self.execute(
+                "SELECT id FROM series WHERE category=? AND label=?", key
+            )[0][0]
+            self._series[key] = sid
+        return sid
+
+    def record(self, items, ts: float) -> int:
+        """Records the numeric values of `items` as of the time each was
+        computed (or unix time `ts`, if not known), and returns how many were
+        recorded. Items with errors are skipped."""
+        items = list(items)  # Don't hold the lock while a generator runs
+        rows = []
+        with self.mu:
+            for i in items:
+                v = None if i.error else parse_value(i.value)
+                if v is None:
+                    continue
+                sid = self._series_id(i.category, i.label)
+                t = int(i.computed or ts)
+                for bucket, _ in RESOLUTIONS:
+                    start = t - t % bucket if bucket else t
+                    rows.append((sid, bucket, start, v, 1, v, v))
+            self.executemany(
+                """INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (series, resolution, ts) DO UPDATE SET
+                    total = total + excluded.total,
+                    n = n + excluded.n,
+                    lo = min(lo, excluded.lo),
+                    hi = max(hi, excluded.hi)""",
+                rows,
+            )
+        return len(rows) // len(RESOLUTIONS)
+
+    def prune(self, now: float):
+        """Drops points older than their resolution's retention period"""
+        with self.mu, self.conn:
+            for bucket, retention in RESOLUTIONS:
+                self.conn.execute(
+                    "DELETE FROM points WHERE resolution=? AND ts < ?",
+                    (bucket, int(now - retention)),
+                )
+
+    def series(self) -> list[dict]:
+        """Returns the category and label of every recorded series"""
+        return [
+            {"category": c, "label": l}
+            for c, l in self.execute(
+                "SELECT category, label FROM series ORDER BY category, label"
+            )
+        ]
+
+    def resolution_for(self, start: float, end: float, now: float) -> int:
+        """Returns the finest resolution still retained at `start` that covers
+        the range in at most MAX_POINTS points"""
+        for bucket, retention in RESOLUTIONS:
+            if start < now - retention:
+                continue
+            if (end - start) / (bucket or SNAPSHOT_PD_SEC) <= MAX_POINTS:
+                return bucket
+        return RESOLUTIONS[-1][0]
+
+    def query(  # pylint: disable=too-many-arguments
+        self, category, label, start: float, end: float, now: float | None = None
+    ) -> list[dict]:
+        """Returns the values of a series between unix times `start` and `end`
+        as average, min and max per point, oldest first"""
+        bucket = self.resolution_for(start, end, now or time.time())
+        rows = self.execute(
+            """SELECT p.ts, p.total / p.n, p.lo, p.hi FROM points p
+            JOIN series s ON s.id = p.series
+            WHERE s.category=? AND s.label=? AND p.resolution=?
+                AND p.ts >= ? AND p.ts <= ?
+            ORDER BY p.ts""",
+            (
+                category or "",
+                label or "",
+                bucket,
+                int(start) - int(start) % bucket if bucket else int(start),
+                int(end),
+            ),
+        )
+        return [
+            {"ts": ts, "avg": avg, "min": lo, "max": hi} for ts, avg, lo, hi in rows
+        ]
+
+
+history = OpsHistory()
+
+
+class OpsSnapshotter(WarmDict):
+    """Periodically runs the ops report and records it in `history`. Sections
+    are computed fresh rather than served from the report's cache, so each
+    value is recorded under the time it was computed; this also keeps the
+    cache warm for the staff page."""
+
+    NAME = "ops_history"
+    REFRESH_PD_SEC = SNAPSHOT_PD_SEC
+    RETRY_PD_SEC = datetime.timedelta(minutes=10).total_seconds()
+
+    def refresh(self):
+        now = time.time()
+        n = history.record(ops_report.run(force=True), now)
+        history.prune(now)
+        self.log.info(f"Recorded {n} ops report values")
+
+
+snapshotter = OpsSnapshotter()
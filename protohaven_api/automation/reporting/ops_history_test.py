@@ -0,0 +1,159 @@
+"""Tests for the ops report time-series store"""
+
+import time
+from dataclasses import replace
+
+import pytest
+
+from protohaven_api.automation.reporting import ops_history as h
+from protohaven_api.automation.reporting.ops_report import OpsItem
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.testing import d
+
+T0 = d(0).timestamp() - d(0).timestamp() % h.DAY
+
+
+def _item(label, value, category="Maintenance", error=None):
+    return OpsItem(category=category, label=label, value=value, error=error)
+
+
+@pytest.mark.parametrize(
+    "value,want",
+    [
+        ("12", 12.0),
+        ("$1,234.50", 1234.5),
+        ("3 overdue", 3.0),
+        ("-2", -2.0),
+        (7, 7.0),
+        ("Error", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_value(value, want):
+    """Numbers are pulled out of formatted report values"""
+    assert h.parse_value(value) == want
+
+
+def test_record_and_rollup():
+    """Points are aggregated into hourly and daily buckets"""
+    db = h.OpsHistory(MEMORY)
+    for i, v in enumerate([1, 5, 3]):
+        db.record([_item("Overdue tasks", str(v))], T0 + i * 600)
+    db.record([_item("Overdue tasks", "10")], T0 + 2 * h.HOUR)
+    assert db.series() == [{"category": "Maintenance", "label": "Overdue tasks"}]
+
+    raw = db.query("Maintenance", "Overdue tasks", T0, T0 + h.DAY, now=T0 + h.DAY)
+    assert [p["avg"] for p in raw] == [1, 5, 3, 10]
+
+    hourly = db.execute(
+        "SELECT ts, total / n, lo, hi FROM points WHERE resolution=? ORDER BY ts",
+        (h.HOUR,),
+    )
+    assert hourly == [(T0, 3.0, 1.0, 5.0), (T0 + 2 * h.HOUR, 10.0, 10.0, 10.0)]
+
+    # A range too long for raw points is served from the daily rollup
+    daily = db.query(
+        "Maintenance", "Overdue tasks", T0 - 100 * h.DAY, T0 + h.DAY, now=T0 + h.DAY
+    )
+    assert daily == [{"ts": T0, "avg": 4.75, "min": 1.0, "max": 10.0}]
+
+
+def test_record_skips_errors_and_non_numeric():
+    """Failed sections and text values aren't recorded"""
+    db = h.OpsHistory(MEMORY)
+    n = db.record(
+        [
+            _item("A", "Error", error="timed out"),
+            _item("B", "n/a"),
+            _item("C", "4"),
+        ],
+        T0,
+    )
+    assert n == 1
+    assert db.series() == [{"category": "Maintenance", "label": "C"}]
+
+
+def test_resolution_for():
+    """Queries use the finest resolution that is retained and short enough"""
+    db = h.OpsHistory(MEMORY)
+    now = T0
+    assert db.resolution_for(now - 7 * h.DAY, now, now) == 0
+    assert db.resolution_for(now - 20 * h.DAY, now, now) == h.HOUR
+    assert db.resolution_for(now - 90 * h.DAY, now, now) == h.DAY
+    assert db.resolution_for(now - 1000 * h.DAY, now, now) == h.DAY
+
+
+def test_prune():
+    """Each resolution is dropped after its own retention period"""
+    db = h.OpsHistory(MEMORY)
+    db.record([_item("A", "1")], T0)
+    db.prune(T0 + 30 * h.DAY)
+    assert {r for (r,) in db.execute("SELECT resolution FROM points")} == {
+        h.HOUR,
+        h.DAY,
+    }
+    db.prune(T0 + 200 * h.DAY)
+    assert {r for (r,) in db.execute("SELECT resolution FROM points")} == {h.DAY}
+
+
+def test_snapshotter_refresh(mocker):
+    """A snapshot records a fresh ops report, at each value's compute time"""
+    mocker.patch.object(h, "history", h.OpsHistory(MEMORY))
+    mocker.patch.object(h.time, "time", return_value=T0 + h.HOUR)
+    run = mocker.patch.object(
+        h.ops_report,
+        "run",
+        return_value=iter([replace(_item("A", "2"), computed=T0), _item("B", "3")]),
+    )
+    h.OpsSnapshotter().refresh()
+    run.assert_called_once_with(force=True)
+    assert len(h.history.series()) == 2
+    assert h.history.query("Maintenance", "A", T0, T0 + h.DAY, now=T0)[0]["ts"] == T0
+    assert (
+        h.history.query("Maintenance", "B", T0, T0 + h.DAY, now=T0)[0]["ts"]
+        == T0 + h.HOUR
+    )
+
+
+def _simulate_year(db, n_series):
+    items = [_item(f"Metric {i}", str(i)) for i in range(n_series)]
+    start = T0 - 365 * h.DAY
+    for hour in range(365 * 24):
+        now = start + hour * h.HOUR
+        for i, it in enumerate(items):
+            it.value = str((hour + i) % 50)
+        db.record(items, now)
+        if hour % 24 == 0:
+            db.prune(now)
+    db.prune(T0)
+
+
+@pytest.mark.benchmark
+def test_ops_history_benchmark():
+    """Writes a year of hourly snapshots, then times trend chart queries"""
+    n_series = 10
+    db = h.OpsHistory(MEMORY)
+    start = time.perf_counter()
+    _simulate_year(db, n_series)
+    write_sec = time.perf_counter() - start
+    snapshots = 365 * 24
+
+    got = {}
+    for days in (1, 7, 30, 90, 365):
+        start = time.perf_counter()
+        for i in range(n_series):
+            pts = db.query("Maintenance", f"Metric {i}", T0 - days * h.DAY, T0, now=T0)
+        got[days] = ((time.perf_counter() - start) / n_series, len(pts))
+
+    print(
+        f"Wrote {snapshots} snapshots of {n_series} values in {write_sec:.2f}s "
+        f"({write_sec / snapshots * 1e6:.0f}us per snapshot)"
+    )
+    for days, (sec, npts) in got.items():
+        print(f"  {days}d range: {npts} points in {sec * 1000:.2f}ms")
+    (rows,) = db.execute("SELECT COUNT(*) FROM points")[0]
+    print(f"  {rows} rows retained")
+
+    for days, (sec, npts) in got.items():
+        assert 0 < npts <= h.MAX_POINTS
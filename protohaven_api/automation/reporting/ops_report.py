@@ -3,9 +3,11 @@ on the operational state of the shop."""
 
 import datetime
 import logging
+import threading
+import time
 import traceback
 from concurrent import futures
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, replace
 from typing import Callable, Iterator
 
 from protohaven_api.automation.techs import techs as tauto
@@ -41,6 +43,9 @@ class OpsItem:  # pylint: disable=too-many-instance-attributes
     index: int = 0
     total: int = 0
 
+    # Unix time at which the value was computed
+    computed: float = None
+
 
 def _handle_exc(e, labels):
     traceback.print_exc()
@@ -68,6 +73,7 @@ def opsitem(**defaults):
                 result.append(OpsItem(**vals))
             return result
 
+        wrapper.defaults = defaults  # type: ignore[attr-defined]
         return wrapper
 
     return decorator
@@ -709,42 +715,179 @@ def get_wiki_docs_status() -> list[OpsItem]:
         )
 
 
-def run() -> Iterator[OpsItem]:
-    """Runs all subsections of the report concurrently and returns results as they arrive"""
-    not_done = set()
-    with futures.ThreadPoolExecutor() as executor:
-        for fn in [
-            get_asana_assets,
-            get_asana_instructor_apps,
-            get_asana_purchase_requests,
-            get_asana_tech_apps,
-            get_asana_maint_tasks,
-            get_asana_proposals,
-            get_ops_manager_sheet_budget,
-            get_ops_manager_sheet_events,
-            get_ops_manager_sheet_inventory,
-            get_airtable_tool_info,
+MINUTE = 60.0
+DEFAULT_TIMEOUT_SEC = 60.0
+
+
+@dataclass(frozen=True)
+class Section:
+    """A subsection of the report. Its results are reused for `ttl_sec`, and
+    it is reported as timed out if it takes longer than `timeout_sec`."""
+
+    name: str
+    fn: Callable[[], list[OpsItem]]
+    ttl_sec: float
+    timeout_sec: float = DEFAULT_TIMEOUT_SEC
+
+    def placeholder(self, value, error) -> list[OpsItem]:
+        """Stand-in results for a section that failed or didn't finish"""
+        return [
+            OpsItem(
+                **getattr(self.fn, "defaults", {}),
+                label=self.name,
+                value=value,
+                error=error,
+            )
+        ]
+
+
+def sections() -> list[Section]:
+    """All subsections of the report"""
+    return [
+        Section("Asana assets", get_asana_assets, 15 * MINUTE),
+        Section("Asana instructor apps", get_asana_instructor_apps, 15 * MINUTE),
+        Section("Asana purchase requests", get_asana_purchase_requests, 15 * MINUTE),
+        Section("Asana tech apps", get_asana_tech_apps, 15 * MINUTE),
+        Section("Asana maintenance", get_asana_maint_tasks, 15 * MINUTE),
+        Section("Asana proposals", get_asana_proposals, 15 * MINUTE),
+        Section("Ops budget", get_ops_manager_sheet_budget, 30 * MINUTE),
+        Section("Ops events", get_ops_manager_sheet_events, 30 * MINUTE),
+        Section("Ops inventory", get_ops_manager_sheet_inventory, 30 * MINUTE),
+        Section("Tool info", get_airtable_tool_info, 10 * MINUTE),
+        Section(
+            "Instructor capabilities",
             get_airtable_instructor_capabilities,
-            get_airtable_violations,
+            10 * MINUTE,
+            timeout_sec=2 * MINUTE,
+        ),
+        Section("Violations", get_airtable_violations, 5 * MINUTE),
+        Section(
+            "Tech/instructor onboarding",
             get_neon_tech_instructor_onboarding,
-            get_shift_schedule,
-            get_wiki_docs_status,
-        ]:
-            not_done.add(executor.submit(fn))
-
-    total = len(not_done)
-    while True:
-        done, not_done = futures.wait(not_done, return_when=futures.FIRST_COMPLETED)
-        log.info(f"{len(done)} more reports completed, {len(not_done)} to go")
-        for d in done:
-            result = d.result()
-            log.info(f"result: {result}")
-            for r in result:  # Convert any Exception into strings for serialization
-                if r.error:
-                    r.error = str(r.error)[:256]
-                r.total = total
-                r.index = total - len(not_done)
-                yield r
-
-        if len(not_done) <= 0:
-            break
+            60 * MINUTE,
+            timeout_sec=3 * MINUTE,
+        ),
+        Section("Shift schedule", get_shift_schedule, 30 * MINUTE),
+        Section("Wiki docs", get_wiki_docs_status, 60 * MINUTE),
+    ]
+
+
+class ReportCache:
+    """Results of each report section, computed on a shared pool of threads.
+
+    A section is computed at most once at a time; callers wanting it while
+    it's in progress share the same future. Results with errors are not
+    cached, so the next run tries again.
+    """
+
+    def __init__(self, max_workers=16):
+        self.mu = threading.Lock()
+        self.results: dict[str, tuple[float, list[OpsItem]]] = {}
+        self.inflight: dict[str, futures.Future] = {}
+        self.executor = futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="ops_report"
+        )
+
+    def get(self, s: Section, now: float) -> tuple[list[OpsItem] | None, bool]:
+        """Returns cached results for `s` (or None) and whether they're fresh"""
+        with self.mu:
+            cached = self.results.get(s.name)
+        if cached is None:
+            return None, False
+        return cached[1], now - cached[0] < s.ttl_sec
+
+    def refresh(self, s: Section) -> futures.Future:
+        """Starts computing `s`, unless it's already being computed"""
+        with self.mu:
+            f = self.inflight.get(s.name)
+            if f is None:
+                f = self.executor.submit(self._compute, s)
+                self.inflight[s.name] = f
+            return f
+
+    def _compute(self, s: Section) -> list[OpsItem]:
+        try:
+            start = time.monotonic()
+            result = s.fn()
+            computed = time.time()
+            result = [replace(r, computed=computed) for r in result]
+            log.info(f"{s.name} computed in {time.monotonic() - start:.1f}s")
+            if not any(r.error for r in result):
+                with self.mu:
+                    self.results[s.name] = (time.monotonic(), result)
+            return result
+        finally:
+            with self.mu:
+                del self.inflight[s.name]
+
+
+cache = ReportCache()
+
+
+def run(force=False) -> Iterator[OpsItem]:
+    """Runs all subsections of the report concurrently, yielding each
+    section's results as soon as they're ready.
+
+    Sections with cached results are yielded immediately; stale ones are then
+    recomputed in the background for next time. If `force` is set, the cache
+    is bypassed and every section is computed fresh (and then cached).
+    Sections that don't finish within their timeout are reported as such and
+    left to finish (and be cached) in the background.
+    """
+    ss = sections()
+    total = len(ss)
+    n = 0
+
+    def _emit(result):
+        nonlocal n
+        n += 1
+        for r in result:  # Convert any Exception into strings for serialization
+            yield replace(
+                r,
+                error=str(r.error)[:256] if r.error else r.error,
+                total=total,
+                index=n,
+            )
+
+    now = time.monotonic()
+    pending: dict[futures.Future, Section] = {}
+    deadlines: dict[futures.Future, float] = {}
+    for s in ss:
+        cached, fresh = (None, False) if force else cache.get(s, now)
+        if cached is not None:
+            yield from _emit(cached)
+            if not fresh:
+                log.info(f"{s.name} is stale; refreshing in background")
+                cache.refresh(s)
+            continue
+        f = cache.refresh(s)
+        pending[f] = s
+        deadlines[f] = now + s.timeout_sec
+    log.info(f"{n} report sections served from cache, {len(pending)} to compute")
+
+    while pending:
+        done, _ = futures.wait(
+            pending,
+            timeout=max(0, min(deadlines.values()) - time.monotonic()),
+            return_when=futures.FIRST_COMPLETED,
+        )
+        for f in done:
+            s = pending.pop(f)
+            del deadlines[f]
+            e = f.exception()
+            if e:
+                log.error(f"{s.name} failed: {e}")
+                yield from _emit(s.placeholder("Error", e))
+            else:
+                yield from _emit(f.result())
+        now = time.monotonic()
+        for f in [f for f, t in deadlines.items() if t <= now]:
+            s = pending.pop(f)
+            del deadlines[f]
+            log.warning(f"{s.name} timed out after {s.timeout_sec}s")
+            yield from _emit(
+                s.placeholder(
+                    "Timed out", f"{s.name} did not finish within {s.timeout_sec}s"
+                )
+            )
+        log.info(f"{n} report sections done, {len(pending)} to go")
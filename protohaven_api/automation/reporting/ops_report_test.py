@@ -1,11 +1,21 @@
 """Unit tests for ops_report module"""
 
 import datetime
+import threading
+import time
+
+import pytest
 
 from protohaven_api.automation.reporting import ops_report
 from protohaven_api.testing import d
 
 
+@pytest.fixture(autouse=True)
+def fixture_cache(mocker):
+    """Each test starts with no cached report sections"""
+    return mocker.patch.object(ops_report, "cache", ops_report.ReportCache())
+
+
 def test_opsitem_decorator_applies_defaults():
     """Test that opsitem decorator applies default values"""
 
@@ -583,3 +593,150 @@ def test_run_concurrent_execution(mocker):
     for result in results:
         if result.error:
             assert len(result.error) <= 256
+
+
+def _section(  # pylint: disable=too-many-arguments
+    name, value, *, ttl_sec=60, timeout_sec=5, wait=None, calls=None
+):
+    def fn():
+        if calls is not None:
+            calls.append(name)
+        if wait is not None:
+            assert wait.wait(5)
+        return [ops_report.OpsItem(label=name, value=value)]
+
+    return ops_report.Section(name, fn, ttl_sec, timeout_sec)
+
+
+def test_run_streams_sections_as_they_finish(mocker):
+    """A fast section is yielded while a slow one is still running"""
+    slow_done = threading.Event()
+    mocker.patch.object(
+        ops_report,
+        "sections",
+        return_value=[
+            _section("slow", "1", wait=slow_done),
+            _section("fast", "2"),
+        ],
+    )
+    it = ops_report.run()
+    first = next(it)
+    assert (first.label, first.index, first.total) == ("fast", 1, 2)
+    slow_done.set()
+    second = next(it)
+    assert (second.label, second.index, second.total) == ("slow", 2, 2)
+    assert not list(it)
+
+
+def test_run_section_timeout(mocker):
+    """A section exceeding its timeout is reported as timed out, and its
+    result is cached for the next run once it finishes"""
+    release = threading.Event()
+    mocker.patch.object(
+        ops_report,
+        "sections",
+        return_value=[
+            _section("hung", "1", timeout_sec=0.05, wait=release),
+            _section("ok", "2"),
+        ],
+    )
+    got = {i.label: i for i in ops_report.run()}
+    assert got["hung"].value == "Timed out"
+    assert "did not finish" in got["hung"].error
+    assert got["ok"].value == "2"
+
+    release.set()
+    ops_report.cache.inflight.get("hung", mocker.Mock()).result()
+    assert {i.label: i.value for i in ops_report.run()} == {"hung": "1", "ok": "2"}
+
+
+def test_run_section_exception(mocker):
+    """A section raising is reported as an error without failing the run"""
+
+    def boom():
+        raise RuntimeError("x")
+
+    mocker.patch.object(
+        ops_report, "sections", return_value=[ops_report.Section("boom", boom, 60)]
+    )
+    (got,) = list(ops_report.run())
+    assert (got.label, got.value, got.error) == ("boom", "Error", "x")
+
+
+def test_run_serves_cache_and_refreshes_stale(mocker):
+    """Fresh results are served without recomputing; stale ones are served
+    immediately and recomputed in the background"""
+    calls = []
+    mocker.patch.object(
+        ops_report,
+        "sections",
+        return_value=[
+            _section("short", "1", ttl_sec=10, calls=calls),
+            _section("long", "2", ttl_sec=1000, calls=calls),
+        ],
+    )
+    list(ops_report.run())
+    assert sorted(calls) == ["long", "short"]
+    list(ops_report.run())
+    assert len(calls) == 2
+
+    mocker.patch.object(
+        ops_report.time, "monotonic", return_value=time.monotonic() + 100
+    )
+    got = [(i.label, i.value) for i in ops_report.run()]
+    assert got == [("short", "1"), ("long", "2")]
+    ops_report.cache.inflight.get("short", mocker.Mock()).result()
+    assert sorted(calls) == ["long", "short", "short"]
+
+
+def test_run_force_bypasses_cache(mocker):
+    """A forced run recomputes fresh sections, stamping when each was
+    computed"""
+    calls = []
+    mocker.patch.object(
+        ops_report,
+        "sections",
+        return_value=[_section("a", "1", ttl_sec=1000, calls=calls)],
+    )
+    (first,) = list(ops_report.run())
+    (cached,) = list(ops_report.run())
+    assert cached.computed == first.computed
+    mocker.patch.object(ops_report.time, "time", return_value=first.computed + 3600)
+    (forced,) = list(ops_report.run(force=True))
+    assert calls == ["a", "a"]
+    assert forced.computed == first.computed + 3600
+
+
+def test_run_failed_sections_not_cached(mocker):
+    """Sections reporting errors are recomputed on the next run"""
+    fn = mocker.Mock(return_value=[ops_report.OpsItem(label="a", error="bad")])
+    mocker.patch.object(
+        ops_report, "sections", return_value=[ops_report.Section("a", fn, 60)]
+    )
+    list(ops_report.run())
+    list(ops_report.run())
+    assert fn.call_count == 2
+
+
+def test_run_concurrent_requests_share_computation(mocker):
+    """Two page loads while a section is computing only compute it once"""
+    calls = []
+    release = threading.Event()
+    mocker.patch.object(
+        ops_report,
+        "sections",
+        return_value=[_section("a", "1", wait=release, calls=calls)],
+    )
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(list(ops_report.run())))
+        for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == ["a"]
+    assert [[i.value for i in r] for r in results] == [["1"], ["1"]]
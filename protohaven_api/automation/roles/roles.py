@@ -1,12 +1,14 @@
 """Commands related operations on Dicsord"""
 
 import datetime
+import json
 import logging
 from dataclasses import asdict, dataclass, replace
 
 from protohaven_api.config import safe_parse_datetime, tznow
 from protohaven_api.integrations import airtable, comms, neon, neon_base
 from protohaven_api.integrations.comms import Msg
+from protohaven_api.integrations.data.local_db import LocalDB
 from protohaven_api.integrations.models import Member, Role
 
 log = logging.getLogger("role_automation.roles")
@@ -154,6 +156,105 @@ def singleton_role_sync(neon_member, neon_roles, discord_roles):
             yield "ADD", to_add, "indicated by Neon CRM"
 
 
+class RoleSyncState(LocalDB):
+    """Discord members as of the last role sync, kept current from the bot's
+    member cache (see `comms.get_member_changes`) rather than re-fetched.
+
+    Also remembers which members needed no role changes, along with the
+    Discord and Neon state that was checked. Members whose state hasn't
+    changed since are skipped by the next sync, including syncs run by
+    later CLI invocations.
+    """
+
+    NAME = "role_sync"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS members (
+            discord_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS in_sync (
+            discord_id TEXT PRIMARY KEY,
+            checked TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS cursor (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            cursor TEXT
+        );
+    """
+
+    def cursor(self):
+        """Returns the member cache cursor as of the last refresh"""
+        rows = self.execute("SELECT cursor FROM cursor")
+        return json.loads(rows[0][0]) if rows else None
+
+    def members(self) -> list[tuple]:
+        """Returns all members as of the last refresh"""
+        result = []
+        for discord_id, data in self.execute("SELECT discord_id, data FROM members"):
+            nickname, joined_at, roles = json.loads(data)
+            result.append(
+                (
+                    discord_id,
+                    nickname,
+                    joined_at and datetime.datetime.fromisoformat(joined_at),
+                    [tuple(r) for r in roles],
+                )
+            )
+        return result
+
+    def refresh(self):
+        """Applies Discord member changes since the last refresh, and returns
+        all members"""
+        rep = comms.get_member_changes(self.cursor())
+        rows = [
+            (m[0], json.dumps([m[1], m[2] and m[2].isoformat(), m[3]]))
+            for m in rep["members"]
+        ]
+        with self.mu, self.conn:
+            if rep["full"]:
+                self.conn.execute("DELETE FROM members")
+            else:
+                self.conn.executemany(
+                    "DELETE FROM members WHERE discord_id=?",
+                    [(n,) for n in rep["removed"]],
+                )
+            self.conn.executemany("INSERT OR REPLACE INTO members VALUES (?, ?)", rows)
+            self.conn.execute(
+                "DELETE FROM in_sync WHERE discord_id NOT IN "
+                "(SELECT discord_id FROM members)"
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursor VALUES (0, ?)",
+                (json.dumps(rep["cursor"]),),
+            )
+        members = self.members()
+        log.info(
+            f"{'Loaded' if rep['full'] else 'Applied'} {len(rep['members'])} "
+            f"Discord member changes; {len(members)} total"
+        )
+        return members
+
+    def in_sync(self) -> dict[str, str]:
+        """Returns the checked state of members that needed no changes"""
+        return dict(self.execute("SELECT discord_id, checked FROM in_sync"))
+
+    def update_in_sync(self, checked: dict[str, str | None]):
+        """Records the checked state of members that needed no changes, or
+        forgets members (mapped to None) that did"""
+        with self.mu, self.conn:
+            self.conn.executemany(
+                "DELETE FROM in_sync WHERE discord_id=?",
+                [(k,) for k, v in checked.items() if v is None],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO in_sync VALUES (?, ?)",
+                [(k, v) for k, v in checked.items() if v is not None],
+            )
+
+
+sync_state = RoleSyncState()
+
+
 def recently_inactive(m: Member, grace_period_days=2):
     """Return True if the member only recently became inactive, false
     if active or "solidly" inactive.
@@ -197,51 +298,88 @@ def gen_role_intents(  # pylint: disable=too-many-statements
     log.info(f"Got {len(state)} total Neon members (with Discord association)")
     log.debug(f"Discord users: {', '.join(state.keys())}")
 
-    # Here we sort members by join date to have predictable behavior when constrained by
-    # max_user_intents. New members joining the server will be affected last.
-    # Note that in certain cases, joined_at can be None
-    # (see https://discordpy.readthedocs.io/en/stable/api.html#discord.Member.joined_at)
     log.info("Fetch Discord members")
-    discord_members = list(comms.get_all_members())
-    log.info(f"Got {len(discord_members)}; example {discord_members[0]}")
-    discord_members.sort(key=lambda m: m[2])
-    additions: set[str] = set()  # for early cutoff on `max_users_added`
-    revocations: set[str] = set()  # for early cutoff on `max_users_removed`
+    discord_members = sync_state.refresh()
+    in_sync = sync_state.in_sync()
 
     if user_filter is not None:
         log.warning(f"Filtering to provided user list: {user_filter}")
     if exclude_users is not None:
         log.warning(f"Ignoring excluded users: {exclude_users}")
-    for discord_id, nickname, _, assigned_roles in discord_members:
+    pending = []
+    for discord_id, nickname, joined_at, assigned_roles in discord_members:
         if exclude_users and discord_id in exclude_users:
             log.debug(f"Skipping {discord_id} (excluded)")
             continue  # Don't enforce ourselves
         if user_filter and discord_id not in user_filter:
             log.debug(f"Skipping {discord_id} (not in filter)")
             continue
-        intent = DiscordIntent(discord_id=discord_id, discord_nick=nickname)
-        neon_roleset = set()
-        neon_member = "NOT_FOUND"
         m = state.get(discord_id)
+        neon_member = "NOT_FOUND"
+        neon_roleset = set()
         if m:
-            intent.neon_id = m.neon_id
-            intent.name = f"{m.fname} {m.lname}"
-            intent.email = m.email
             neon_member = (m.account_current_membership_status or "NOT_FOUND").upper()
             neon_roleset = {
                 rev_roles.get(r["name"])
                 for r in (m.roles or [])
                 if r["name"] in rev_roles
             }
-
         discord_roleset = {r for r, _ in assigned_roles if r in SYNC_ROLES}
+        checked = json.dumps(
+            [neon_member, sorted(neon_roleset), sorted(discord_roleset)]
+        )
+        if in_sync.get(discord_id) == checked:
+            continue  # Nothing to do last time, and nothing has changed
+        pending.append(
+            (
+                discord_id,
+                nickname,
+                joined_at,
+                m,
+                neon_member,
+                neon_roleset,
+                discord_roleset,
+                checked,
+            )
+        )
+    log.info(
+        f"Checking {len(pending)} of {len(discord_members)} Discord members; "
+        "the rest are unchanged since they were last in sync"
+    )
+
+    # Here we sort members by join date to have predictable behavior when constrained by
+    # max_user_intents. New members joining the server will be affected last.
+    # Note that in certain cases, joined_at can be None
+    # (see https://discordpy.readthedocs.io/en/stable/api.html#discord.Member.joined_at)
+    pending.sort(key=lambda p: p[2])
+    additions: set[str] = set()  # for early cutoff on `max_users_added`
+    revocations: set[str] = set()  # for early cutoff on `max_users_removed`
+    checks: dict[str, str | None] = {}
+
+    for (
+        discord_id,
+        nickname,
+        _,
+        m,
+        neon_member,
+        neon_roleset,
+        discord_roleset,
+        checked,
+    ) in pending:
+        intent = DiscordIntent(discord_id=discord_id, discord_nick=nickname)
+        if m:
+            intent.neon_id = m.neon_id
+            intent.name = f"{m.fname} {m.lname}"
+            intent.email = m.email
         log.debug(
             f"Syncing roles for #{intent.neon_id} {intent.name} @{discord_id}: "
             f"membership={neon_member} neon_roles={neon_roleset} discord_roles={discord_roleset}"
         )
-        for action, role, reason in singleton_role_sync(
-            neon_member, neon_roleset, discord_roleset
-        ):
+        actions = list(singleton_role_sync(neon_member, neon_roleset, discord_roleset))
+        checks[discord_id] = None if actions else checked
+        if not actions:
+            continue
+        for action, role, reason in actions:
             if action == "REVOKE":
                 if not destructive:
                     log.debug(
@@ -274,6 +412,7 @@ def gen_role_intents(  # pylint: disable=too-many-statements
                 additions.add(discord_id)
 
             yield replace(intent, action=action, role=role, reason=reason)
+    sync_state.update_in_sync(checks)
 
 
 def handle_delayed_revocation(
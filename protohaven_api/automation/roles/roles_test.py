@@ -1,16 +1,30 @@
 # pylint: skip-file
 """Tests for role_automation functions"""
+import time
 from collections import namedtuple
 from dataclasses import replace
+from types import SimpleNamespace
 
 import pytest
 
 from protohaven_api.automation.roles import roles as r
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.integrations.discord_bot import MemberIndex
 from protohaven_api.testing import d, idfn
 
 Tc = namedtuple("tc", "desc,neon_member,neon_roles,discord_roles,want")
 
 
+@pytest.fixture(autouse=True)
+def fixture_sync_state(mocker):
+    """Each test starts without any Discord members synced"""
+    return mocker.patch.object(r, "sync_state", r.RoleSyncState(MEMORY))
+
+
+def _full(members):
+    return {"cursor": (1, 0), "full": True, "members": members, "removed": []}
+
+
 @pytest.mark.parametrize(
     "tc",
     [
@@ -113,7 +127,7 @@ def test_gen_role_intents_limited_and_sorted(mocker):
     # Return lots of unique users that incorrectly have the Shop Tech role.
     usrs = [(f"id{i}", f"nick{i}", d(-i), [("Techs", 1234567890)]) for i in range(100)]
     assert usrs[0][0] == "id0"  # Youngest user first
-    mocker.patch.object(r.comms, "get_all_members", return_value=usrs)
+    mocker.patch.object(r.comms, "get_member_changes", return_value=_full(usrs))
     got = list(r.gen_role_intents(None, None, True, 20, 20))
     assert len(got) == 20  # Cutoff at the passed max
     assert got[0].discord_id == "id99"  # Oldest user is acted upon first
@@ -147,15 +161,17 @@ def test_gen_role_intents_departing_member(mocker):
     )
     mocker.patch.object(
         r.comms,
-        "get_all_members",
-        return_value=[
-            (
-                "discord_id",
-                "nickname",
-                d(0),
-                [("Members", "memid"), ("Techs", "techid")],
-            ),
-        ],
+        "get_member_changes",
+        return_value=_full(
+            [
+                (
+                    "discord_id",
+                    "nickname",
+                    d(0),
+                    [("Members", "memid"), ("Techs", "techid")],
+                ),
+            ]
+        ),
     )
     assert list(r.gen_role_intents(None, None, True, 10, 10)) == [
         r.DiscordIntent(
@@ -193,10 +209,12 @@ def test_gen_role_intents_match(mocker):
     )
     mocker.patch.object(
         r.comms,
-        "get_all_members",
-        return_value=[
-            ("discord_id", "nickname", d(0), [("Techs", "techid")]),
-        ],
+        "get_member_changes",
+        return_value=_full(
+            [
+                ("discord_id", "nickname", d(0), [("Techs", "techid")]),
+            ]
+        ),
     )
     got = list(r.gen_role_intents(None, None, True, 10, 10))
     want_base = r.DiscordIntent(
@@ -230,10 +248,12 @@ def test_gen_role_intents_no_neon(mocker):
     )
     mocker.patch.object(
         r.comms,
-        "get_all_members",
-        return_value=[
-            ("discord_id", "nickname", d(0), [("Techs", "techid")]),
-        ],
+        "get_member_changes",
+        return_value=_full(
+            [
+                ("discord_id", "nickname", d(0), [("Techs", "techid")]),
+            ]
+        ),
     )
     got = list(r.gen_role_intents(None, None, True, 10, 10))
     assert got == [
@@ -247,6 +267,141 @@ def test_gen_role_intents_no_neon(mocker):
     ]
 
 
+def _guild(n):
+    """Synthetic guild of `n` members who all have the Members role, and
+    matching active Neon accounts"""
+    roles = {"Members": SimpleNamespace(id=1, name="Members")}
+    roles["Techs"] = SimpleNamespace(id=2, name="Techs")
+    members = [
+        SimpleNamespace(
+            id=i,
+            name=f"user{i}",
+            display_name=f"User {i}",
+            joined_at=d(-i),
+            roles=[roles["Members"]],
+        )
+        for i in range(n)
+    ]
+    neon = [
+        SimpleNamespace(
+            neon_id=i,
+            fname="User",
+            lname=str(i),
+            email=f"user{i}@example.com",
+            account_current_membership_status="Active",
+            discord_user=f"user{i}",
+            roles=[],
+        )
+        for i in range(n)
+    ]
+    return roles, members, neon
+
+
+def _wire(mocker, idx, neon):
+    mocker.patch.object(
+        r.neon, "search_members_with_discord_association", return_value=neon
+    )
+    mocker.patch.object(r.comms, "get_member_changes", side_effect=idx.changes_since)
+
+
+def test_gen_role_intents_incremental(mocker):
+    """Members found in sync are skipped until their Discord or Neon state
+    changes"""
+    roles, members, neon = _guild(5)
+    idx = MemberIndex()
+    idx.load(members, roles.values())
+    _wire(mocker, idx, neon)
+    spy = mocker.spy(r, "singleton_role_sync")
+    assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    assert spy.call_count == 5
+    assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    assert spy.call_count == 5
+
+    # Gateway event: user1 was given the Techs role
+    members[1].roles.append(roles["Techs"])
+    idx.upsert_member(members[1])
+    # Neon change: user3's membership lapsed
+    neon[3].account_current_membership_status = "Inactive"
+    mocker.patch.object(r, "recently_inactive", return_value=False)
+    got = list(r.gen_role_intents(None, None, True, 10, 10))
+    assert spy.call_count == 7
+    assert [(i.discord_id, i.action, i.role) for i in got] == [
+        ("user1", "REVOKE", "Techs")
+    ]
+
+    # Members with pending actions are checked every time
+    assert len(list(r.gen_role_intents(None, None, True, 10, 10))) == 1
+    assert spy.call_count == 8
+
+    # Departed members are dropped
+    idx.remove_member(members[1])
+    assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    assert spy.call_count == 8
+    assert "user1" not in [m[0] for m in r.sync_state.members()]
+
+
+def test_gen_role_intents_in_sync_persists(mocker, tmp_path):
+    """A later process, with a freshly loaded member cache, still skips
+    members that were in sync when the last one ran"""
+    path = str(tmp_path / "role_sync.sqlite3")
+    roles, members, neon = _guild(5)
+    idx = MemberIndex()
+    idx.load(members, roles.values())
+    _wire(mocker, idx, neon)
+    mocker.patch.object(r, "sync_state", r.RoleSyncState(path))
+    assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    r.sync_state.close()
+
+    # New process: new member cache and state store, same database file
+    idx = MemberIndex()
+    members[2].roles.append(roles["Techs"])
+    idx.load(members, roles.values())
+    _wire(mocker, idx, neon)
+    mocker.patch.object(r, "sync_state", r.RoleSyncState(path))
+    spy = mocker.spy(r, "singleton_role_sync")
+    got = list(r.gen_role_intents(None, None, True, 10, 10))
+    assert [(i.discord_id, i.action, i.role) for i in got] == [
+        ("user2", "REVOKE", "Techs")
+    ]
+    assert spy.call_count == 1
+    assert r.sync_state.cursor()[0] == idx.session
+
+
+@pytest.mark.benchmark
+def test_gen_role_intents_benchmark(mocker):
+    """Role intent generation over 10k guild members: full re-evaluation
+    each run vs. applying only gateway changes"""
+    n, changed = 10000, 20
+    roles, members, neon = _guild(n)
+    idx = MemberIndex()
+    idx.load(members, roles.values())
+    _wire(mocker, idx, neon)
+
+    # Previous behavior: all members are fetched and checked every run
+    start = time.perf_counter()
+    for _ in range(3):
+        mocker.patch.object(r, "sync_state", r.RoleSyncState(MEMORY))
+        assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    full_sec = (time.perf_counter() - start) / 3
+
+    mocker.patch.object(r, "sync_state", r.RoleSyncState(MEMORY))
+    list(r.gen_role_intents(None, None, True, 10, 10))
+    spy = mocker.spy(r, "singleton_role_sync")
+    start = time.perf_counter()
+    for run in range(3):
+        for m in members[run * changed : (run + 1) * changed]:
+            m.display_name += " (renamed)"
+            idx.upsert_member(m)
+        assert not list(r.gen_role_intents(None, None, True, 10, 10))
+    incr_sec = (time.perf_counter() - start) / 3
+
+    print(
+        f"Role intents over {n} members: full {full_sec*1000:.1f}ms/run, "
+        f"incremental ({changed} changed) {incr_sec*1000:.1f}ms/run"
+    )
+    assert spy.call_count == 0  # Renames don't change roles
+
+
 def test_sync_delayed_intents_toggling_apply(mocker):
     """Setting apply_records to False prevents comms and does not
     call airtable; setting to True does"""
@@ -0,0 +1,218 @@
+"""Fan-out of server-side events (e.g. MQTT messages) to websocket clients.
+
+Each websocket connection gets its own bounded outbound queue and writer
+thread, so a slow or half-dead browser only ever delays itself. Publishing
+never blocks on a websocket write.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+log = logging.getLogger("broadcast")
+
+
+class Policy:  # pylint: disable=too-few-public-methods
+    """What a connection does with a new message when its queue is full"""
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+
+class Connection:  # pylint: disable=too-many-instance-attributes
+    """A single websocket subscriber.
+
+    All writes to the websocket go through this connection's queue (including
+    those made by the handler itself), so the websocket is only ever written
+    from one thread.
+
+    If `coalesce_key` is given, a new message whose key is not None replaces
+    any pending message with the same key instead of queueing behind it - handy
+    for periodic state where only the latest value matters.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        ws,
+        *,
+        name="",
+        maxsize=64,
+        policy=Policy.DROP_OLDEST,
+        coalesce_key: Callable[[dict], Any] | None = None,
+        on_close: Callable[["Connection"], None] | None = None,
+    ):
+        self.ws = ws
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce_key = coalesce_key
+        self.on_close = on_close
+        self.cv = threading.Condition()
+        self.pending: deque[tuple[float, Any, dict]] = deque()
+        self.closed = False
+        self.inflight = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_lag_sec = 0.0
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def send(self, msg: dict) -> bool:
+        """Queues a message without blocking. Returns False if it was not
+        queued (connection closed, or queue full under DROP_NEWEST)."""
+        key = self.coalesce_key(msg) if self.coalesce_key else None
+        with self.cv:
+            if self.closed:
+                return False
+            if key is not None:
+                for i, (enqueued, k, _) in enumerate(self.pending):
+                    if k == key:
+                        self.pending[i] = (enqueued, key, msg)
+                        self.coalesced += 1
+                        return True
+            if len(self.pending) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == Policy.DROP_NEWEST:
+                    return False
+                self.pending.popleft()
+            self.pending.append((time.monotonic(), key, msg))
+            self.cv.notify_all()
+        return True
+
+    def lag_sec(self) -> float:
+        """Age of the oldest message not yet written to the websocket"""
+        with self.cv:
+            if not self.pending:
+                return 0.0
+            return time.monotonic() - self.pending[0][0]
+
+    def close(self, drain_sec=0.0):
+        """Stops the writer. Pending messages are discarded, after waiting up
+        to `drain_sec` for them to be written."""
+        with self.cv:
+            deadline = time.monotonic() + drain_sec
+            while (self.pending or self.inflight) and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cv.wait(remaining)
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.clear()
+            self.cv.notify_all()
+        if self.on_close:
+            self.on_close(self)
+
+    def _write_loop(self):
+        while True:
+            with self.cv:
+                while not self.pending and not self.closed:
+                    self.cv.wait()
+                if self.closed:
+                    return
+                enqueued, _, msg = self.pending.popleft()
+                self.inflight = True
+            self.max_lag_sec = max(self.max_lag_sec, time.monotonic() - enqueued)
+            try:
+                self.ws.send(json.dumps(msg))
+                self.sent += 1
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log.info(f"Websocket {self.name} send failed, closing: {e}")
+                with self.cv:
+                    self.inflight = False
+                self.close()
+                return
+            with self.cv:
+                self.inflight = False
+                self.cv.notify_all()  # Wake any draining close()
+
+    def metrics(self) -> dict:
+        """Reports queue state and lag for this connection"""
+        with self.cv:
+            pending = len(self.pending)
+        return {
+            "name": self.name,
+            "pending": pending,
+            "lag_sec": round(self.lag_sec(), 3),
+            "max_lag_sec": round(self.max_lag_sec, 3),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class Broadcaster:
+    """Delivers published messages to every attached connection.
+
+    `on_first` and `on_last` are called when the first connection attaches
+    and the last one detaches, e.g. to subscribe to and unsubscribe from the
+    upstream source only while someone is listening. They run under
+    `sub_mu`, so an attach racing a detach (e.g. a page reload) can't run
+    `on_first` before the detach's `on_last` has finished.
+    """
+
+    def __init__(self, name, on_first=None, on_last=None):
+        self.name = name
+        self.on_first = on_first
+        self.on_last = on_last
+        self.sub_mu = threading.Lock()  # Held across on_first/on_last
+        self.mu = threading.Lock()
+        self.connections: list[Connection] = []
+        BROADCASTERS[name] = self
+
+    def connect(self, ws, **kwargs) -> Connection:
+        """Attaches a websocket; kwargs are passed to Connection"""
+        conn = Connection(ws, on_close=self._detach, **kwargs)
+        with self.sub_mu:
+            with self.mu:
+                self.connections.append(conn)
+                first = len(self.connections) == 1
+            if first and self.on_first:
+                self.on_first()
+        return conn
+
+    def _detach(self, conn: Connection):
+        with self.sub_mu:
+            with self.mu:
+                if conn not in self.connections:
+                    return
+                self.connections.remove(conn)
+                last = not self.connections
+            if last and self.on_last:
+                self.on_last()
+
+    def publish(self, msg: dict) -> int:
+        """Queues `msg` on every connection; returns how many accepted it"""
+        with self.mu:
+            conns = list(self.connections)
+        return sum(1 for c in conns if c.send(msg))
+
+    def publish_one(self, msg: dict) -> bool:
+        """Queues `msg` on exactly one connection - the most recently attached
+        one that accepts it. Used for messages that act on the first client
+        to receive them (e.g. badge scans that submit a sign-in)."""
+        with self.mu:
+            conns = list(reversed(self.connections))
+        return any(c.send(msg) for c in conns)
+
+    def metrics(self) -> dict:
+        """Reports per-connection queue state and lag"""
+        with self.mu:
+            conns = list(self.connections)
+        return {
+            "connections": len(conns),
+            "per_connection": [c.metrics() for c in conns],
+        }
+
+
+BROADCASTERS: dict[str, Broadcaster] = {}
+
+
+def metrics() -> dict:
+    """Reports metrics for every broadcaster, keyed by name"""
+    return {name: b.metrics() for name, b in list(BROADCASTERS.items())}
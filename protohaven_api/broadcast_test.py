@@ -0,0 +1,173 @@
+"""Tests for websocket fan-out"""
+
+import threading
+import time
+
+import pytest
+
+from protohaven_api import broadcast as b
+
+
+class FakeWS:  # pylint: disable=too-few-public-methods
+    """Records messages sent to it; optionally slow, failing, or blocked
+    until `gate` is set"""
+
+    def __init__(self, delay=0.0, fail=False, gate=None):
+        self.delay = delay
+        self.fail = fail
+        self.gate = gate
+        self.sent = []
+
+    def send(self, msg):
+        """Simulates a websocket write"""
+        if self.fail:
+            raise ConnectionError("gone")
+        if self.gate:
+            self.gate.wait(5)
+        if self.delay:
+            time.sleep(self.delay)
+        self.sent.append(msg)
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_connection_drop_policies():
+    """Full queues drop the oldest or newest message depending on policy"""
+    blocked = threading.Event()
+    for policy, want in (
+        (b.Policy.DROP_OLDEST, ['{"i": 0}', '{"i": 3}', '{"i": 4}']),
+        (b.Policy.DROP_NEWEST, ['{"i": 0}', '{"i": 1}', '{"i": 2}']),
+    ):
+        blocked.clear()
+        ws = FakeWS(gate=blocked)
+        c = b.Connection(ws, maxsize=2, policy=policy)
+        c.send({"i": 0})
+        _wait_for(lambda c=c: c.inflight)
+        for i in range(1, 5):
+            c.send({"i": i})
+        assert c.dropped == 2
+        blocked.set()
+        c.close(drain_sec=5)
+        assert ws.sent == want
+
+
+def test_connection_coalesces_by_key():
+    """Pending messages with the same key are replaced rather than queued"""
+    blocked = threading.Event()
+    ws = FakeWS(gate=blocked)
+    c = b.Connection(ws, coalesce_key=lambda m: m.get("type"))
+    c.send({"type": "status", "v": 0})
+    _wait_for(lambda: c.inflight)
+    c.send({"type": "status", "v": 1})
+    c.send({"msg": "a"})
+    c.send({"type": "status", "v": 2})
+    assert c.coalesced == 1
+    blocked.set()
+    c.close(drain_sec=5)
+    assert ws.sent == [
+        '{"type": "status", "v": 0}',
+        '{"type": "status", "v": 2}',
+        '{"msg": "a"}',
+    ]
+
+
+def test_broadcaster_cleans_up_dead_clients():
+    """A client whose writes fail is detached promptly; upstream hooks fire
+    on first attach and last detach"""
+    events = []
+    bc = b.Broadcaster(
+        "test_cleanup",
+        on_first=lambda: events.append("first"),
+        on_last=lambda: events.append("last"),
+    )
+    good = FakeWS()
+    c1 = bc.connect(good)
+    bc.connect(FakeWS(fail=True))
+    assert events == ["first"]
+
+    bc.publish({"x": 1})
+    _wait_for(lambda: len(bc.connections) == 1)
+    assert bc.connections == [c1]
+    c1.close(drain_sec=5)
+    assert good.sent == ['{"x": 1}']
+    assert events == ["first", "last"]
+    assert b.metrics()["test_cleanup"] == {"connections": 0, "per_connection": []}
+
+
+def test_broadcaster_publish_one():
+    """publish_one delivers to only the most recently attached connection"""
+    bc = b.Broadcaster("test_publish_one")
+    ws1, ws2 = FakeWS(), FakeWS()
+    c1 = bc.connect(ws1)
+    c2 = bc.connect(ws2)
+    assert bc.publish_one({"x": 1})
+    c2.close(drain_sec=5)
+    assert bc.publish_one({"x": 2})
+    c1.close(drain_sec=5)
+    assert ws2.sent == ['{"x": 1}']
+    assert ws1.sent == ['{"x": 2}']
+    assert not bc.publish_one({"x": 3})
+
+
+def test_broadcaster_reattach_during_detach():
+    """A connection attaching while the last one is still detaching (a page
+    reload) subscribes only after the unsubscribe has finished"""
+    events = []
+
+    def on_last():
+        events.append("last start")
+        time.sleep(0.1)
+        events.append("last end")
+
+    bc = b.Broadcaster(
+        "test_reattach", on_first=lambda: events.append("first"), on_last=on_last
+    )
+    old = bc.connect(FakeWS())
+    t = threading.Thread(target=old.close)
+    t.start()
+    _wait_for(lambda: "last start" in events)
+    new = bc.connect(FakeWS())
+    t.join()
+    assert events == ["first", "last start", "last end", "first"]
+    assert bc.connections == [new]
+    new.close()
+
+
+@pytest.mark.benchmark
+def test_broadcaster_load_with_slow_clients():
+    """Publishing to many clients never waits on slow ones; fast clients get
+    every message while slow clients fall behind only up to their queue size"""
+    n_fast, n_slow, n_msgs, maxsize = 200, 20, 200, 32
+    bc = b.Broadcaster("test_load")
+    fast = [FakeWS() for _ in range(n_fast)]
+    slow = [FakeWS(delay=0.05) for _ in range(n_slow)]
+    for ws in fast:
+        bc.connect(ws, maxsize=n_msgs)
+    for ws in slow:
+        bc.connect(ws, maxsize=maxsize)
+
+    start = time.perf_counter()
+    for i in range(n_msgs):
+        bc.publish({"i": i})
+    publish_sec = time.perf_counter() - start
+
+    _wait_for(lambda: all(len(ws.sent) == n_msgs for ws in fast))
+    fast_sec = time.perf_counter() - start
+    m = bc.metrics()
+    slow_metrics = m["per_connection"][n_fast:]
+    print(
+        f"{n_msgs} msgs to {n_fast} fast + {n_slow} slow clients: publish "
+        f"{publish_sec:.3f}s, fast clients done in {fast_sec:.3f}s, max slow lag "
+        f"{max(s['lag_sec'] for s in slow_metrics):.3f}s"
+    )
+    assert all(s["pending"] <= maxsize for s in slow_metrics)
+    assert all(s["dropped"] > 0 for s in slow_metrics)
+
+    for c in list(bc.connections):
+        c.close()
+    assert not bc.connections
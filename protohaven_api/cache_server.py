@@ -7,6 +7,7 @@ independently from the main Flask application.
 Endpoints:
   GET /find_best_match?search=...&top_n=10&score_cutoff=65
   GET /neon_id_from_booked_id?booked_id=<int>
+  GET /neon_ids_from_booked_ids?booked_ids=<int>,<int>,...
   GET /get?key=<email>
 
 Usage:
@@ -111,6 +112,25 @@ def create_app() -> Flask:
         neon_id: str = neon.cache.neon_id_from_booked_id(booked_id)
         return jsonify({"neon_id": neon_id})
 
+    @fapp.route("/neon_ids_from_booked_ids")
+    def neon_ids_from_booked_ids() -> tuple[Response, int] | Response:
+        """Bulk lookup of Neon IDs for Booked scheduler user IDs.
+
+        Query params:
+            booked_ids: CSV of Booked scheduler user IDs (required, integers)
+        """
+        booked_ids_str: str = request.args.get("booked_ids", "")
+        if not booked_ids_str:
+            return jsonify({"error": "booked_ids parameter is required"}), 400
+
+        try:
+            booked_ids: list[int] = [int(b) for b in booked_ids_str.split(",")]
+        except ValueError:
+            return jsonify({"error": "booked_ids must be integers"}), 400
+
+        neon_ids = neon.cache.neon_ids_from_booked_ids(booked_ids)
+        return jsonify({"neon_ids": {str(k): v for k, v in neon_ids.items()}})
+
     @fapp.route("/get")
     def get_member() -> tuple[Response, int] | Response:
         """Look up members by email.
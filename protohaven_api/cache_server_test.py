@@ -153,6 +153,23 @@ def test_neon_id_from_booked_id_returns_neon_id(mocker, client):
     cache_server.neon.cache.neon_id_from_booked_id.assert_called_with(42)
 
 
+def test_neon_ids_from_booked_ids(mocker, client):
+    """neon_ids_from_booked_ids resolves a CSV of Booked IDs in one call."""
+    mocker.patch.object(
+        cache_server.neon.cache,
+        "neon_ids_from_booked_ids",
+        return_value={1: "100", 2: None},
+    )
+
+    resp = client.get("/neon_ids_from_booked_ids?booked_ids=1,2")
+    assert resp.status_code == 200
+    assert json.loads(resp.data) == {"neon_ids": {"1": "100", "2": None}}
+    cache_server.neon.cache.neon_ids_from_booked_ids.assert_called_with([1, 2])
+
+    resp = client.get("/neon_ids_from_booked_ids?booked_ids=1,x")
+    assert resp.status_code == 400
+
+
 def test_get_empty_result(mocker, client):
     """get returns empty dict when cache returns nothing."""
     mocker.patch.object(
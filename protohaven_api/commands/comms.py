@@ -1,10 +1,14 @@
 """Commands related to sending communications"""
 
 import argparse
+import hashlib
+import json
 import logging
 import re
 import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import getenv
 from typing import Any
 
@@ -18,10 +22,68 @@ from protohaven_api.integrations import (  # pylint: disable=import-error
     comms,
     tasks,
 )
+from protohaven_api.integrations.data.local_db import LocalDB
+from protohaven_api.rate_limit import RateLimiter
 
 log = logging.getLogger("cli.comms")
 
 
+class CommsJournal(LocalDB):
+    """Record of which comms have gone out, so that rerunning an interrupted
+    `send_comms` resumes where it left off instead of sending duplicates.
+
+    A message is SENT once delivered, and DONE once its side effects and
+    logging have also completed. Entries older than RESUME_WINDOW_SEC are
+    ignored, so identical messages in a later batch are sent again.
+    """
+
+    NAME = "comms_journal"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS journal (
+            key TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            target TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            error TEXT,
+            updated REAL NOT NULL
+        );
+    """
+    SENT = "sent"
+    DONE = "done"
+    FAILED = "failed"
+    RESUME_WINDOW_SEC = 12 * 3600
+
+    @staticmethod
+    def key(e: dict) -> str:
+        """Identifies a message by its content"""
+        content = {k: e.get(k) for k in ("id", "target", "subject", "body")}
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> tuple[str, list[str]] | None:
+        """Returns the recent (state, delivered targets) of a message, if any"""
+        rows = self.execute(
+            "SELECT state, target FROM journal WHERE key=? AND updated > ?",
+            (key, time.time() - self.RESUME_WINDOW_SEC),
+        )
+        if not rows:
+            return None
+        return rows[0][0], [t for t in rows[0][1].split(", ") if t]
+
+    def put(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, key: str, state: str, target: list[str], subject: str, error=None
+    ):
+        """Records the state of a message"""
+        self.execute(
+            "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?)",
+            (key, state, ", ".join(target), subject, error, time.time()),
+        )
+
+
+journal = CommsJournal()
+
+
 class Commands:  # pylint: disable=too-few-public-methods
     """Commands for sending Discord & email comms.
 
@@ -75,20 +137,66 @@ class Commands:  # pylint: disable=too-few-public-methods
 
         return None
 
-    def _handle_comms_event(self, e, apply):
-        """Handle a single entry in a comms YAML file"""
-        if e["target"][0] in ("#", "@"):  # channels or users
-            target = self._handle_discord(
+    @staticmethod
+    def _channel_type(e) -> str:
+        return "discord" if e["target"][0] in ("#", "@") else "email"
+
+    def _send_comms_event(self, e, apply):
+        """Deliver a single entry in a comms YAML file; returns the targets
+        it was delivered to, or None on dry run or failure"""
+        if self._channel_type(e) == "discord":  # channels or users
+            return self._handle_discord(
                 e, apply, getenv("CHAN_OVERRIDE"), getenv("DM_OVERRIDE")
             )
+        return self._handle_email(e, apply, getenv("EMAIL_OVERRIDE"))
+
+    def _handle_comms_event(self, e, apply, limiter=None, resume=True) -> str:
+        """Handle a single entry in a comms YAML file. Returns the outcome:
+        one of "sent", "skipped" (already done by an earlier run), "failed"
+        or "dry_run"."""
+        key = CommsJournal.key(e)
+        prev = journal.get(key) if apply and resume else None
+        if prev and prev[0] == CommsJournal.DONE:
+            log.info(f"Already sent to {e['target']}, skipping: {e['subject']}")
+            return "skipped"
+        if prev and prev[0] == CommsJournal.SENT:
+            log.info(f"Already sent to {e['target']}; finishing side effects")
+            target = prev[1]
         else:
-            target = self._handle_email(e, apply, getenv("EMAIL_OVERRIDE"))
+            if apply and limiter:
+                limiter.wait()
+            try:
+                target = self._send_comms_event(e, apply)
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                log.error(f"Failed to send to {e['target']}: {ex}")
+                journal.put(key, CommsJournal.FAILED, [], e["subject"], str(ex))
+                return "failed"
+            if (
+                not target
+            ):  # Only set when the action made a change; ignore apply=False and failure
+                if not apply:
+                    return "dry_run"
+                journal.put(key, CommsJournal.FAILED, [], e["subject"], "not sent")
+                return "failed"
+            journal.put(key, CommsJournal.SENT, target, e["subject"])
 
-        if (
-            not target
-        ):  # Only set when the action made a change; ignore apply=False and failure
-            return
+        try:
+            self._apply_side_effects(e, target, apply)
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            # Left as SENT, so a rerun retries only the side effects
+            log.error(f"Side effects failed after sending to {target}: {ex}")
+            return "failed"
+        journal.put(key, CommsJournal.DONE, target, e["subject"])
+        return "sent"
 
+    def _handle_comms_events(self, events, apply, limiter=None, resume=True):
+        """Handles entries for a single target one at a time, in order, so
+        messages to the same channel or user arrive as listed. Returns the
+        outcome of each."""
+        return [self._handle_comms_event(e, apply, limiter, resume) for e in events]
+
+    def _apply_side_effects(self, e, target, apply):
+        """Carry out side effects and logging for a delivered entry"""
         # Side effects happen AFTER successful message delivery.
         # This ensures tasks aren't marked complete if the message fails to send.
         for k, v in e.get("side_effect", {}).items():
@@ -150,8 +258,32 @@ class Commands:  # pylint: disable=too-few-public-methods
             action=argparse.BooleanOptionalAction,
             default=True,
         ),
+        arg(
+            "--resume",
+            help="skip messages already sent by a recent run of the same batch",
+            action=argparse.BooleanOptionalAction,
+            default=True,
+        ),
+        arg(
+            "--workers",
+            help="concurrent senders per channel type (email, discord)",
+            type=int,
+            default=4,
+        ),
+        arg(
+            "--email-rate",
+            help="max emails sent per second",
+            type=float,
+            default=5.0,
+        ),
+        arg(
+            "--discord-rate",
+            help="max Discord messages sent per second",
+            type=float,
+            default=2.0,
+        ),
     )
-    def send_comms(self, args, _):
+    def send_comms(self, args, pct):  # pylint: disable=too-many-locals
         """Reads a list of emails/discord messages and sends them to their recipients"""
         data = self._load_comms_data(args.path)
         if not data:
@@ -178,6 +310,48 @@ class Commands:  # pylint: disable=too-few-public-methods
                 log.error("Confirmation string does not match; exiting")
                 sys.exit(1)
 
+        # Email and Discord are sent concurrently, each with its own workers
+        # and rate limit. Messages to the same target are sent in order by a
+        # single worker. Dry runs are sequential so their output is readable.
+        by_target: defaultdict[tuple[str, str], list[dict]] = defaultdict(list)
         for e in data:
-            self._handle_comms_event(e, args.apply)
+            by_target[(self._channel_type(e), e["target"].strip())].append(e)
+        workers = args.workers if args.apply else 1
+        limiters = {
+            "email": RateLimiter(args.email_rate),
+            "discord": RateLimiter(args.discord_rate),
+        }
+        outcomes: defaultdict[str, int] = defaultdict(int)
+        pct.set_stages(1)
+        start = time.monotonic()
+        with pct.phase("send"), ThreadPoolExecutor(
+            workers
+        ) as email_ex, ThreadPoolExecutor(workers) as discord_ex:
+            executors = {"email": email_ex, "discord": discord_ex}
+            futures = [
+                executors[ch].submit(
+                    self._handle_comms_events,
+                    events,
+                    args.apply,
+                    limiters[ch],
+                    args.resume,
+                )
+                for (ch, _), events in by_target.items()
+            ]
+            done = 0
+            for f in as_completed(futures):
+                for o in f.result():
+                    outcomes[o] += 1
+                    done += 1
+                pct[0] = done / len(data)
+        elapsed = time.monotonic() - start
+        pct.stat(
+            **{k: outcomes[k] for k in ("sent", "skipped", "failed")},
+            msgs_per_sec=round(outcomes["sent"] / elapsed, 2) if elapsed else 0,
+        )
+        if outcomes["failed"]:
+            raise RuntimeError(
+                f"{outcomes['failed']} of {len(data)} messages failed to send; "
+                "rerun to retry them (sent messages will be skipped)"
+            )
         log.info("Done")
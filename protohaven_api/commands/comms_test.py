@@ -1,12 +1,15 @@
 """Test methods for comms-oriented CLI commands"""
 
 # pylint: skip-file
+import threading
+import time
 from collections import namedtuple
 from unittest.mock import call
 
 import pytest
 
 from protohaven_api.commands import comms as c
+from protohaven_api.integrations.data.local_db import MEMORY
 from protohaven_api.testing import idfn, mkcli
 
 Tc = namedtuple(
@@ -22,6 +25,12 @@ def fixture_cli(capsys):
     return mkcli(capsys, c)
 
 
+@pytest.fixture(autouse=True)
+def fixture_journal(mocker):
+    """Each test gets an empty send journal"""
+    return mocker.patch.object(c, "journal", c.CommsJournal(MEMORY))
+
+
 @pytest.mark.parametrize(
     "tc",
     [
@@ -165,3 +174,167 @@ def test_send_comms(mocker, tc, cli):
             fn.assert_has_calls([tcall])
         else:
             fn.assert_not_called()
+
+
+def _msgs(n, prefix="a"):
+    return [
+        {
+            "target": f"{prefix}{i}@a.com" if i % 2 else f"@{prefix}user{i}",
+            "subject": f"Subject {i}",
+            "body": "Body",
+            "side_effect": {"complete_asana_task": str(i)},
+        }
+        for i in range(n)
+    ]
+
+
+def test_send_comms_resumes_without_duplicates(mocker, cli):
+    """A rerun after a partial failure only sends what didn't go out, and
+    finishes side effects for messages that were sent"""
+    data = _msgs(6)
+    mocker.patch.object(c.Commands, "_load_comms_data", return_value=data)
+    mocker.patch.object(c.airtable, "log_comms")
+    mocker.patch.object(
+        c.comms,
+        "send_email",
+        side_effect=lambda s, *_: None if s == "Subject 3" else {"id": "1"},
+    )
+    mocker.patch.object(c.comms, "send_discord_message")
+
+    def complete(v):
+        if v == "4":
+            raise RuntimeError("asana")
+
+    mocker.patch.object(c.tasks, "complete", side_effect=complete)
+    with pytest.raises(RuntimeError, match="2 of 6 messages failed"):
+        cli("send_comms", ["--path", "x", "--confirm"], parse_yaml=False)
+    assert c.comms.send_email.call_count + c.comms.send_discord_message.call_count == 6
+
+    c.comms.send_email.reset_mock()
+    c.comms.send_email.side_effect = lambda *_: {"id": "1"}
+    c.comms.send_discord_message.reset_mock()
+    c.tasks.complete.reset_mock()
+    c.tasks.complete.side_effect = None
+    cli("send_comms", ["--path", "x", "--confirm"], parse_yaml=False)
+    # Message 3 failed to send; message 4 was sent but its side effect failed
+    c.comms.send_email.assert_called_once_with("Subject 3", "Body", ["a3@a.com"], False)
+    c.comms.send_discord_message.assert_not_called()
+    c.tasks.complete.assert_has_calls([call("3"), call("4")], any_order=True)
+    assert c.tasks.complete.call_count == 2
+
+    # Resume can be disabled to force sending again
+    cli("send_comms", ["--path", "x", "--confirm", "--no-resume"], parse_yaml=False)
+    assert c.comms.send_discord_message.call_count == 3
+
+
+def test_send_comms_keeps_order_per_target(mocker, cli):
+    """Messages to the same channel or user go out in the order listed, while
+    different targets are sent concurrently"""
+    data = [
+        {"target": f"#chan{i % 3}", "subject": f"Subject {i}", "body": f"{i}"}
+        for i in range(12)
+    ]
+    mocker.patch.object(c.Commands, "_load_comms_data", return_value=data)
+    mocker.patch.object(c.airtable, "log_comms")
+    sent = []
+    active = {"n": 0, "max": 0}
+    mu = threading.Lock()
+
+    def send(content, channel, *_args, **_kwargs):
+        i = int(content.split()[-1])
+        with mu:
+            active["n"] += 1
+            active["max"] = max(active["max"], active["n"])
+        # Earlier messages are slower, so a shared pool would reorder them
+        time.sleep(0.03 - i * 0.002)
+        with mu:
+            active["n"] -= 1
+            sent.append((channel, i))
+
+    mocker.patch.object(c.comms, "send_discord_message", side_effect=send)
+    cli(
+        "send_comms",
+        ["--path", "x", "--confirm", "--workers", "4", "--discord-rate", "1000"],
+        parse_yaml=False,
+    )
+    assert len(sent) == 12
+    for ch in ("chan0", "chan1", "chan2"):
+        got = [i for target, i in sent if target == f"#{ch}"]
+        assert got == sorted(got) and len(got) == 4
+    assert active["max"] > 1
+
+
+@pytest.mark.benchmark
+def test_send_comms_throughput_benchmark(mocker, cli):
+    """Email and Discord are sent concurrently, within their rate limits"""
+    n = 40
+    data = _msgs(n)
+    mocker.patch.object(c.Commands, "_load_comms_data", return_value=data)
+    mocker.patch.object(c.airtable, "log_comms")
+    mocker.patch.object(c.tasks, "complete")
+    in_flight = {"email": 0, "discord": 0, "max": 0}
+    mu = threading.Lock()
+
+    def slow_send(kind, result):
+        def fn(*_args):
+            with mu:
+                in_flight[kind] += 1
+                in_flight["max"] = max(
+                    in_flight["max"], sum(in_flight[k] for k in ("email", "discord"))
+                )
+            time.sleep(0.02)
+            with mu:
+                in_flight[kind] -= 1
+            return result
+
+        return fn
+
+    mocker.patch.object(
+        c.comms, "send_email", side_effect=slow_send("email", {"id": 1})
+    )
+    mocker.patch.object(
+        c.comms, "send_discord_message", side_effect=slow_send("discord", None)
+    )
+    timings = {}
+    for workers in (1, 4):
+        c.journal.execute("DELETE FROM journal")
+        start = time.perf_counter()
+        cli(
+            "send_comms",
+            [
+                "--path",
+                "x",
+                "--confirm",
+                "--workers",
+                str(workers),
+                "--email-rate",
+                "1000",
+                "--discord-rate",
+                "1000",
+            ],
+            parse_yaml=False,
+        )
+        timings[workers] = time.perf_counter() - start
+    print(f"{n} messages: 1 worker {timings[1]:.3f}s, 4 workers {timings[4]:.3f}s")
+    assert c.comms.send_email.call_count == n
+    assert in_flight["max"] > 2
+
+    # Rate limits bound throughput regardless of workers
+    c.journal.execute("DELETE FROM journal")
+    start = time.perf_counter()
+    cli(
+        "send_comms",
+        [
+            "--path",
+            "x",
+            "--confirm",
+            "--workers",
+            "8",
+            "--email-rate",
+            "50",
+            "--discord-rate",
+            "50",
+        ],
+        parse_yaml=False,
+    )
+    print(f"{n} messages at 50/s per channel: {time.perf_counter() - start:.3f}s")
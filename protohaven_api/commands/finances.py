@@ -2,9 +2,12 @@
 
 import argparse
 import datetime
+import json
 import logging
 import re
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, Generator
 
 from protohaven_api.automation.membership import membership as memauto
@@ -17,43 +20,135 @@ from protohaven_api.config import (  # pylint: disable=import-error
 from protohaven_api.integrations import (  # pylint: disable=import-error
     airtable,
     neon,
+    neon_base,
     sales,
 )
 from protohaven_api.integrations.comms import Msg
+from protohaven_api.integrations.data.local_db import LocalDB
 from protohaven_api.integrations.models import Role
+from protohaven_api.rate_limit import RateLimiter
 
 log = logging.getLogger("cli.finances")
 
 
+class ValidationCheckpoint(LocalDB):
+    """Account details fetched by `validate_memberships`, so that rerunning an
+    interrupted validation only fetches the accounts it hadn't reached.
+
+    Entries older than RESUME_WINDOW_SEC are ignored, and the checkpoint is
+    cleared once a validation completes.
+    """
+
+    NAME = "membership_validation"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            neon_id TEXT PRIMARY KEY,
+            account TEXT NOT NULL,
+            memberships TEXT NOT NULL,
+            fetched REAL NOT NULL
+        );
+    """
+    RESUME_WINDOW_SEC = 12 * 3600
+
+    def get(self) -> dict[str, tuple[dict, list]]:
+        """Returns the recently fetched (account, memberships) by Neon ID"""
+        return {
+            aid: (json.loads(a), json.loads(ms))
+            for aid, a, ms in self.execute(
+                "SELECT neon_id, account, memberships FROM accounts WHERE fetched > ?",
+                (time.time() - self.RESUME_WINDOW_SEC,),
+            )
+        }
+
+    def put(self, neon_id, account: dict, memberships: list):
+        """Records the fetched details of an account"""
+        self.execute(
+            "INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?)",
+            (str(neon_id), json.dumps(account), json.dumps(memberships), time.time()),
+        )
+
+    def clear(self):
+        """Forgets all fetched accounts"""
+        self.execute("DELETE FROM accounts")
+
+
+checkpoint = ValidationCheckpoint()
+
+
 class Commands:
     """Commands for managing classes in Airtable and Neon"""
 
-    @command()
+    def _subscription_tax_pcts(self, subs, *, workers=4, square_rate=10.0):
+        """Computes the tax percentage of each (subscription, price) pair,
+        looking up invoices concurrently at most `square_rate` per second.
+        Returns the percentages keyed by subscription ID."""
+        limiter = RateLimiter(square_rate)
+
+        def tax_pct(sub, price):
+            if not sub.get("tax_percentage") and sub["invoice_ids"]:
+                limiter.wait()  # Only invoice lookups hit the API
+            return sub["id"], sales.subscription_tax_pct(sub, price)
+
+        with ThreadPoolExecutor(workers) as ex:
+            return dict(ex.map(lambda sp: tax_pct(*sp), subs))
+
+    @command(
+        arg(
+            "--workers",
+            help="invoices fetched from Square concurrently",
+            type=int,
+            default=4,
+        ),
+        arg(
+            "--square_rate",
+            help="max Square invoice requests per second",
+            type=float,
+            default=10.0,
+        ),
+    )
     def transaction_alerts(  # pylint: disable=too-many-locals
-        self, _1: Any, _2: Any
+        self, args: Any, pct: Any
     ) -> None:
         """Send alerts about recent/unresolved transaction issues"""
-        log.info("Fetching customer mapping")
-        cust_map = sales.get_customer_name_map(include_pii=True, include_email=True)
+        with pct.phase("customers"):
+            cust_map = sales.get_customer_name_map(include_pii=True, include_email=True)
         log.info(f"Fetched {len(cust_map)} customers")
-        log.info("Fetching subscription plans")
-        sub_plan_map = sales.get_subscription_plan_map()
+        with pct.phase("plans"):
+            sub_plan_map = sales.get_subscription_plan_map()
         log.info(f"Fetched {len(sub_plan_map)} subscription plans")
         assert len(sub_plan_map) > 0  # We should at least have some plans
 
-        log.info("Fetching unpaid invoices")
-        unpaid_invoices = dict(sales.get_unpaid_invoices_by_id())
+        with pct.phase("unpaid_invoices"):
+            unpaid_invoices = dict(sales.get_unpaid_invoices_by_id())
         log.info(f"Fetched {len(unpaid_invoices)} unpaid invoices")
 
-        now = tznow()
-        log.info("Fetching subscriptions")
+        with pct.phase("subscriptions"):
+            subs = []
+            for sub in sales.get_subscriptions():
+                log.debug(f"Subscription {sub['id']}: {sub}")
+                plan, price = sub_plan_map.get(
+                    sub["plan_variation_id"], (sub["plan_variation_id"], 0)
+                )
+                if price == 0:
+                    log.warning(
+                        f"Subscription plan not resolved: {sub['plan_variation_id']}"
+                    )
+                    continue
+                subs.append((sub, plan, price))
+        log.info(f"Fetched {len(subs)} subscriptions with known plans")
+
+        with pct.phase("tax"):
+            tax_pcts = self._subscription_tax_pcts(
+                [(sub, price) for sub, _, price in subs],
+                workers=args.workers,
+                square_rate=args.square_rate,
+            )
 
+        now = tznow()
         unpaid = []
         untaxed = []
-        n = 0
-        for sub in sales.get_subscriptions():
+        for sub, plan, price in subs:
             status = sub["status"]
-            n += 1
 
             sub_id = sub["id"]
             square_base = get_config(
@@ -61,16 +156,7 @@ class Commands:
                 "https://squareup.com/dashboard",
             )
             url = f"{square_base}/subscriptions-list/{sub_id}"
-            log.debug(f"Subscription {sub_id}: {sub}")
-            plan, price = sub_plan_map.get(
-                sub["plan_variation_id"], (sub["plan_variation_id"], 0)
-            )
-            if price == 0:
-                log.warning(
-                    f"Subscription plan not resolved: {sub['plan_variation_id']}"
-                )
-                continue
-            tax_pct = sales.subscription_tax_pct(sub, price)
+            tax_pct = tax_pcts[sub_id]
 
             log.debug(f"{plan} ${price/100} tax={tax_pct}%")
             cust_name, cust_email = cust_map.get(sub["customer_id"], sub["customer_id"])
@@ -102,8 +188,10 @@ class Commands:
                 log.info(unpaid[-1])
 
         log.info(
-            f"Processed {n} active subscriptions - {len(unpaid)} unpaid, {len(untaxed)} untaxed"
+            f"Processed {len(subs)} active subscriptions - {len(unpaid)} unpaid, "
+            f"{len(untaxed)} untaxed"
         )
+        pct.stat(subscriptions=len(subs), unpaid=len(unpaid), untaxed=len(untaxed))
         result = []
         if len(unpaid) > 0 or len(untaxed) > 0:
             result = [
@@ -188,6 +276,24 @@ class Commands:
             help="CSV string of membership types to ignore",
             type=str,
         ),
+        arg(
+            "--workers",
+            help="accounts fetched from Neon concurrently",
+            type=int,
+            default=4,
+        ),
+        arg(
+            "--neon_rate",
+            help="max Neon requests per second",
+            type=float,
+            default=4.0,
+        ),
+        arg(
+            "--resume",
+            help="reuse accounts fetched by a recent interrupted run",
+            action=argparse.BooleanOptionalAction,
+            default=True,
+        ),
     )
     def validate_memberships(self, args, pct):
         """Loops through all accounts and verifies that memberships are correctly set"""
@@ -201,7 +307,12 @@ class Commands:
             log.warning(f"Ignoring membership types: {args.ignore_membership_types}")
         problems = list(
             self._validate_memberships_internal(
-                args.member_ids, pct, args.ignore_membership_types
+                args.member_ids,
+                pct,
+                args.ignore_membership_types,
+                workers=args.workers,
+                neon_rate=args.neon_rate,
+                resume=args.resume,
             )
         )
         if len(problems) > 0:
@@ -216,22 +327,68 @@ class Commands:
             print_yaml([])
         log.info(f"Done ({len(problems)} validation problems found)")
 
+    def _fetch_member_details(  # pylint: disable=too-many-locals
+        self, accts, pct, *, workers=4, neon_rate=4.0, resume=True
+    ):
+        """Fetches the account and membership details of `accts` concurrently,
+        at most `neon_rate` requests per second, checkpointing each so a rerun
+        can skip them"""
+        fetched = checkpoint.get() if resume else {}
+        todo = [a for a in accts if str(a.neon_id) not in fetched]
+        log.info(
+            f"Fetching {len(todo)} accounts ({len(accts) - len(todo)} "
+            "already fetched by an earlier run)"
+        )
+        limiter = RateLimiter(neon_rate)
+
+        def fetch(acct):
+            limiter.wait()
+            raw = neon_base.fetch_account(acct.neon_id, raw=True)
+            limiter.wait()
+            ms = neon_base.fetch_memberships_internal_do_not_call_directly(acct.neon_id)
+            checkpoint.put(acct.neon_id, raw, ms)
+            return str(acct.neon_id), (raw, ms)
+
+        with ThreadPoolExecutor(workers) as ex:
+            futures = [ex.submit(fetch, a) for a in todo]
+            try:
+                for i, f in enumerate(as_completed(futures)):
+                    aid, details = f.result()
+                    fetched[aid] = details
+                    pct[1] = (i + 1) / len(todo)
+            except Exception:
+                # Stop early; what was fetched is checkpointed for the rerun
+                for f in futures:
+                    f.cancel()
+                raise
+        pct[1] = 1.0
+
+        for acct in accts:
+            acct.neon_raw_data, ms = fetched[str(acct.neon_id)]
+            acct.set_membership_data(ms)
+
     def _validate_memberships_internal(
-        self, member_ids=None, pct=None, ignore_membership_types=None
-    ):  # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+        self,
+        member_ids=None,
+        pct=None,
+        ignore_membership_types=None,
+        *,
+        workers=4,
+        neon_rate=4.0,
+        resume=True,
+    ):  # pylint: disable=too-many-locals,too-many-arguments
         """Implementation of validate_memberships, callable internally"""
         household_paying_member_count: defaultdict[str, int] = defaultdict(int)
         company_member_count: defaultdict[str, int] = defaultdict(int)
         member_data = {}
         if pct:
-            pct.set_stages(2)
+            pct.set_stages(3)
         else:
             pct = {}
 
-        # We search for NOT a bogus email to get all accounts, then collect
+        # We search for all active accounts, then fetch details and collect
         # data before analysis in order to count paying household & company members
         log.info("Collecting members")
-        n = 0
 
         def filter_acct(acct):
             if acct.account_current_membership_status.lower() != "active":
@@ -242,8 +399,9 @@ class Commands:
                 return False
             return True
 
-        for i, acct in enumerate(
-            neon.search_active_members(
+        accts = [
+            acct
+            for acct in neon.search_active_members(
                 [
                     "Account Current Membership Status",
                     "Company ID",
@@ -255,22 +413,21 @@ class Commands:
                     neon.CustomField.ZERO_COST_OK_UNTIL,
                     neon.CustomField.INCOME_BASED_RATE,
                 ],
-                also_fetch=filter_acct,
-                fetch_memberships=filter_acct,
             )
-        ):
-            # This should really pull total from paginated_search
-            pct[0] = max(0.5, i / 6000)
-            log.info(f"#{acct.neon_id}")
-            if not filter_acct(acct):
-                continue
+            if filter_acct(acct)
+        ]
+        pct[0] = 1.0
+        self._fetch_member_details(
+            accts, pct, workers=workers, neon_rate=neon_rate, resume=resume
+        )
+
+        for acct in accts:
             member_data[acct.neon_id] = acct
             for ms in acct.memberships(active_only=True):
                 if "Additional" not in ms.level and ms.fee > 0:
                     household_paying_member_count[acct.household_id] += 1
 
             company_member_count[acct.company_id] += 1
-            n += 1
 
         log.info(
             f"Loaded {len(member_data)} active members, "
@@ -282,7 +439,7 @@ class Commands:
 
         for i, md in enumerate(member_data.items()):
             aid, acct = md
-            pct[1] = i / len(member_data)
+            pct[2] = i / len(member_data)
             if member_ids is not None and aid not in member_ids:
                 continue
             for r in self._validate_membership_singleton(
@@ -296,6 +453,7 @@ class Commands:
                     "result": r,
                     "account_id": acct.neon_id,
                 }
+        checkpoint.clear()
 
     def _validate_membership_singleton(
         self,
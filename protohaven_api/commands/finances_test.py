@@ -2,6 +2,7 @@
 
 # pylint: skip-file
 import datetime
+import time
 
 import pytest
 import yaml
@@ -9,8 +10,13 @@ import yaml
 from protohaven_api.commands import finances as f
 from protohaven_api.config import tznow  # pylint: disable=import-error
 from protohaven_api.integrations import neon  # pylint: disable=import-error
+from protohaven_api.integrations.cronicle import Progress
+from protohaven_api.integrations.data import dev_neon
+from protohaven_api.integrations.data.dev_connector import DevConnector
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.integrations.models import Member
 from protohaven_api.rbac import Role
-from protohaven_api.testing import MatchStr, d, mkcli
+from protohaven_api.testing import MatchStr, StubSquare, d, mkcli
 
 
 @pytest.fixture(name="cli")
@@ -87,6 +93,254 @@ def test_transaction_alerts_active_with_unpaid_invoice(mocker, cli):
     assert "inv2_id" not in got[0]["body"]
 
 
+def _square(n_subs, latency=0.0):
+    """A stub Square with `n_subs` subscriptions on a $100 plan; even ones are
+    taxed per their latest invoice, odd ones have no tax"""
+    subs, invoices = [], []
+    for i in range(n_subs):
+        invoices.append(
+            {
+                "id": f"inv{i}",
+                "invoice_number": f"{i:04d}",
+                "status": "PAID",
+                "payment_requests": [
+                    {"computed_amount_money": {"amount": 10700 if i % 2 else 10000}}
+                ],
+            }
+        )
+        subs.append(
+            {
+                "id": f"sub{i}",
+                "status": "ACTIVE",
+                "plan_variation_id": "var_id",
+                "customer_id": f"cust{i}",
+                "charged_through_date": d(10).isoformat(),
+                "invoice_ids": [f"inv{i}"],
+            }
+        )
+    return StubSquare(
+        customers=[
+            {
+                "id": f"cust{i}",
+                "given_name": "First",
+                "family_name": f"Last{i}",
+                "email_address": f"{i}@example.com",
+                "updated_at": "2025-01-01T00:00:00Z",
+            }
+            for i in range(n_subs)
+        ],
+        plans=[
+            {
+                "id": "var_id",
+                "is_deleted": False,
+                "updated_at": "2025-01-01T00:00:00Z",
+                "subscription_plan_variation_data": {
+                    "name": "Storage",
+                    "phases": [{"pricing": {"price": {"amount": 10000}}}],
+                },
+            }
+        ],
+        subscriptions=subs,
+        invoices=invoices,
+        latency=latency,
+    )
+
+
+def _run_alerts(mocker, capsys, stub, args):
+    mocker.patch.object(f.sales, "cache", f.sales.SquareCache(MEMORY))
+    mocker.patch.object(f.sales, "client", return_value=stub)
+    mocker.patch.object(f, "tznow", return_value=d(0))
+    pct = Progress()
+    start = time.perf_counter()
+    f.Commands().transaction_alerts(args, pct)
+    elapsed = time.perf_counter() - start
+    return yaml.safe_load(capsys.readouterr().out), pct, elapsed
+
+
+def test_transaction_alerts_stub_square(mocker, capsys):
+    """Invoices are looked up concurrently and each phase is timed"""
+    stub = _square(6, latency=0.02)
+    got, pct, _ = _run_alerts(
+        mocker, capsys, stub, ["--workers", "3", "--square_rate", "1000"]
+    )
+    assert stub.calls.count("get_invoice") == 6
+    assert stub.max_active == 3
+    assert set(pct.timings) == {
+        "customers",
+        "plans",
+        "unpaid_invoices",
+        "subscriptions",
+        "tax",
+    }
+    assert pct.stats == {"subscriptions": 6, "unpaid": 0, "untaxed": 3}
+    body = got[0]["body"]
+    assert "First Last0 (0@example.com) - Storage - 0.0% tax" in body
+    assert "Last1" not in body
+
+
+@pytest.mark.benchmark
+def test_transaction_alerts_benchmark(mocker, capsys):
+    """Times alerts for 40 subscriptions with serial and concurrent invoice
+    lookups"""
+    got = {}
+    for workers in (1, 8):
+        _, pct, elapsed = _run_alerts(
+            mocker,
+            capsys,
+            _square(40, latency=0.05),
+            ["--workers", str(workers), "--square_rate", "100"],
+        )
+        got[workers] = (elapsed, pct.timings)
+    for workers, (elapsed, timings) in got.items():
+        phases = ", ".join(f"{k} {v:.3f}s" for k, v in timings.items())
+        print(f"{workers} worker(s): {elapsed:.3f}s ({phases})")
+
+
+@pytest.fixture(autouse=True)
+def fixture_checkpoint(mocker):
+    mocker.patch.object(f, "checkpoint", f.ValidationCheckpoint(MEMORY))
+
+
+def _membership(level="General Membership", fee=115):
+    return {
+        "id": 1,
+        "membershipLevel": {"name": level},
+        "membershipTerm": {"name": f"{level} - ${fee}/mo"},
+        "fee": fee,
+        "status": "SUCCEEDED",
+        "termStartDate": (tznow() - datetime.timedelta(days=30)).isoformat(),
+        "termEndDate": (tznow() + datetime.timedelta(days=30)).isoformat(),
+    }
+
+
+def _search_results(n):
+    return [
+        Member.from_neon_search(
+            {
+                "Account ID": str(i),
+                "Account Current Membership Status": "Active",
+                "First Name": "First",
+                "Last Name": f"Last{i}",
+                "Household ID": str(i),
+            }
+        )
+        for i in range(n)
+    ]
+
+
+def test_validate_memberships_resumes(mocker):
+    """A rerun after a failure only fetches the accounts that weren't reached,
+    and a completed run starts over"""
+    mocker.patch.object(
+        neon, "search_active_members", side_effect=lambda _: _search_results(10)
+    )
+    fetched = []
+
+    def fetch_account(aid, raw):
+        if aid == "7" and "7" not in fetched:
+            fetched.append(aid)
+            raise RuntimeError("Neon is down")
+        fetched.append(aid)
+        return {"individualAccount": {"accountId": aid}}
+
+    mocker.patch.object(f.neon_base, "fetch_account", side_effect=fetch_account)
+    mocker.patch.object(
+        f.neon_base,
+        "fetch_memberships_internal_do_not_call_directly",
+        return_value=[_membership(fee=0)],
+    )
+    with pytest.raises(RuntimeError):
+        list(f.Commands()._validate_memberships_internal(workers=1, neon_rate=0))
+    done = set(f.checkpoint.get())
+    assert "7" not in done and len(done) >= 7
+    n = len(fetched)
+
+    got = list(f.Commands()._validate_memberships_internal(workers=1, neon_rate=0))
+    assert set(fetched[n:]) == {str(i) for i in range(10)} - done
+    # Zero-cost memberships are flagged for all members, fetched or resumed
+    assert len({g["account_id"] for g in got}) == 10
+
+    # A completed run clears the checkpoint
+    n = len(fetched)
+    list(f.Commands()._validate_memberships_internal(workers=1, neon_rate=0))
+    assert len(fetched) == n + 10
+
+
+def test_validate_memberships_progress(mocker):
+    """Progress is reported against the real number of accounts"""
+    mocker.patch.object(neon, "search_active_members", return_value=_search_results(4))
+    mocker.patch.object(f.neon_base, "fetch_account", return_value={})
+    mocker.patch.object(
+        f.neon_base,
+        "fetch_memberships_internal_do_not_call_directly",
+        return_value=[_membership()],
+    )
+    pct = mocker.MagicMock()
+    list(f.Commands()._validate_memberships_internal(pct=pct, neon_rate=0))
+    pct.set_stages.assert_called_with(3)
+    fetch_progress = [
+        c.args[1] for c in pct.__setitem__.call_args_list if c.args[0] == 1
+    ]
+    assert fetch_progress == [0.25, 0.5, 0.75, 1.0, 1.0]
+
+
+@pytest.mark.benchmark
+def test_validate_memberships_benchmark(mocker):
+    """Sequential vs. concurrent validation against the mock Neon backend,
+    adding 5ms of latency per request"""
+    n = 200
+    accounts = [
+        {
+            "fields": {
+                "accountId": i,
+                "data": {
+                    "individualAccount": {
+                        "accountId": i,
+                        "accountCurrentMembershipStatus": "Active",
+                        "primaryContact": {"firstName": "First", "lastName": f"L{i}"},
+                        "accountCustomFields": [],
+                    }
+                },
+            }
+        }
+        for i in range(1, n + 1)
+    ]
+    memberships = [
+        {"fields": {"accountId": i, "data": [_membership()]}} for i in range(1, n + 1)
+    ]
+    mocker.patch.object(
+        dev_neon,
+        "get_all_rows",
+        side_effect=lambda t: {"accounts": accounts, "memberships": memberships}[t],
+    )
+    dev = DevConnector()
+    backend = dev.neon_request
+
+    def neon_request(*args, **kwargs):
+        time.sleep(0.005)
+        return backend(*args, **kwargs)
+
+    mocker.patch.object(dev, "neon_request", side_effect=neon_request)
+    mocker.patch.object(f.neon_base, "get_connector", return_value=dev)
+
+    got = {}
+    for workers in (1, 8):
+        start = time.perf_counter()
+        problems = list(
+            f.Commands()._validate_memberships_internal(
+                workers=workers, neon_rate=0, resume=False
+            )
+        )
+        got[workers] = time.perf_counter() - start
+    for workers, sec in got.items():
+        print(
+            f"Validate {n} accounts with {workers} worker(s): {sec:.2f}s "
+            f"({n / sec:.0f} accounts/s)"
+        )
+    assert not problems
+    assert dev.neon_request.call_count == 2 * (2 * n + 1)
+
+
 def test_validate_memberships_empty(mocker):
     """Empty search shoud pass by default"""
     mocker.patch.object(neon, "search_active_members", return_value=[])
@@ -5,6 +5,7 @@ import logging
 import random
 import tempfile
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Callable
 
@@ -367,28 +368,29 @@ class Commands:
         now = tznow()
 
         # Note: dest drive must be shared with protohaven-cli@protohaven-api.iam.gserviceaccount.com
-        stats = []
-        with tempfile.TemporaryDirectory() as d:
-            stats.append(
-                self._do_backup(
-                    wiki.fetch_db_backup,
-                    Path(d) / "db_backup.sql.gz",
-                    f"db_backup_{now.isoformat()}.sql.gz",
-                    args.parent_id,
-                    apply=args.apply,
-                )
-            )
-            pct[0] = 1.0
-            stats.append(
-                self._do_backup(
-                    wiki.fetch_files_backup,
-                    Path(d) / "files_backup.tar.gz",
-                    f"files_backup_{now.isoformat()}.tar.gz",
+        # The database dump and file archive are independent, so fetch and
+        # upload them concurrently; stats keep the db-then-files order.
+        backups = [
+            (wiki.fetch_db_backup, "db_backup", "sql.gz"),
+            (wiki.fetch_files_backup, "files_backup", "tar.gz"),
+        ]
+        with tempfile.TemporaryDirectory() as d, ThreadPoolExecutor(
+            len(backups)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    self._do_backup,
+                    fn,
+                    Path(d) / f"{name}.{ext}",
+                    f"{name}_{now.isoformat()}.{ext}",
                     args.parent_id,
                     apply=args.apply,
                 )
-            )
-            pct[1] = 1.0
+                for fn, name, ext in backups
+            ]
+            for f in as_completed(futures):
+                pct[futures.index(f)] = 1.0
+            stats = [f.result() for f in futures]
 
         print_yaml(
             Msg.tmpl(
@@ -3,8 +3,12 @@
 import argparse
 import datetime
 import logging
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from functools import lru_cache
+from typing import Any
 
 from protohaven_api.automation.classes import events as eauto
 from protohaven_api.commands.decorator import arg, command, print_yaml
@@ -14,6 +18,42 @@ from protohaven_api.integrations.comms import Msg
 
 log = logging.getLogger("cli.reservation")
 
+MEMBER_SYNC_ATTEMPTS = 3
+MEMBER_SYNC_RETRY_DELAY_SEC = 2.0
+
+
+@dataclass
+class MemberChange:
+    """A single change to a Booked user planned by `sync_booked_members`"""
+
+    CREATE = "create"
+    ASSOCIATE = "associate"
+    UPDATE = "update"
+
+    action: str
+    member: Any
+    booked_id: int | None = None
+    desc: str = ""
+
+    def __str__(self):
+        if self.desc:
+            return self.desc
+        if self.action == self.CREATE:
+            return f"Create Booked user for {self.member.name} ({self.member.email})"
+        return (
+            f"Associate Booked #{self.booked_id} with neon #{self.member.neon_id} "
+            f"{self.member.name}"
+        )
+
+
+@dataclass
+class MemberSyncPlan:
+    """Changes needed to sync Neon members to Booked, plus the Booked IDs
+    that should belong to the Members group"""
+
+    changes: list[MemberChange] = field(default_factory=list)
+    member_ids: set[int] = field(default_factory=set)
+
 
 class Commands:
     """Commands for reserving equipment and configuring the Booked reservation system"""
@@ -42,7 +82,6 @@ class Commands:
         tool_code = t["fields"].get("Tool Code")
 
         log.info(f'{tool_code} #{resource_id} "{name}"')
-        r = booked.get_resource(resource_id)
         reservable = t["fields"].get("Current Status", "Unknown").split()[
             0
         ].lower() in ("green", "yellow")
@@ -101,6 +140,12 @@ class Commands:
             help="CSV of areas to exclude from syncing",
             default=None,
         ),
+        arg(
+            "--workers",
+            help="Max number of resource updates to push concurrently",
+            type=int,
+            default=8,
+        ),
     )
     def sync_reservable_tools(  # pylint: disable=too-many-branches, too-many-statements, too-many-locals
         self, args, pct
@@ -128,12 +173,13 @@ class Commands:
             log.warning(f"Excluding areas: {args.exclude_areas}")
         else:
             args.exclude_areas = set()
-        groups = {
-            k.replace("&amp;", "&"): v
-            for k, v in booked.get_resource_group_map().items()
-        }
+        with pct.phase("groups"):
+            groups = {
+                k.replace("&amp;", "&"): v
+                for k, v in booked.get_resource_group_map().items()
+            }
+            in_airtable = set(self._area_colors().keys()) - args.exclude_areas
         pct[0] = 1
-        in_airtable = set(self._area_colors().keys()) - args.exclude_areas
         in_booked = set(groups.keys()) - args.exclude_areas
 
         log.info(
@@ -152,50 +198,65 @@ class Commands:
             )
         pct[1] = 1
 
+        with pct.phase("catalog"):
+            # One bulk fetch of all resources; diffs below are computed locally
+            all_resources = {r["resourceId"]: r for r in booked.get_resources()}
+            tools = list(airtable.get_tools())
+
         airtable_booked_ids = set()
         summary = []
-        all_resources = {r["resourceId"]: r for r in booked.get_resources()}
-        tools = list(airtable.get_tools())
-        for i, t in enumerate(tools):
-            pct[2] = i / len(tools)
-            if not t["fields"].get("Reservable", False):
-                continue
-            r = all_resources.get(t["fields"].get("BookedResourceId"))
-            if not r:
-                summary.append(
-                    f"Create placeholder resource for {t['fields'].get('Tool Name')}"
-                )
-                log.info(summary[-1])
-                if args.apply:
-                    r = booked.create_resource("placeholder")
-                    airtable.set_booked_resource_id(t["id"], r["resourceId"])
-
-            if not r:  # Note: args.apply == False or insert failure results in r = None
-                continue
+        updates = []
+        with pct.phase("diff"):
+            for i, t in enumerate(tools):
+                pct[2] = i / len(tools)
+                if not t["fields"].get("Reservable", False):
+                    continue
+                r = all_resources.get(t["fields"].get("BookedResourceId"))
+                if not r:
+                    summary.append(
+                        f"Create placeholder resource for {t['fields'].get('Tool Name')}"
+                    )
+                    log.info(summary[-1])
+                    if args.apply:
+                        r = booked.create_resource("placeholder")
+                        airtable.set_booked_resource_id(t["id"], r["resourceId"])
 
-            airtable_booked_ids.add(int(r["resourceId"]))
-            if (
-                args.filter is not None
-                and t["fields"].get("Tool Code").strip().upper() not in args.filter
-            ):
-                continue
+                if (
+                    not r
+                ):  # Note: args.apply == False or insert failure results in r = None
+                    continue
 
-            r, changes = self._sync_reservable_tool(r, t)
-            if changes:
-                summary.append(f"Change {r['name']}: {', '.join(changes)}")
-                if args.apply:
-                    log.info(booked.update_resource(r))
+                airtable_booked_ids.add(int(r["resourceId"]))
+                if (
+                    args.filter is not None
+                    and t["fields"].get("Tool Code").strip().upper() not in args.filter
+                ):
+                    continue
 
-        self._sync_booked_permissions(
-            airtable_booked_ids, all_resources, summary, args.apply
-        )
+                r, changes = self._sync_reservable_tool(r, t)
+                if changes:
+                    summary.append(f"Change {r['name']}: {', '.join(changes)}")
+                    updates.append(r)
+
+        if args.apply and updates:
+            with pct.phase("push"), ThreadPoolExecutor(
+                max_workers=args.workers
+            ) as executor:
+                for rep in executor.map(booked.update_resource, updates):
+                    log.info(rep)
+
+        with pct.phase("permissions"):
+            self._sync_booked_permissions(
+                airtable_booked_ids, all_resources, summary, args.apply
+            )
         pct[3] = 0.5
 
-        extra_booked_resources = {
-            k: v
-            for k, v in booked.get_resource_id_to_name_map().items()
-            if k not in airtable_booked_ids
-        }
+        with pct.phase("verify"):
+            extra_booked_resources = {
+                k: v
+                for k, v in booked.get_resource_id_to_name_map().items()
+                if k not in airtable_booked_ids
+            }
         if len(extra_booked_resources) > 0:
             raise RuntimeError(
                 f"These resources exist in Booked, but not in Airtable: {extra_booked_resources}"
@@ -243,6 +304,148 @@ class Commands:
         log.info(f"Fetched {len(booked_user_data)} booked users")
         return booked_user_data
 
+    def _plan_member_sync(
+        self, neon_members, booked_user_data, exclude, include
+    ) -> MemberSyncPlan:
+        """Diffs Neon members against Booked users without making any calls,
+        returning the changes needed to bring Booked in line with Neon"""
+        email_to_booked_user = {
+            user.email.lower(): user for user in booked_user_data.values()
+        }
+        plan = MemberSyncPlan()
+        for member in neon_members:
+            member_email_lower = member.email.lower()
+            if member_email_lower in exclude:
+                log.info(f"Skipping excluded {member.email}")
+                continue
+            if include and member_email_lower not in include:
+                log.info(f"Skipping not explicitly included {member.email}")
+                continue
+
+            booked_id = member.booked_id
+            if not booked_id:
+                log.info(
+                    f"Active member {member.name} ({member.email}) with no Booked User ID"
+                )
+                existing_booked_user = email_to_booked_user.get(member_email_lower)
+                if existing_booked_user:
+                    log.info(
+                        f"Existing booked user with email {member.email}; associating that"
+                    )
+                    plan.changes.append(
+                        MemberChange(
+                            MemberChange.ASSOCIATE, member, existing_booked_user.id
+                        )
+                    )
+                else:
+                    plan.changes.append(MemberChange(MemberChange.CREATE, member))
+                continue
+
+            existing_booked_user = booked_user_data.get(booked_id)
+            if not existing_booked_user:
+                raise RuntimeError(
+                    f"Neon user {member.name} has invalid booked user ID {booked_id}"
+                )
+            plan.member_ids.add(booked_id)
+            # Check if the booked user data matches the neon member data
+            booked_user_tuple = (
+                existing_booked_user.first_name,
+                existing_booked_user.last_name,
+                existing_booked_user.email,
+            )
+            member_tuple = (member.fname, member.lname, member.email.lower())
+            if booked_user_tuple != member_tuple:
+                plan.changes.append(
+                    MemberChange(
+                        MemberChange.UPDATE,
+                        member,
+                        booked_id,
+                        f"Update booked #{booked_id}: {booked_user_tuple} -> {member_tuple}",
+                    )
+                )
+        return plan
+
+    def _apply_member_change(self, change: MemberChange) -> tuple[int | None, str]:
+        """Applies a single planned change, returning the member's Booked ID
+        (if known) and a summary line"""
+        member = change.member
+        if change.action == MemberChange.UPDATE:
+            data = booked.get_user(change.booked_id)
+            if not data or not data.get("id"):
+                raise RuntimeError(
+                    f"Failed to get user data for {change.booked_id}: {data}"
+                )
+            data["firstName"] = member.fname
+            data["lastName"] = member.lname
+            data["emailAddress"] = member.email
+            rep = booked.update_user(change.booked_id, data)
+            log.info(f"Response {rep}")
+            return change.booked_id, change.desc
+
+        booked_id: Any = change.booked_id
+        if change.action == MemberChange.CREATE:
+            u = booked.create_user_as_member(member.fname, member.lname, member.email)
+            if u.get("errors"):
+                for e in u["errors"]:
+                    log.error(e)
+                return (
+                    None,
+                    f"Error(s) setting up Booked user for {member.name}: "
+                    f"{u.get('errors')}",
+                )
+            booked_id = u["userId"]
+            # Retries past this point must not create a second user
+            change.action, change.booked_id = MemberChange.ASSOCIATE, booked_id
+
+        neon.set_booked_user_id(member.neon_id, booked_id)
+        return (
+            int(booked_id),
+            f"Booked #{booked_id} associated with neon #{member.neon_id} {member.name}",
+        )
+
+    def _apply_member_change_with_retry(self, change: MemberChange):
+        for i in range(MEMBER_SYNC_ATTEMPTS):
+            try:
+                return self._apply_member_change(change)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if change.action == MemberChange.CREATE:
+                    # Creation isn't idempotent; a failed request may still
+                    # have created the user, so leave it for the next sync.
+                    return (
+                        None,
+                        f"Error creating Booked user for {change.member.name}: {e}",
+                    )
+                if i == MEMBER_SYNC_ATTEMPTS - 1:
+                    return None, f"Error applying '{change}': {e}"
+                log.warning(f"Retrying '{change}' after error: {e}")
+                time.sleep(MEMBER_SYNC_RETRY_DELAY_SEC * 2**i)
+        raise RuntimeError("unreachable")
+
+    def _apply_member_plan(
+        self, plan: MemberSyncPlan, workers, pct
+    ) -> tuple[list[str], list[MemberChange]]:
+        """Applies planned changes concurrently, returning summary lines and
+        the changes that failed. Booked IDs of created and associated users
+        are added to `plan.member_ids`."""
+        summary = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._apply_member_change_with_retry, c): c
+                for c in plan.changes
+            }
+            for i, f in enumerate(as_completed(futures)):
+                pct[2] = (i + 1) / len(futures)
+                booked_id, line = f.result()
+                if booked_id is None:  # Only failed changes have no ID
+                    failed.append(futures[f])
+                    log.error(line)
+                else:
+                    plan.member_ids.add(booked_id)
+                    log.info(line)
+                summary.append(line)
+        return summary, failed
+
     @command(
         arg(
             "--apply",
@@ -259,15 +462,22 @@ class Commands:
             "--include",
             help="CSV of email addresses of users to strictly include",
         ),
+        arg(
+            "--workers",
+            help="Max number of changes to apply concurrently",
+            type=int,
+            default=8,
+        ),
     )
-    def sync_booked_members(
-        self, args, pct
-    ):  # pylint: disable=too-many-statements, too-many-locals, too-many-branches
+    def sync_booked_members(self, args, pct):
         """Ensures that members are able to reserve tools, and non-members are not.
 
         Members are authed to Booked using their first name, last name, and email address.
         See https://www.bookedscheduler.com/help/oauth/oauth-configuration/
         We must make sure these fields match between Neon and Booked.
+
+        Changes are planned up front, then applied concurrently (with retries)
+        if --apply is set; otherwise the plan is printed.
         """
 
         if args.exclude is not None:
@@ -283,110 +493,57 @@ class Commands:
         neon_members = self._fetch_neon_sources()
         pct[0] = 1
         booked_user_data = self._fetch_booked_sources()
-        email_to_booked_user = {
-            user.email.lower(): user for user in booked_user_data.values()
-        }
         pct[1] = 1
 
-        summary = []
-        booked_member_ids = set()
-        for i, member in enumerate(neon_members):
-            pct[2] = i / len(neon_members)
-            member_email_lower = member.email.lower()
-            if member_email_lower in args.exclude:
-                log.info(f"Skipping excluded {member.email}")
-                continue
-            if args.include and member_email_lower not in args.include:
-                log.info(f"Skipping not explicitly included {member.email}")
-                continue
-
-            booked_id = member.booked_id
-            if not booked_id:
-                log.info(
-                    f"Active member {member.name} ({member.email}) with no Booked User ID"
-                )
-                existing_booked_user = email_to_booked_user.get(member_email_lower)
-                if existing_booked_user:
-                    log.info(
-                        f"Existing booked user with email {member.email}; associating that"
-                    )
-                    booked_id = existing_booked_user.id
-                elif args.apply:
-                    u = booked.create_user_as_member(
-                        member.fname, member.lname, member.email
-                    )
-                    if u.get("errors"):
-                        for e in u["errors"]:
-                            log.error(e)
-                        summary.append(
-                            f"Error(s) setting up Booked user for {member.name}: "
-                            f"{u.get('errors')}"
-                        )
-                        continue
-                    booked_id = u["userId"]
-
-                if booked_id and args.apply:
-                    booked_member_ids.add(int(booked_id))
-                    neon.set_booked_user_id(member.neon_id, booked_id)
-                    summary.append(
-                        f"Booked #{booked_id} associated with neon #{member.neon_id} "
-                        f"{member.name}"
-                    )
-                    log.info(summary[-1])
-            else:
-                existing_booked_user = booked_user_data.get(booked_id)
-                if not existing_booked_user:
-                    raise RuntimeError(
-                        f"Neon user {member.name} has invalid booked user ID {booked_id}"
-                    )
-                booked_member_ids.add(booked_id)
-                # Check if the booked user data matches the neon member data
-                booked_user_tuple = (
-                    existing_booked_user.first_name,
-                    existing_booked_user.last_name,
-                    existing_booked_user.email,
-                )
-                member_tuple = (member.fname, member.lname, member.email.lower())
-                if booked_user_tuple != member_tuple:
-                    summary.append(
-                        f"Update booked #{booked_id}: {booked_user_tuple} -> {member_tuple}"
-                    )
-                    log.info(summary[-1])
-                    if args.apply:
-                        data = booked.get_user(booked_id)
-                        if not data or not data.get("id"):
-                            raise RuntimeError(
-                                f"Failed to get user data for {booked_id}: {data}"
-                            )
-                        data["firstName"] = member.fname
-                        data["lastName"] = member.lname
-                        data["emailAddress"] = member.email
-                        rep = booked.update_user(booked_id, data)
-                        log.info(f"Response {rep}")
+        plan = self._plan_member_sync(
+            neon_members, booked_user_data, args.exclude, args.include
+        )
+        log.info(f"Planned {len(plan.changes)} change(s)")
+        failed: list[MemberChange] = []
+        if args.apply:
+            summary, failed = self._apply_member_plan(plan, args.workers, pct)
+        else:
+            summary = [f"(dry run) {c}" for c in plan.changes]
+            pct[2] = 1
 
         pct[3] = 0.5
         current_member_user_ids = {
             int(u.split("/")[-1]) for u in booked.get_members_group()["users"]
         }
+        # Users whose association failed are missing from plan.member_ids;
+        # keep whatever group membership they already have until a later
+        # sync succeeds, rather than removing them now.
+        held_ids = {
+            int(c.booked_id)
+            for c in failed
+            if c.action != MemberChange.UPDATE and c.booked_id is not None
+        } & current_member_user_ids
+        member_ids = plan.member_ids | held_ids
         added_member_strings = [
             f"#{user.id} {user.full_name} ({user.email})"
-            for user_id in booked_member_ids - current_member_user_ids
+            for user_id in member_ids - current_member_user_ids
             if (user := booked_user_data.get(user_id))
         ]
         removed_member_strings = [
             f"#{user.id} {user.full_name} ({user.email})"
-            for user_id in current_member_user_ids - booked_member_ids
+            for user_id in current_member_user_ids - member_ids
             if (user := booked_user_data.get(user_id))
         ]
-        if args.apply and booked_member_ids:
-            log.info(str(booked.assign_members_group_users(list(booked_member_ids))))
+        if args.apply and member_ids:
+            log.info(str(booked.assign_members_group_users(sorted(member_ids))))
 
         if len(added_member_strings) + len(removed_member_strings) > 0:
             summary.append(
-                f"Assigning Members group to {len(booked_member_ids)} "
+                f"Assigning Members group to {len(member_ids)} "
                 + f"booked users (added {added_member_strings}, removed {removed_member_strings})"
             )
             log.info(summary[-1])
+        if failed:
+            summary.append(
+                f"{len(failed)} of {len(plan.changes)} change(s) failed; "
+                f"Members group kept for {len(held_ids)} affected user(s)"
+            )
+            log.error(summary[-1])
 
         if len(summary) > 0:
             print_yaml(
@@ -401,6 +558,10 @@ class Commands:
             )
         else:
             print_yaml([])
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} Booked member change(s) failed; rerun to retry them"
+            )
 
     @command(
         arg(
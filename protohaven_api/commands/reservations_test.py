@@ -1,10 +1,12 @@
 # pylint: skip-file
 """Test reservation commands"""
 import datetime
+import time
 
 import pytest
 
 from protohaven_api.commands import reservations as r
+from protohaven_api.integrations.cronicle import Progress
 from protohaven_api.testing import d, mkcli
 
 
@@ -258,6 +260,52 @@ def test_sync_reservable_tools_extra_resources_raise(mocker):
         c.sync_reservable_tools([], mocker.MagicMock())
 
 
+def test_sync_reservable_tools_pushes_only_changed(mocker):
+    """Resources come from one bulk fetch; only changed ones are pushed, and
+    each phase is timed"""
+    c = r.Commands()
+    c._area_colors.cache_clear()
+    mocker.patch.object(r, "airtable")
+    mocker.patch.object(r, "booked")
+    mocker.patch.object(r, "print_yaml")
+    mocker.patch.object(r.Commands, "_sync_booked_permissions")
+    mocker.patch.object(
+        r.Commands,
+        "_sync_reservable_tool",
+        side_effect=lambda rsc, t: (
+            rsc,
+            ["change"] if rsc["resourceId"] % 2 else [],
+        ),
+    )
+    r.airtable.get_areas.return_value = [{"fields": {"Name": "Woodshop"}}]
+    r.booked.get_resource_group_map.return_value = {"Woodshop": 1}
+    r.booked.get_resources.return_value = [
+        {"resourceId": i, "name": f"Woodshop - T{i}"} for i in range(10)
+    ]
+    r.airtable.get_tools.return_value = [
+        {"id": f"t{i}", "fields": {"Reservable": True, "BookedResourceId": i}}
+        for i in range(10)
+    ]
+    r.booked.get_resource_id_to_name_map.return_value = {}
+
+    pct = Progress()
+    c.sync_reservable_tools(["--apply", "--workers=4"], pct)
+
+    r.booked.get_resources.assert_called_once()
+    r.booked.get_resource.assert_not_called()
+    assert sorted(
+        call.args[0]["resourceId"] for call in r.booked.update_resource.call_args_list
+    ) == [1, 3, 5, 7, 9]
+    assert set(pct.timings.keys()) == {
+        "groups",
+        "catalog",
+        "diff",
+        "push",
+        "permissions",
+        "verify",
+    }
+
+
 def test_fetch_neon_sources(mocker):
     """Only members with email addresses and tool reservation rights are returned"""
     c = r.Commands()
@@ -372,7 +420,8 @@ def test_sync_booked_members_create_user_success(mocker):
 
 
 def test_sync_booked_members_create_user_errors(mocker):
-    """Errors returned while creating a Booked user are summarized and skipped"""
+    """Errors returned while creating a Booked user are summarized, the
+    Members group is still assigned, and the job fails"""
     c = r.Commands()
     mocker.patch.object(r, "booked")
     mocker.patch.object(r, "neon")
@@ -385,14 +434,20 @@ def test_sync_booked_members_create_user_errors(mocker):
     member.neon_id = "n1"
     member.fname = "A"
     member.lname = "X"
-    c._fetch_neon_sources = mocker.MagicMock(return_value=[member])
-    c._fetch_booked_sources = mocker.MagicMock(return_value={})
+    c._fetch_neon_sources = mocker.MagicMock(
+        return_value=[member, _member(mocker, 2, 2)]
+    )
+    c._fetch_booked_sources = mocker.MagicMock(
+        return_value={2: _booked_user(mocker, 2, fname="New")}
+    )
     r.booked.create_user_as_member.return_value = {"errors": ["bad request"]}
     r.booked.get_members_group.return_value = {"users": []}
 
-    c.sync_booked_members(["--apply"], mocker.MagicMock())
+    with pytest.raises(RuntimeError, match="1 Booked member change"):
+        c.sync_booked_members(["--apply"], mocker.MagicMock())
     r.neon.set_booked_user_id.assert_not_called()
-    r.booked.assign_members_group_users.assert_not_called()
+    r.booked.assign_members_group_users.assert_called_once_with([2])
+    assert "Error(s) setting up Booked user for A X" in str(r.print_yaml.call_args)
 
 
 def test_sync_booked_members_invalid_booked_id(mocker):
@@ -446,6 +501,155 @@ def test_sync_booked_members_updates_mismatched_user(mocker):
     r.booked.assign_members_group_users.assert_called_once_with([1])
 
 
+def _member(mocker, i, booked_id=None, fname="New"):
+    m = mocker.MagicMock()
+    m.email = f"m{i}@x.com"
+    m.name = f"{fname} M{i}"
+    m.booked_id = booked_id
+    m.neon_id = f"n{i}"
+    m.fname = fname
+    m.lname = f"M{i}"
+    return m
+
+
+def _booked_user(mocker, i, fname="Old"):
+    u = mocker.MagicMock()
+    u.id = i
+    u.first_name = fname
+    u.last_name = f"M{i}"
+    u.email = f"m{i}@x.com"
+    return u
+
+
+def test_sync_booked_members_dry_run_prints_plan(mocker):
+    """Without --apply, every planned change is printed and nothing is written"""
+    c = r.Commands()
+    mocker.patch.object(r, "booked")
+    mocker.patch.object(r, "neon")
+    mocker.patch.object(r, "print_yaml")
+    c._fetch_neon_sources = mocker.MagicMock(
+        return_value=[_member(mocker, 1), _member(mocker, 2), _member(mocker, 3, 3)]
+    )
+    c._fetch_booked_sources = mocker.MagicMock(
+        return_value={2: _booked_user(mocker, 2), 3: _booked_user(mocker, 3)}
+    )
+    r.booked.get_members_group.return_value = {"users": ["/Users/3"]}
+
+    c.sync_booked_members([], mocker.MagicMock())
+    r.booked.create_user_as_member.assert_not_called()
+    r.booked.update_user.assert_not_called()
+    r.neon.set_booked_user_id.assert_not_called()
+    r.booked.assign_members_group_users.assert_not_called()
+    changes = r.print_yaml.call_args.args[0][0].body
+    assert "(dry run) Create Booked user for New M1 (m1@x.com)" in changes
+    assert "(dry run) Associate Booked #2 with neon #n2 New M2" in changes
+    assert "(dry run) Update booked #3" in changes
+
+
+def test_sync_booked_members_retries_failed_change(mocker):
+    """Transient failures are retried; creation is never repeated"""
+    c = r.Commands()
+    mocker.patch.object(r, "booked")
+    mocker.patch.object(r, "neon")
+    mocker.patch.object(r, "print_yaml")
+    mocker.patch.object(r, "MEMBER_SYNC_RETRY_DELAY_SEC", 0)
+    c._fetch_neon_sources = mocker.MagicMock(
+        return_value=[_member(mocker, 1), _member(mocker, 2, 2)]
+    )
+    c._fetch_booked_sources = mocker.MagicMock(
+        return_value={2: _booked_user(mocker, 2)}
+    )
+    r.booked.create_user_as_member.return_value = {"userId": 7}
+    r.neon.set_booked_user_id.side_effect = [RuntimeError("timeout"), None]
+    r.booked.get_user.return_value = {"id": 2}
+    r.booked.update_user.side_effect = [RuntimeError("timeout"), {}]
+    r.booked.get_members_group.return_value = {"users": []}
+
+    c.sync_booked_members(["--apply"], mocker.MagicMock())
+    r.booked.create_user_as_member.assert_called_once()
+    assert r.neon.set_booked_user_id.call_count == 2
+    assert r.booked.update_user.call_count == 2
+    r.booked.assign_members_group_users.assert_called_once_with([2, 7])
+
+
+def test_sync_booked_members_failed_change_keeps_group(mocker):
+    """When a change fails after all retries, the Members group is still
+    assigned, users whose association failed keep their membership, and the
+    job fails"""
+    c = r.Commands()
+    mocker.patch.object(r, "booked")
+    mocker.patch.object(r, "neon")
+    mocker.patch.object(r, "print_yaml")
+    mocker.patch.object(r, "MEMBER_SYNC_RETRY_DELAY_SEC", 0)
+    c._fetch_neon_sources = mocker.MagicMock(
+        return_value=[_member(mocker, 1, 1), _member(mocker, 2)]
+    )
+    c._fetch_booked_sources = mocker.MagicMock(
+        return_value={
+            1: _booked_user(mocker, 1),
+            2: _booked_user(mocker, 2),
+            3: _booked_user(mocker, 3),
+        }
+    )
+    r.booked.get_user.return_value = {"id": 1}
+    r.booked.update_user.side_effect = RuntimeError("timeout")
+    r.neon.set_booked_user_id.side_effect = RuntimeError("timeout")
+    r.booked.get_members_group.return_value = {
+        "users": ["/users/1", "/users/2", "/users/3"]
+    }
+
+    with pytest.raises(RuntimeError, match="2 Booked member change"):
+        c.sync_booked_members(["--apply"], mocker.MagicMock())
+    assert r.booked.update_user.call_count == r.MEMBER_SYNC_ATTEMPTS
+    # #2's association failed, so it is held in the group; #3 is removed
+    r.booked.assign_members_group_users.assert_called_once_with([1, 2])
+    changes = r.print_yaml.call_args.args[0][0].body
+    assert "2 of 2 change(s) failed; Members group kept for 1" in changes
+
+
+@pytest.mark.benchmark
+def test_sync_booked_members_throughput_benchmark(mocker):
+    """Benchmark applying a large plan against slow mock Booked and Neon
+    backends, serially and concurrently"""
+    n = 200
+    latency = 0.002
+
+    def slow(rv):
+        def fn(*_args, **_kwargs):
+            time.sleep(latency)
+            return rv
+
+        return fn
+
+    c = r.Commands()
+    mocker.patch.object(r, "booked")
+    mocker.patch.object(r, "neon")
+    mocker.patch.object(r, "print_yaml")
+    c._fetch_neon_sources = mocker.MagicMock(
+        return_value=[_member(mocker, i, i) for i in range(1, n + 1)]
+    )
+    c._fetch_booked_sources = mocker.MagicMock(
+        return_value={i: _booked_user(mocker, i) for i in range(1, n + 1)}
+    )
+    r.booked.get_user.side_effect = slow({"id": 1})
+    r.booked.update_user.side_effect = slow({})
+    r.booked.get_members_group.return_value = {"users": []}
+
+    results = {}
+    for workers in (1, 8):
+        r.booked.update_user.reset_mock()
+        t0 = time.perf_counter()
+        c.sync_booked_members(["--apply", f"--workers={workers}"], mocker.MagicMock())
+        results[workers] = time.perf_counter() - t0
+        assert r.booked.update_user.call_count == n
+    print(
+        f"Applied {n} member updates: "
+        + ", ".join(
+            f"{w} worker(s) {s:.3f}s ({n / s:.0f}/s)" for w, s in results.items()
+        )
+    )
+
+
 def test_cleanup_orphaned_class_reservations_no_classes(mocker):
     """Cleanup refuses to run when no published classes were found"""
     c = r.Commands()
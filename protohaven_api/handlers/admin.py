@@ -6,6 +6,7 @@ from typing import TypedDict, cast
 
 from flask import Blueprint, Response, request, session
 
+from protohaven_api import broadcast
 from protohaven_api.automation.membership import clearances as mclearance
 from protohaven_api.automation.membership import membership as memauto
 from protohaven_api.config import get_config
@@ -48,6 +49,18 @@ def admin_discord_webhook():
     return "Sent (non-blocking)"
 
 
+@page.route("/admin/metrics", methods=["GET"])
+@require_login_role(Role.AUTOMATION, redirect_to_login=False)
+def admin_metrics():
+    """Reports freshness and size of in-process caches, for monitoring"""
+    return {
+        "airtable_cache": airtable.cache.metrics(),
+        "mqtt": mqtt_client.metrics() if (mqtt_client := mqtt.get()) else None,
+        "websockets": broadcast.metrics(),
+        "discord_mention_resolution": comms.mention_resolution.summary(),
+    }
+
+
 class ClearanceResult(TypedDict):
     """Result of attempting to apply clearance data
     for an individual account.
@@ -27,6 +27,24 @@ def test_user_clearances_notifies_discord(mocker, client):
         raise RuntimeError(f"Wanted OK request, got {rep.status_code} {rep.text}")
 
 
+def test_admin_metrics(mocker, client):
+    """Cache metrics are reported as JSON"""
+    mocker.patch.object(rbac, "is_enabled", return_value=False)
+    mocker.patch.object(
+        a.airtable.cache, "metrics", return_value={"violations": {"rows": 1}}
+    )
+    mocker.patch.object(a.mqtt, "get", return_value=None)
+    mocker.patch.object(a.broadcast, "metrics", return_value={"ws": {}})
+    mocker.patch.object(a.comms, "mention_resolution", a.comms.LatencyStats())
+    rep = client.get("/admin/metrics")
+    assert rep.json == {
+        "airtable_cache": {"violations": {"rows": 1}},
+        "mqtt": None,
+        "websockets": {"ws": {}},
+        "discord_mention_resolution": {"count": 0},
+    }
+
+
 def test_user_clearances(mocker, client):
     """Test the user_clearances function"""
     mocker.patch.object(
@@ -7,9 +7,18 @@ import logging
 import time
 from typing import Any
 
-from flask import Blueprint, Response, current_app, redirect, request, session
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    has_request_context,
+    redirect,
+    request,
+    session,
+)
 from flask_sock import Sock
 
+from protohaven_api import broadcast
 from protohaven_api.automation.classes import events as eauto
 from protohaven_api.automation.membership import sign_in
 from protohaven_api.config import get_config, safe_parse_datetime, tznow
@@ -85,38 +94,94 @@ def welcome_sock(ws):
     return result
 
 
-def welcome_neon_ws(ws):  # pylint: disable=too-many-statements
+# Time of the most recent NFC device heartbeat, shared by all welcome_neon_ws clients
+nfc_last_heartbeat: float | None = None  # pylint: disable=invalid-name
+
+
+def _forward_to_welcome(topic: str, data: dict):
+    """Forward MQTT message to every connected Svelte frontend"""
+    welcome_broadcaster.publish({"origin": topic, "data": data})
+
+
+def _forward_signin(topic: str, data: dict):
+    """Forward a badge scan to a single Svelte frontend; each page that
+    receives it submits a sign-in, so fanning out would sign in twice"""
+    if not welcome_broadcaster.publish_one({"origin": topic, "data": data}):
+        log.warning(f"No welcome page accepted sign-in message {data}")
+
+
+def _on_nfc_heartbeat(_topic: str, data: dict):
+    """Track NFC device heartbeats"""
+    global nfc_last_heartbeat  # pylint: disable=global-statement
+    nfc_last_heartbeat = time.time()
+    log.debug(f"NFC heartbeat received: {data}")
+
+
+def _on_nfc_written(topic: str, data: dict):
+    """Handle NFC enrollment result: forward to frontend AND update Neon"""
+    _forward_to_welcome(topic, data)
+    _store_nfc_write_info(data)
+
+
+def _welcome_mqtt_callbacks():
+    """(topic, callback, as_group) for each MQTT subscription of the welcome page"""
+    return [
+        (get_config("mqtt/neon_signin_topic"), _forward_signin, True),
+        (get_config("mqtt/neon_toast_topic"), _forward_to_welcome, True),
+        # Heartbeat is delivered to all connected clients
+        (get_config("mqtt/nfc_heartbeat_topic"), _on_nfc_heartbeat, False),
+        # NFC writes are sent to all connected clients; only those
+        # in an enrollment flow actually use the message
+        (get_config("mqtt/nfc_written_topic"), _on_nfc_written, False),
+    ]
+
+
+def _subscribe_welcome():
+    mqtt_client = mqtt.get()
+    for topic, cb, as_group in _welcome_mqtt_callbacks():
+        mqtt_client.register_topic_callback(topic, cb, as_group=as_group)
+    log.info("Registered welcome_neon_ws listeners")
+
+
+def _unsubscribe_welcome():
+    mqtt_client = mqtt.get()
+    if not mqtt_client:
+        return
+    for topic, cb, as_group in _welcome_mqtt_callbacks():
+        mqtt_client.unregister_topic_callback(topic, cb, as_group=as_group)
+    log.info("Unregistered welcome_neon_ws listeners")
+
+
+# MQTT messages are subscribed to once while any welcome page is connected.
+# Sign-in messages go to one page; all others are fanned out to each page
+# through its own bounded queue.
+welcome_broadcaster = broadcast.Broadcaster(
+    "welcome_neon_ws", on_first=_subscribe_welcome, on_last=_unsubscribe_welcome
+)
+
+
+def welcome_neon_ws(ws):
     """Persistent websocket that listens for Neon ID badge scans and toast
     notifications via MQTT. Messages are forwarded to the Svelte frontend.
     Also tracks NFC device heartbeat and MQTT broker status, sending periodic
     status updates to the client.
 
-    Note: mqtt.py subscribes using MQTTv5 "subscription groups", so messages
-    only send to a single subscribed client.
+    Badge scans are delivered to exactly one connected page (the most
+    recently connected), since the page submits a sign-in for each scan it
+    receives. Toast, NFC and status messages go to every connected page.
     """
     log.info("welcome_neon_ws init")
-    neon_signin_topic = get_config("mqtt/neon_signin_topic")
-    neon_toast_topic = get_config("mqtt/neon_toast_topic")
-    nfc_heartbeat_topic = get_config("mqtt/nfc_heartbeat_topic")
-    nfc_written_topic = get_config("mqtt/nfc_written_topic")
-
-    # Track NFC device heartbeat
-    nfc_last_heartbeat = None
-
-    def handle_message(topic: str, data: dict):
-        """Forward MQTT message to the Svelte frontend"""
-        ws.send(json.dumps({"origin": topic, "data": data}))
-
-    def handle_nfc_heartbeat(_topic: str, data: dict):
-        """Track NFC device heartbeats"""
-        nonlocal nfc_last_heartbeat
-        nfc_last_heartbeat = time.time()
-        log.debug(f"NFC heartbeat received: {data}")
+    mqtt_client = mqtt.get()
+    if not mqtt_client:
+        log.info("MQTT client not set up; aborting")
+        return Response("MQTT client not set up", status=500)
 
-    def handle_nfc_written(topic: str, data: dict):
-        """Handle NFC enrollment result: forward to frontend AND update Neon"""
-        handle_message(topic, data)
-        _store_nfc_write_info(data)
+    # Only the latest status update matters if the client falls behind
+    conn = welcome_broadcaster.connect(
+        ws,
+        name=request.remote_addr if has_request_context() else "",
+        coalesce_key=lambda m: m.get("type") if m.get("type") == "status" else None,
+    )
 
     def send_status():
         """Send NFC/MQTT connection status to the client"""
@@ -124,37 +189,18 @@ def welcome_neon_ws(ws):  # pylint: disable=too-many-statements
         nfc_age = (
             None if nfc_last_heartbeat is None else time.time() - nfc_last_heartbeat
         )
-        ws.send(
-            json.dumps(
-                {
-                    "type": "status",
-                    "server_mqtt_connected": bool(mqtt_connected),
-                    "nfc_heartbeat_age_sec": nfc_age,
-                }
-            )
+        conn.send(
+            {
+                "type": "status",
+                "server_mqtt_connected": bool(mqtt_connected),
+                "nfc_heartbeat_age_sec": nfc_age,
+            }
         )
 
-    mqtt_client = mqtt.get()
-    if mqtt_client:
-        mqtt_client.register_topic_callback(neon_signin_topic, handle_message)
-        mqtt_client.register_topic_callback(neon_toast_topic, handle_message)
-        # Heartbeat is delivered to all connected clients
-        mqtt_client.register_topic_callback(
-            nfc_heartbeat_topic, handle_nfc_heartbeat, as_group=False
-        )
-        # NFC writes are sent to all connected clients; only those
-        # in an enrollment flow actually use the message
-        mqtt_client.register_topic_callback(
-            nfc_written_topic, handle_nfc_written, as_group=False
-        )
-        log.info("Registered welcome_neon_ws listeners")
-    else:
-        log.info("MQTT client not set up; aborting")
-        return Response("MQTT client not set up", status=500)
     try:
         # Send initial status
         send_status()
-        while True:
+        while not conn.closed:
             data = ws.receive(timeout=5)
             if data is None:
                 # Timeout — send periodic status update
@@ -162,18 +208,11 @@ def welcome_neon_ws(ws):  # pylint: disable=too-many-statements
                 continue
             msg = json.loads(data)
             if msg.get("type") == "ping":
-                ws.send(json.dumps({"type": "pong"}))
+                conn.send({"type": "pong"})
     finally:
-        if mqtt_client:
-            mqtt_client.unregister_topic_callback(neon_signin_topic, handle_message)
-            mqtt_client.unregister_topic_callback(neon_toast_topic, handle_message)
-            mqtt_client.unregister_topic_callback(
-                nfc_heartbeat_topic, handle_nfc_heartbeat, as_group=False
-            )
-            mqtt_client.unregister_topic_callback(
-                nfc_written_topic, handle_nfc_written, as_group=False
-            )
+        conn.close(drain_sec=1.0)
     log.info("Neon sign-in WS listener ended")
+    return None
 
 
 def setup_sock_routes(app):
@@ -456,31 +495,13 @@ def get_shop_events():
 @page.route("/events/reservations")
 def get_event_reservations():
     """Show reservations for the rest of the day."""
-    reservations = []
     now = tznow()
-
-    for r in booked.cache["reservations"]:
-        start = r["startDate"]
-        end = r["endDate"]
-        open_time = now.replace(hour=10, minute=0, second=0, microsecond=0)
-        close_time = now.replace(hour=22, minute=0, second=0, microsecond=0)
-        tool_area, tool_name = [t.strip() for t in r["resourceName"].split("-", 1)]
-
-        # We specifically want to include reservations
-        # that have started but are still active.
-        # We do NOT want reservations which are already over.
-        if end > now:
-            reservations.append(
-                {
-                    "ts": start.isoformat(),
-                    "start": (
-                        start.strftime("%-I:%M %p") if start > open_time else "open"
-                    ),
-                    "end": end.strftime("%-I:%M %p") if end < close_time else "close",
-                    "name": f"{r['firstName']} {r['lastName']}",
-                    "resource": tool_name,
-                    "id": r["referenceNumber"],
-                    "area": tool_area,
-                }
-            )
+    # We specifically want to include reservations
+    # that have started but are still active.
+    # We do NOT want reservations which are already over.
+    reservations = [
+        {**r.as_display(), "ts": r.start.isoformat()}
+        for r in booked.cache.get_views()
+        if r.end > now
+    ]
     return reservations
@@ -301,12 +301,9 @@ def test_get_event_reservations(mocker, client):
             "referenceNumber": "REF003",
         },
     ]
-    # Create a mock cache object
-    mock_cache = mocker.MagicMock()
-    mock_cache.__getitem__ = mocker.MagicMock(
-        side_effect=lambda key: mock_reservations if key == "reservations" else None
-    )
-    mocker.patch.object(index.booked, "cache", mock_cache)
+    cache = index.booked.ReservationCache()
+    cache.set_reservations(mock_reservations)
+    mocker.patch.object(index.booked, "cache", cache)
 
     # Mock get_tools to return tool-area mappings
     mock_tools = [
@@ -372,6 +369,7 @@ def test_get_event_reservations(mocker, client):
             }
         )
 
+    cache.set_reservations(mock_reservations)
     response = client.get("/events/reservations")
     result = json.loads(response.data.decode("utf8"))
 
@@ -552,29 +550,45 @@ def test_welcome_neon_ws_registers_handles_and_unregisters(mocker):
     mqtt_client.c.is_connected.return_value = True
     mocker.patch.object(index.mqtt, "get", return_value=mqtt_client)
 
+    registered = {}
+
+    def exercise_callbacks():
+        """Exercise each callback captured during registration, while the
+        websocket is connected."""
+        registered.update(
+            {
+                call.args[0]: call.args[1]
+                for call in mqtt_client.register_topic_callback.call_args_list
+            }
+        )
+        registered["signin"]("signin", {"neon_id": "123"})
+        registered["heartbeat"]("heartbeat", {"ok": True})
+        registered["written"](
+            "written", {"neon_id": "123", "timestamp": "2025-01-01", "nfc_id": "abc"}
+        )
+        return json.dumps({"type": "other"})
+
+    received = iter(
+        [
+            lambda: None,
+            lambda: json.dumps({"type": "ping"}),
+            exercise_callbacks,
+        ]
+    )
+
+    def receive(timeout):  # pylint: disable=unused-argument
+        fn = next(received, None)
+        if fn is None:
+            raise RuntimeError("stop")
+        return fn()
+
     ws = mocker.MagicMock()
-    ws.receive.side_effect = [
-        None,
-        json.dumps({"type": "ping"}),
-        json.dumps({"type": "other"}),
-        RuntimeError("stop"),
-    ]
+    ws.receive.side_effect = receive
 
     with pytest.raises(RuntimeError):
         index.welcome_neon_ws(ws)
 
-    registered = {
-        call.args[0]: call.args[1]
-        for call in mqtt_client.register_topic_callback.call_args_list
-    }
     assert set(registered) == set(topics.values())
-
-    # Exercise each callback captured during registration.
-    registered["signin"]("signin", {"neon_id": "123"})
-    registered["heartbeat"]("heartbeat", {"ok": True})
-    registered["written"](
-        "written", {"neon_id": "123", "timestamp": "2025-01-01", "nfc_id": "abc"}
-    )
     store.assert_called_once_with(
         {"neon_id": "123", "timestamp": "2025-01-01", "nfc_id": "abc"}
     )
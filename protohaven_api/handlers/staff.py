@@ -2,14 +2,19 @@
 
 import json
 import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import asdict
 
 import markdown
-from flask import Blueprint, current_app
+from flask import Blueprint, Response, current_app, request
 from flask_sock import Sock
 
-from protohaven_api.automation.reporting import ops_report
-from protohaven_api.config import safe_parse_datetime
+from protohaven_api.automation.reporting import ops_history, ops_report
+from protohaven_api.config import safe_parse_datetime, tz
 from protohaven_api.integrations import comms, gpt
 from protohaven_api.integrations.models import Role
 from protohaven_api.rbac import require_login_role
@@ -18,6 +23,9 @@ page = Blueprint("staff", __name__, template_folder="templates")
 
 log = logging.getLogger("handlers.staff")
 
+SUMMARIZER_WORKERS = 4
+MIN_MESSAGES_TO_SUMMARIZE = 5
+
 
 @page.route("/staff", methods=["GET"])
 @require_login_role(Role.STAFF, Role.BOARD_MEMBER)
@@ -40,6 +48,33 @@ def discord_channels():
     return [c[1] for c in comms.get_member_channels()]
 
 
+@page.route("/staff/ops_history", methods=["GET"])
+@require_login_role(Role.STAFF, Role.BOARD_MEMBER, redirect_to_login=False)
+def ops_history_series():
+    """Returns the ops report values with recorded history"""
+    return ops_history.history.series()
+
+
+@page.route("/staff/ops_history/points", methods=["GET"])
+@require_login_role(Role.STAFF, Role.BOARD_MEMBER, redirect_to_login=False)
+def ops_history_points():
+    """Returns the history of one ops report value over the last `days` days"""
+    now = time.time()
+    try:
+        days = float(request.args.get("days", 90))
+    except ValueError:
+        return Response("Param 'days' must be a number", status=400)
+    if not math.isfinite(days) or days <= 0:
+        return Response("Param 'days' must be positive", status=400)
+    return ops_history.history.query(
+        request.args.get("category"),
+        request.args.get("label"),
+        now - days * ops_history.DAY,
+        now,
+        now=now,
+    )
+
+
 def ops_summary_ws(ws):
     """Fetch data from many places and provide a summary of operational state"""
     log.info("Running ops report")
@@ -50,54 +85,107 @@ def ops_summary_ws(ws):
     ws.close()
 
 
+def _fetch_channel(channel_id, channel_name, start_date, end_date, send):
+    """Fetches a channel's history, streaming each message to the client"""
+    msgs = []
+    for msg in comms.get_channel_history(channel_id, start_date, end_date):
+        msgs.append(msg)
+        send(
+            {
+                "type": "individual",
+                "ref": msg["ref"],
+                "channel": channel_name,
+                "created_at": msg["created_at"].isoformat(),
+                "images": msg["images"],
+                "videos": msg["videos"],
+                "content": msg["content"],
+                "author": msg["author"],
+            }
+        )
+    send({"type": "channel_progress", "channel": channel_name, "fetched": len(msgs)})
+    return msgs
+
+
+def _summarize_channel(channel_id, msgs):
+    """Summarizes a channel's history. Each day is summarized (and cached)
+    on its own, keyed by channel, day and content, so a new message or a
+    shifted date range only summarizes the days that changed. The day
+    summaries are then merged into one for the whole window."""
+    if len(msgs) < MIN_MESSAGES_TO_SUMMARIZE:
+        return (
+            "Too few messages to summarize this channel "
+            f"(want {MIN_MESSAGES_TO_SUMMARIZE}+)"
+        )
+    by_day = defaultdict(list)
+    for m in msgs:
+        by_day[m["created_at"].astimezone(tz).date().isoformat()].append(
+            f"{m['created_at']} {m['author']}: {m['content']}"
+        )
+    days = sorted(by_day)
+    day_summaries = [
+        gpt.summarize_message_history(by_day[day], scope=f"{channel_id}/{day}")
+        for day in days
+    ]
+    if len(day_summaries) == 1:
+        return day_summaries[0]
+    return gpt.merge_summaries(
+        [f"{day}: {summary}" for day, summary in zip(days, day_summaries)],
+        scope=f"{channel_id}/{days[0]}..{days[-1]}",
+    )
+
+
+def _summarize_channels(channels, start_date, end_date, send):
+    """Fetches and summarizes `channels` concurrently, returning summaries
+    keyed by channel ID"""
+    summaries = {}
+    with ThreadPoolExecutor(SUMMARIZER_WORKERS) as pool:
+        fetches = {
+            pool.submit(_fetch_channel, cid, name, start_date, end_date, send): (
+                cid,
+                name,
+            )
+            for cid, name in channels
+        }
+        summarizing = {}
+        for f in as_completed(fetches):
+            cid, _ = fetches[f]
+            summarizing[pool.submit(_summarize_channel, cid, f.result())] = fetches[f]
+        for f in as_completed(summarizing):
+            cid, name = summarizing[f]
+            summaries[cid] = f.result()
+            send(
+                {"type": "channel_summary", "channel": name, "content": summaries[cid]}
+            )
+    return summaries
+
+
 def summarizer_ws(ws):
-    """Fetch discord messages in a given interval of time and summarize them"""
+    """Fetch discord messages in a given interval of time and summarize them.
+    Channels are fetched and summarized concurrently; each channel's
+    progress and summary is sent as soon as it's ready."""
     data = json.loads(ws.receive())
     start_date = safe_parse_datetime(data["start_date"])
     end_date = safe_parse_datetime(data["end_date"])
-    channels = set(data["channels"])
-    channels = {c for c in comms.get_member_channels() if c[1] in channels}
-    summaries = []
-    for channel_id, channel_name in channels:
-        msgs = []
-        for msg in comms.get_channel_history(channel_id, start_date, end_date):
-            msgs.append(msg)
-            ws.send(
-                json.dumps(
-                    {
-                        "type": "individual",
-                        "ref": msg["ref"],
-                        "channel": channel_name,
-                        "created_at": msg["created_at"].isoformat(),
-                        "images": msg["images"],
-                        "videos": msg["videos"],
-                        "content": msg["content"],
-                        "author": msg["author"],
-                    }
-                )
-            )
-        if len(msgs) < 5:
-            summary = "Too few messages to summarize this channel (want 5+)"
-        else:
-            summary = gpt.summarize_message_history(
-                [f"{m['created_at']} {m['author']}: {m['content']}" for m in msgs]
-            )
-        ws.send(
-            json.dumps(
-                {
-                    "type": "channel_summary",
-                    "channel": channel_name,
-                    "content": summary,
-                }
-            )
-        )
-        summaries.append((channel_name, summary))
+    wanted = set(data["channels"])
+    channels = sorted(
+        (c for c in comms.get_member_channels() if c[1] in wanted),
+        key=lambda c: c[1],
+    )
+
+    ws_lock = threading.Lock()
+
+    def send(msg):
+        with ws_lock:
+            ws.send(json.dumps(msg))
+
+    summaries = _summarize_channels(channels, start_date, end_date, send)
 
+    # Channel order is fixed so the final summary's cache key is stable
     final_summary = gpt.summary_summarizer(
-        [f"{name}:\n{summary}\n\n" for name, summary in summaries]
+        [f"{name}:\n{summaries[cid]}\n\n" for cid, name in channels]
     )
     summary_html = markdown.markdown(final_summary)
-    ws.send(json.dumps({"type": "final_summary", "content": summary_html}))
+    send({"type": "final_summary", "content": summary_html})
     log.info("Done")
     ws.close()
 
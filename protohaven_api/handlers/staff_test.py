@@ -0,0 +1,170 @@
+"""Test functions for the staff pages"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from protohaven_api.automation.reporting.ops_report import OpsItem
+from protohaven_api.handlers import staff as s
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.testing import (  # pylint: disable=unused-import
+    d,
+    fixture_client,
+    setup_session,
+)
+
+CHANNELS = [(i, f"chan{i}") for i in range(6)]
+
+
+class FakeWS:
+    """Records messages sent over the websocket"""
+
+    def __init__(self, request):
+        self.request = request
+        self.sent = []
+        self.closed = False
+
+    def receive(self):
+        """Returns the summary request"""
+        return json.dumps(self.request)
+
+    def send(self, msg):
+        """Records a sent message"""
+        self.sent.append(json.loads(msg))
+
+    def close(self):
+        """Marks the socket closed"""
+        self.closed = True
+
+    def of_type(self, typ):
+        """Returns sent messages of the given type"""
+        return [m for m in self.sent if m["type"] == typ]
+
+
+@pytest.fixture(name="summarizer")
+def fixture_summarizer(mocker):
+    """Stubs out Discord with slow channel history fetches and the LLM with
+    the stub summarizer, tracking how often each is called"""
+    mocker.patch.object(s.gpt, "cache", s.gpt.ResultCache(MEMORY))
+    mocker.patch.object(s.comms, "get_member_channels", return_value=CHANNELS)
+    calls = {"history": 0, "llm": 0, "max_concurrent": 0, "concurrent": 0}
+    mu = threading.Lock()
+
+    def history(cid, *_):
+        with mu:
+            calls["history"] += 1
+            calls["concurrent"] += 1
+            calls["max_concurrent"] = max(calls["max_concurrent"], calls["concurrent"])
+        time.sleep(0.05)
+        with mu:
+            calls["concurrent"] -= 1
+        for i in range(cid + 3):
+            yield {
+                "ref": f"{cid}/{i}",
+                "created_at": d(0),
+                "images": [],
+                "videos": [],
+                "content": f"msg {i}",
+                "author": "someone",
+            }
+
+    mocker.patch.object(s.comms, "get_channel_history", side_effect=history)
+    stub = s.gpt._stub_complete  # pylint: disable=protected-access
+
+    def llm(model, directive, content):
+        assert model == s.gpt.STUB_MODEL
+        with mu:
+            calls["llm"] += 1
+        time.sleep(0.05)
+        return stub(directive, content)
+
+    mocker.patch.object(s.gpt, "_complete", side_effect=llm)
+    return calls
+
+
+def _request(channels):
+    return {
+        "start_date": d(-7).isoformat(),
+        "end_date": d(0).isoformat(),
+        "channels": channels,
+    }
+
+
+def test_summarizer_ws_concurrent_and_cached(summarizer):
+    """Channels are fetched concurrently, and a repeat view of the same
+    messages is answered from the summary cache"""
+    ws = FakeWS(_request([n for _, n in CHANNELS]))
+    s.summarizer_ws(ws)
+
+    assert ws.closed
+    assert summarizer["max_concurrent"] > 1
+    assert len(ws.of_type("individual")) == sum(cid + 3 for cid, _ in CHANNELS)
+    assert {m["channel"] for m in ws.of_type("channel_progress")} == {
+        n for _, n in CHANNELS
+    }
+    got = {m["channel"]: m["content"] for m in ws.of_type("channel_summary")}
+    assert got["chan0"].startswith("Too few messages")
+    assert got["chan5"].startswith("Summary of 8 item(s)")
+    assert ws.sent[-1]["type"] == "final_summary"
+    # Channels 2-5 have 5+ messages, plus the final summary
+    assert summarizer["llm"] == 5
+
+    ws2 = FakeWS(_request([n for _, n in CHANNELS]))
+    s.summarizer_ws(ws2)
+    assert summarizer["llm"] == 5
+    assert {m["channel"]: m["content"] for m in ws2.of_type("channel_summary")} == got
+    assert ws2.sent[-1] == ws.sent[-1]
+
+
+def test_summarizer_ws_subset_reuses_channel_summaries(summarizer):
+    """Channel summaries are cached individually, so a different selection
+    of channels only summarizes what's new"""
+    s.summarizer_ws(FakeWS(_request(["chan4", "chan5"])))
+    assert summarizer["llm"] == 3
+    s.summarizer_ws(FakeWS(_request(["chan3", "chan4", "chan5"])))
+    # chan3, plus a new final summary
+    assert summarizer["llm"] == 5
+
+
+def test_summarize_channel_reuses_unchanged_days(summarizer):
+    """Each day is summarized on its own, so a new message only re-summarizes
+    its day (plus the merged window summary)"""
+    msgs = [
+        {"created_at": d(day, 12), "author": "someone", "content": f"msg {i}"}
+        for day in range(3)
+        for i in range(3)
+    ]
+    got = s._summarize_channel(1, msgs)  # pylint: disable=protected-access
+    assert summarizer["llm"] == 4  # 3 days, then the merge
+    assert s._summarize_channel(1, msgs) == got  # pylint: disable=protected-access
+    assert summarizer["llm"] == 4
+
+    msgs.append({"created_at": d(2, 13), "author": "someone", "content": "new"})
+    s._summarize_channel(1, msgs)  # pylint: disable=protected-access
+    assert summarizer["llm"] == 6  # Day 2 and the merge
+
+
+def test_ops_history(mocker, client):
+    """Recorded ops report values can be listed and charted"""
+    setup_session(client)
+    history = mocker.patch.object(
+        s.ops_history, "history", s.ops_history.OpsHistory(MEMORY)
+    )
+    now = time.time()
+    for i in range(3):
+        history.record(
+            [OpsItem(category="Maintenance", label="Overdue", value=str(i))],
+            now - i * s.ops_history.DAY,
+        )
+    assert client.get("/staff/ops_history").json == [
+        {"category": "Maintenance", "label": "Overdue"}
+    ]
+    rep = client.get(
+        "/staff/ops_history/points?category=Maintenance&label=Overdue&days=7"
+    )
+    assert [p["avg"] for p in rep.json] == [2, 1, 0]
+    for days in ("abc", "-1", "nan"):
+        rep = client.get(f"/staff/ops_history/points?category=Maintenance&days={days}")
+        assert rep.status_code == 400
@@ -4,6 +4,8 @@ import datetime
 import json
 import logging
 import re
+import threading
+import time
 import traceback
 import urllib.parse
 from collections import defaultdict
@@ -21,10 +23,12 @@ from protohaven_api.integrations.airtable_base import (
     get_all_records,
     get_all_records_after,
     get_all_records_between,
+    get_all_records_modified_after,
     get_record,
     insert_records,
     update_record,
 )
+from protohaven_api.integrations.data.local_db import LocalDB
 from protohaven_api.integrations.data.warm_cache import WarmDict
 from protohaven_api.integrations.models import (
     AreaID,
@@ -718,14 +722,185 @@ def get_all_tech_bios():
     return list(get_all_records("people", "volunteers_staff"))
 
 
-def get_signins_between(start, end) -> Iterable[SignInEvent | None]:
-    """Fetches all sign-in data between two dates; or after `start` if `end` is None"""
-    if not end:
-        for rec in get_all_records_after("people", "sign_ins", start):
-            yield SignInEvent.from_airtable(rec)
-    else:
-        for rec in get_all_records_between("people", "sign_ins", start, end):
-            yield SignInEvent.from_airtable(rec)
+class SignInStore(LocalDB):
+    """Day-partitioned local copy of the people/sign_ins table.
+
+    Sign-ins for days before today never change, so each closed day is fetched
+    from Airtable once and kept permanently. Today's partition is refetched
+    when queried, at most once every TODAY_REFRESH_SEC. Range queries are
+    answered from indexes on date, email and Neon ID.
+    """
+
+    NAME = "sign_ins"
+    TODAY_REFRESH_SEC = 60
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS days (
+            day TEXT PRIMARY KEY,
+            closed INTEGER NOT NULL,
+            fetched REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sign_ins (
+            id TEXT PRIMARY KEY,
+            day TEXT NOT NULL,
+            created REAL NOT NULL,
+            email TEXT,
+            neon_id TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sign_ins_by_day ON sign_ins(day);
+        CREATE INDEX IF NOT EXISTS sign_ins_by_created ON sign_ins(created);
+        CREATE INDEX IF NOT EXISTS sign_ins_by_email ON sign_ins(email, created);
+        CREATE INDEX IF NOT EXISTS sign_ins_by_neon_id ON sign_ins(neon_id, created);
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        # Days being fetched by some sync; `mu` is only held for database
+        # access, so readers of other days aren't blocked by Airtable requests
+        self._fetching: set[datetime.date] = set()
+        self._fetched = threading.Condition(self.mu)
+
+    @staticmethod
+    def _day_start(day: datetime.date) -> datetime.datetime:
+        return datetime.datetime(day.year, day.month, day.day, tzinfo=tz)
+
+    def _ingest(self, days: list[datetime.date], recs, closed: bool):
+        """Replaces the partitions for `days` with `recs`"""
+        keys = {day.isoformat() for day in days}
+        rows = []
+        for rec in recs:
+            evt = SignInEvent.from_airtable(rec)
+            created = evt.created if evt else None
+            if created is None:
+                continue
+            day = created.astimezone(tz).date().isoformat()
+            if day not in keys:
+                continue
+            rows.append(
+                (
+                    str(rec["id"]),
+                    day,
+                    created.timestamp(),
+                    evt.email,
+                    str(evt.neon_id) if evt.neon_id else None,
+                    json.dumps(rec),
+                )
+            )
+        now = time.time()
+        with self.mu, self.conn as c:
+            c.executemany("DELETE FROM sign_ins WHERE day=?", [(k,) for k in keys])
+            c.executemany("INSERT OR REPLACE INTO sign_ins VALUES (?,?,?,?,?,?)", rows)
+            c.executemany(
+                "INSERT OR REPLACE INTO days VALUES (?,?,?)",
+                [(k, int(closed), now) for k in keys],
+            )
+        self.log.info(f"Stored {len(rows)} sign-ins across {len(keys)} day(s)")
+
+    def _known(self, first: datetime.date, last: datetime.date):
+        return {
+            datetime.date.fromisoformat(day): (bool(closed), fetched)
+            for day, closed, fetched in self.execute(
+                "SELECT day, closed, fetched FROM days WHERE day BETWEEN ? AND ?",
+                (first.isoformat(), last.isoformat()),
+            )
+        }
+
+    def sync(self, start: datetime.datetime, end: datetime.datetime):
+        """Fetches any days in [start, end] that aren't already stored locally.
+        Days already being fetched by another sync are waited on rather than
+        fetched twice."""
+        today = tznow().date()
+        first = start.astimezone(tz).date()
+        last = min(end.astimezone(tz).date(), today)
+        with self.mu:
+            while True:
+                known = self._known(first, last)
+                missing = []
+                day = first
+                while day <= last and day < today:
+                    if not known.get(day, (False, 0))[0]:
+                        missing.append(day)
+                    day += datetime.timedelta(days=1)
+                refresh_today = (
+                    first <= today <= last
+                    and time.time() - known.get(today, (False, 0))[1]
+                    >= self.TODAY_REFRESH_SEC
+                )
+                claim = set(missing) | ({today} if refresh_today else set())
+                if not claim & self._fetching:
+                    break
+                self._fetched.wait()
+            self._fetching |= claim
+
+        try:
+            # Closed days are fetched in contiguous runs, one request per run
+            run: list[datetime.date] = []
+            for day in missing:
+                if run and day != run[-1] + datetime.timedelta(days=1):
+                    self._fetch_closed(run)
+                    run = []
+                run.append(day)
+            if run:
+                self._fetch_closed(run)
+
+            if refresh_today:
+                self._ingest(
+                    [today],
+                    get_all_records_after("people", "sign_ins", self._day_start(today)),
+                    closed=False,
+                )
+        finally:
+            with self.mu:
+                self._fetching -= claim
+                self._fetched.notify_all()
+
+    def _fetch_closed(self, days: list[datetime.date]):
+        self._ingest(
+            days,
+            get_all_records_between(
+                "people",
+                "sign_ins",
+                self._day_start(days[0]),
+                self._day_start(days[-1] + datetime.timedelta(days=1)),
+            ),
+            closed=True,
+        )
+
+    def query(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime | None,
+        email: str | None = None,
+        neon_id: str | None = None,
+    ) -> list[SignInEvent]:
+        """Returns sign-ins between `start` and `end` (now if None), optionally
+        filtered by email and/or Neon ID, oldest first"""
+        end = end or tznow()
+        self.sync(start, end)
+        sql = "SELECT data FROM sign_ins WHERE created BETWEEN ? AND ?"
+        params: list[Any] = [start.timestamp(), end.timestamp()]
+        if email is not None:
+            sql += " AND email=?"
+            params.append(email.strip().lower())
+        if neon_id is not None:
+            sql += " AND neon_id=?"
+            params.append(str(neon_id))
+        sql += " ORDER BY created"
+        return [
+            SignInEvent.from_airtable(json.loads(data))
+            for (data,) in self.execute(sql, params)
+        ]
+
+
+signin_store = SignInStore()
+
+
+def get_signins_between(
+    start, end, email=None, neon_id=None
+) -> Iterable[SignInEvent | None]:
+    """Fetches all sign-in data between two dates; or after `start` if `end` is None.
+    Results are served from the local `signin_store`."""
+    yield from signin_store.query(start, end, email=email, neon_id=neon_id)
 
 
 def insert_simple_survey_response(announcement_id, email, neon_id, response):
@@ -749,10 +924,14 @@ def get_policy_sections():
     return get_all_records("policy_enforcement", "sections")
 
 
+def _is_violation(row):
+    return bool(row["fields"].get("Onset"))
+
+
 def get_policy_violations():
     """Returns all policy violations"""
     rows = get_all_records("policy_enforcement", "violations")
-    return [v for v in rows if v["fields"].get("Onset")]
+    return [v for v in rows if _is_violation(v)]
 
 
 def open_violation(  # pylint: disable=too-many-arguments,too-many-positional-arguments
@@ -1001,22 +1180,98 @@ def get_storage_agreements() -> Iterable[dict[str, Any]]:
 
 
 class AirtableCache(WarmDict):
-    """Prefetches airtable data for faster lookup"""
+    """Prefetches airtable data for faster lookup.
+
+    Each table is fully reloaded every FULL_REFRESH_PD_SEC, which also drops
+    deleted rows. In between, a cheap check every REFRESH_PD_SEC pulls only
+    the rows created or modified since the previous check.
+    """
 
     NAME = "airtable"
-    REFRESH_PD_SEC = datetime.timedelta(hours=24).total_seconds()
+    REFRESH_PD_SEC = datetime.timedelta(minutes=1).total_seconds()
+    FULL_REFRESH_PD_SEC = datetime.timedelta(hours=24).total_seconds()
     RETRY_PD_SEC = datetime.timedelta(minutes=5).total_seconds()
 
+    # Changes are requested from the start of the previous check, less this
+    # margin to tolerate clock skew with the database server.
+    CHANGE_CHECK_MARGIN = datetime.timedelta(minutes=1)
+
+    def __init__(self):
+        super().__init__()
+        self.loaded: dict[str, datetime.datetime] = {}
+        self.checked: dict[str, datetime.datetime] = {}
+
+    def _sources(self):
+        """Returns (full load fn, base, table, row filter) for each cached table"""
+        return {
+            "announcements": (
+                get_all_announcements,
+                "people",
+                "sign_in_announcements",
+                lambda _: True,
+            ),
+            "violations": (
+                get_policy_violations,
+                "policy_enforcement",
+                "violations",
+                _is_violation,
+            ),
+        }
+
+    def _apply_changes(self, k, changed, keep):
+        """Merges created/modified rows into the cached table `k`"""
+        rows = {r["id"]: r for r in self[k]}
+        for r in changed:
+            if keep(r):
+                rows[r["id"]] = r
+            else:
+                rows.pop(r["id"], None)
+        self[k] = list(rows.values())
+
     def refresh(self):
         """Refresh values; called every REFRESH_PD"""
-        self.log.info("Beginning AirtableCache refresh")
-        self["announcements"] = get_all_announcements()
-        self["violations"] = get_policy_violations()
-        self.log.info(
-            f"AirtableCache refresh complete; {len(self['announcements'])} announcements, "
-            f"{len(self['violations'])} violations loaded. "
-            f"Next update in {self.REFRESH_PD_SEC} seconds"
-        )
+        for k, (load, base, tbl, keep) in self._sources().items():
+            now = tznow()
+            last = self.checked.get(k)
+            if (
+                last is None
+                or (now - self.loaded[k]).total_seconds() >= self.FULL_REFRESH_PD_SEC
+            ):
+                self[k] = load()
+                self.loaded[k] = now
+                self.log.info(f"AirtableCache loaded {len(self[k])} {k}")
+            else:
+                changed = list(
+                    get_all_records_modified_after(
+                        base, tbl, last - self.CHANGE_CHECK_MARGIN
+                    )
+                )
+                if changed:
+                    self._apply_changes(k, changed, keep)
+                    self.log.info(
+                        f"AirtableCache merged {len(changed)} changed {k}; "
+                        f"{len(self[k])} total"
+                    )
+            self.checked[k] = now
+
+    def metrics(self):
+        """Returns the size and staleness (seconds since the cached data was
+        last confirmed current) of each cached table"""
+        now = tznow()
+        return {
+            k: {
+                "rows": len(self.get(k) or []),
+                "staleness_sec": (
+                    (now - self.checked[k]).total_seconds()
+                    if k in self.checked
+                    else None
+                ),
+                "since_full_load_sec": (
+                    (now - self.loaded[k]).total_seconds() if k in self.loaded else None
+                ),
+            }
+            for k in self._sources()
+        }
 
     def violations_for(self, account_id):
         """Check member for storage violations"""
@@ -123,6 +123,22 @@ def get_all_records_after(base, tbl, after_date, field="Created"):
     return get_all_records(base, tbl, params)
 
 
+def get_all_records_modified_after(base, tbl, after_date):
+    """Returns all records in the table that were created or modified after a
+    certain date. Deleted records are not reported."""
+    params = {}
+    if get_connector().db_format() == "nocodb":
+        # Comparison may be at date granularity; callers must tolerate
+        # receiving records that haven't changed since `after_date`.
+        params["where"] = f"(UpdatedAt,ge,exactDate,{after_date.isoformat()})"
+    else:
+        params["filterByFormula"] = (
+            f"IS_AFTER(LAST_MODIFIED_TIME(),'{after_date.isoformat()}')"
+        )
+
+    return get_all_records(base, tbl, params)
+
+
 def insert_records(records, base, tbl):
     """Inserts one or more records into a named table. the "fields" structure is
     automatically applied.
@@ -89,3 +89,20 @@ def test_get_all_records_between_nocodb(mocker):
     _, args, kwargs = a.get_connector().db_request.mock_calls[0]
     assert d(0).isoformat() in kwargs["params"]["where"]
     assert d(1).isoformat() in kwargs["params"]["where"]
+
+
+def test_get_all_records_modified_after(mocker):
+    mocker.patch.object(a, "get_connector")
+    a.get_connector().db_request.return_value = (200, {"records": ["foo"]})
+
+    a.get_connector().db_format.return_value = "airtable"
+    assert a.get_all_records_modified_after("test_base", "test_tbl", d(0)) == ["foo"]
+    _, args, kwargs = a.get_connector().db_request.mock_calls[-1]
+    assert kwargs["params"]["filterByFormula"] == (
+        f"IS_AFTER(LAST_MODIFIED_TIME(),'{d(0).isoformat()}')"
+    )
+
+    a.get_connector().db_format.return_value = "nocodb"
+    assert a.get_all_records_modified_after("test_base", "test_tbl", d(0)) == ["foo"]
+    _, args, kwargs = a.get_connector().db_request.mock_calls[-1]
+    assert kwargs["params"]["where"] == f"(UpdatedAt,ge,exactDate,{d(0).isoformat()})"
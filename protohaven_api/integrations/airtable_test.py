@@ -2,6 +2,8 @@
 import datetime
 import json
 import re
+import threading
+import time
 from collections import namedtuple
 
 import pytest
@@ -9,6 +11,7 @@ import pytest
 from protohaven_api.config import safe_parse_datetime, tz
 from protohaven_api.integrations import airtable as a
 from protohaven_api.integrations import airtable_base as ab
+from protohaven_api.integrations.data.local_db import MEMORY
 from protohaven_api.testing import d, idfn
 
 
@@ -944,17 +947,156 @@ def test_remove_pending_recertification_and_log_notified(mocker):
     assert update.call_count == 2
 
 
-def test_get_signins_between(mocker):
-    """Sign-ins use after-query when end is omitted and between-query otherwise"""
-    mocker.patch.object(a.SignInEvent, "from_airtable", side_effect=lambda r: r)
-    after = mocker.patch.object(a, "get_all_records_after", return_value=["after"])
+def _signin(i, created, email="a@x.com", neon_id=None):
+    fields = {"Created": created.isoformat(), "Email": email}
+    if neon_id:
+        fields["Neon ID"] = neon_id
+    return {"id": str(i), "fields": fields}
+
+
+@pytest.fixture(name="store")
+def fixture_store(mocker):
+    s = a.SignInStore(MEMORY)
+    mocker.patch.object(a, "signin_store", s)
+    mocker.patch.object(a, "tznow", return_value=d(10, 12))
+    return s
+
+
+def test_get_signins_between(mocker, store):
+    """Closed days are fetched in one ranged query, today via an after-query"""
     between = mocker.patch.object(
-        a, "get_all_records_between", return_value=["between"]
+        a,
+        "get_all_records_between",
+        return_value=[_signin(1, d(2, 9)), _signin(2, d(3, 9))],
+    )
+    after = mocker.patch.object(
+        a, "get_all_records_after", return_value=[_signin(3, d(10, 9))]
+    )
+    got = list(a.get_signins_between(d(0), None))
+    assert [s.created for s in got] == [d(2, 9), d(3, 9), d(10, 9)]
+    between.assert_called_once_with("people", "sign_ins", d(0), d(10))
+    after.assert_called_once_with("people", "sign_ins", d(10))
+
+
+def test_signin_store_closed_days_fetched_once(mocker, store):
+    """Past days are kept permanently; only today is refetched"""
+    between = mocker.patch.object(
+        a, "get_all_records_between", return_value=[_signin(1, d(2, 9))]
+    )
+    after = mocker.patch.object(a, "get_all_records_after", return_value=[])
+    assert len(store.query(d(0), d(5))) == 1
+    assert len(store.query(d(1), d(4))) == 1
+    between.assert_called_once()
+    after.assert_not_called()
+
+    # Extending the range only fetches the days not yet stored
+    store.query(d(0), d(7))
+    assert between.call_args.args[2:] == (d(6), d(8))
+
+    # Today is refreshed once the refresh period has passed
+    store.query(d(10), d(11))
+    store.query(d(10), d(11))
+    assert after.call_count == 1
+    mocker.patch.object(
+        a.time, "time", return_value=a.time.time() + store.TODAY_REFRESH_SEC
+    )
+    store.query(d(10), d(11))
+    assert after.call_count == 2
+
+
+def test_signin_store_today_replaced_on_refresh(mocker, store):
+    """Today's partition is replaced rather than appended to"""
+    mocker.patch.object(a, "get_all_records_between", return_value=[])
+    mocker.patch.object(a, "get_all_records_after", return_value=[_signin(1, d(10, 9))])
+    assert len(store.query(d(10), None)) == 1
+    store.TODAY_REFRESH_SEC = 0
+    mocker.patch.object(
+        a,
+        "get_all_records_after",
+        return_value=[_signin(1, d(10, 9)), _signin(2, d(10, 11))],
     )
-    assert list(a.get_signins_between(d(0), None)) == ["after"]
-    assert list(a.get_signins_between(d(0), d(1))) == ["between"]
-    after.assert_called_once_with("people", "sign_ins", d(0))
-    between.assert_called_once_with("people", "sign_ins", d(0), d(1))
+    assert len(store.query(d(10), None)) == 2
+
+
+def test_signin_store_indexed_queries(mocker, store):
+    """Queries can filter by email and Neon ID"""
+    mocker.patch.object(
+        a,
+        "get_all_records_between",
+        return_value=[
+            _signin(1, d(2, 9), "A@x.com ", "123"),
+            _signin(2, d(3, 9), "b@x.com"),
+            _signin(3, d(4, 9), "a@x.com", "123"),
+            _signin(4, d(9, 9)),  # Outside the requested range; not stored
+        ],
+    )
+    assert [s.created for s in store.query(d(0), d(5), email="a@x.com")] == [
+        d(2, 9),
+        d(4, 9),
+    ]
+    assert len(list(a.get_signins_between(d(0), d(5), neon_id="123"))) == 2
+    assert not store.query(d(0), d(5), email="c@x.com")
+
+
+def test_signin_store_fetch_does_not_block_other_days(mocker, store):
+    """A slow backfill of past days doesn't block queries for today, and a
+    concurrent query of the same days waits for it rather than refetching"""
+    release = threading.Event()
+
+    def slow_between(*_):
+        release.wait(5)
+        return [_signin(1, d(2, 9))]
+
+    between = mocker.patch.object(
+        a, "get_all_records_between", side_effect=slow_between
+    )
+    mocker.patch.object(a, "get_all_records_after", return_value=[_signin(2, d(10, 9))])
+    results = []
+    backfills = [
+        threading.Thread(target=lambda: results.append(store.query(d(0), d(5))))
+        for _ in range(2)
+    ]
+    for t in backfills:
+        t.start()
+    deadline = time.monotonic() + 5
+    while not between.called:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert len(store.query(d(10), None)) == 1  # Doesn't wait on the backfill
+    release.set()
+    for t in backfills:
+        t.join()
+    assert [len(r) for r in results] == [1, 1]
+    between.assert_called_once()
+
+
+@pytest.mark.benchmark
+def test_signin_store_benchmark_12mo_cold_then_warm(mocker, store):
+    """A 12 month attendance query is served locally once warm"""
+    per_day = 10
+
+    def fetch(_base, _tbl, start, end):
+        day = start
+        while day < end:
+            for i in range(per_day):
+                yield _signin(
+                    f"{day.date()}-{i}", day + datetime.timedelta(hours=9, minutes=i)
+                )
+            day += datetime.timedelta(days=1)
+
+    mocker.patch.object(a, "tznow", return_value=d(365, 12))
+    between = mocker.patch.object(a, "get_all_records_between", side_effect=fetch)
+    mocker.patch.object(a, "get_all_records_after", return_value=[])
+
+    t0 = time.perf_counter()
+    cold = store.query(d(0), d(364, 23))
+    t1 = time.perf_counter()
+    warm = store.query(d(0), d(364, 23))
+    t2 = time.perf_counter()
+    print(f"12mo sign-in query: cold {t1 - t0:.3f}s, warm {t2 - t1:.3f}s")
+
+    assert len(cold) == len(warm) == 365 * per_day
+    assert between.call_count == 1
 
 
 def test_insert_signin_and_survey_response(mocker):
@@ -1140,6 +1282,56 @@ def test_airtable_cache_refresh(mocker):
     assert cache["violations"] == ["violation"]
 
 
+def test_airtable_cache_refresh_merges_changes(mocker):
+    """Between full loads, only changed rows are fetched and merged"""
+    mocker.patch.object(a, "tznow", return_value=d(0))
+    mocker.patch.object(
+        a,
+        "get_all_announcements",
+        return_value=[{"id": 1, "fields": {"Title": "old"}}],
+    )
+    mocker.patch.object(
+        a,
+        "get_policy_violations",
+        return_value=[
+            {"id": 1, "fields": {"Onset": "x"}},
+            {"id": 2, "fields": {"Onset": "y"}},
+        ],
+    )
+    cache = a.AirtableCache()
+    cache.refresh()
+
+    def changed(_base, tbl, since):
+        assert since == d(0) - cache.CHANGE_CHECK_MARGIN
+        if tbl == "violations":
+            return [
+                {"id": 2, "fields": {}},  # No longer a violation
+                {"id": 3, "fields": {"Onset": "z"}},
+            ]
+        return [{"id": 1, "fields": {"Title": "new"}}]
+
+    modified = mocker.patch.object(
+        a, "get_all_records_modified_after", side_effect=changed
+    )
+    mocker.patch.object(a, "tznow", return_value=d(0, 1))
+    cache.refresh()
+    assert modified.call_count == 2
+    assert a.get_all_announcements.call_count == 1
+    assert cache["announcements"] == [{"id": 1, "fields": {"Title": "new"}}]
+    assert [v["id"] for v in cache["violations"]] == [1, 3]
+
+    m = cache.metrics()
+    assert m["violations"]["rows"] == 2
+    assert m["violations"]["staleness_sec"] == 0
+    assert m["violations"]["since_full_load_sec"] == 3600
+
+    # Full reload once the period has passed
+    mocker.patch.object(a, "tznow", return_value=d(1, 1))
+    cache.refresh()
+    assert a.get_all_announcements.call_count == 2
+    assert cache["announcements"] == [{"id": 1, "fields": {"Title": "old"}}]
+
+
 def test_get_all_instructor_capabilities_formatted(mocker):
     """Instructor capabilities are formatted for API responses"""
     mocker.patch.object(a, "get_config", return_value="http://nocodb")
@@ -1,14 +1,21 @@
 """Functions for handling the status and reservations of tools & equipment via Booked scheduler"""
 
 import datetime
+import json
 import logging
 import secrets
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from dataclasses import dataclass
 from typing import Any, Iterable
 
-from protohaven_api.config import get_config, safe_parse_datetime, tznow
+from protohaven_api.config import get_config, safe_parse_datetime, tz, tznow
+from protohaven_api.integrations import neon
 from protohaven_api.integrations.airtable import AreaID, Interval, ToolCode
 from protohaven_api.integrations.data.connector import get as get_connector
+from protohaven_api.integrations.data.local_db import LocalDB
 from protohaven_api.integrations.data.warm_cache import WarmDict
 from protohaven_api.integrations.models import BookedUser
 
@@ -22,38 +29,29 @@ STATUS_AVAILABLE = 1
 ResourceID = int
 
 
+def fetch_resources():
+    """Fetches all resources directly from Booked, bypassing the catalog"""
+    return get_connector().booked_request("GET", "/Resources/")["resources"]
+
+
 def get_resources():
     """Fetches all resources"""
-    return get_connector().booked_request("GET", "/Resources/")["resources"]
+    return catalog.get_resources()
 
 
 def get_resource_id_to_name_map():
     """Gets the mapping of resource IDs to the tool name"""
-    return {d["resourceId"]: d["name"] for d in get_resources()}
+    return catalog.get_map("id_to_name")
 
 
 def get_resource_map() -> dict[ToolCode, ResourceID]:
     """Fetches a map from a resource tool code to its ID"""
-    result = {}
-    tool_code_id = get_config("booked/resource_custom_attribute/tool_code")
-    for d in get_resources():
-        for attr in d["customAttributes"]:
-            if attr["id"] == tool_code_id and attr["value"]:
-                result[attr["value"]] = d["resourceId"]
-                break
-    return result
+    return catalog.get_map("by_tool_code")
 
 
 def get_resource_area_map() -> dict[AreaID, list[ResourceID]]:
     """Collects resource IDs by their tagged area"""
-    result = defaultdict(list)
-    area_id = get_config("booked/resource_custom_attribute/area")
-    for d in get_resources():
-        for attr in d["customAttributes"]:
-            if attr["id"] == area_id and attr["value"]:
-                result[attr["value"]].append(d["resourceId"])
-                break
-    return result
+    return {k: list(v) for k, v in catalog.get_map("by_area").items()}
 
 
 def get_resource_group_map():
@@ -72,19 +70,23 @@ def get_resource(resource_id):
 
 def set_resource_status(resource_id, status):
     """Enable or disable a specific tool by ID"""
-    # We must get the name of the resource in order to set its status, unfortunately.
-    data = get_resource(resource_id)
-    assert data.get("name", None) is not None
+    # We must send the name of the resource in order to set its status, unfortunately.
+    name = get_resource_id_to_name_map().get(resource_id)
+    if name is None:
+        name = get_resource(resource_id).get("name", None)
+    assert name is not None
 
-    return get_connector().booked_request(
+    result = get_connector().booked_request(
         "POST",
         f"/Resources/{resource_id}",
         json={
             "statusId": status,
-            "name": data["name"],
+            "name": name,
             "scheduleId": get_config("booked/schedule_id"),
         },
     )
+    catalog.invalidate()
+    return result
 
 
 def get_members_group():
@@ -114,21 +116,39 @@ def set_members_group_tool_permissions(tool_ids):
     )
 
 
-def get_reservations(start, end):
-    """Get all reservations within the start and end times"""
+RESERVATION_DATE_FIELDS = (
+    "startDate",
+    "endDate",
+    "bufferedStartDate",
+    "bufferedEndDate",
+)
+RESERVATION_WINDOW = datetime.timedelta(days=14)
+RESERVATION_WINDOW_EPOCH = datetime.datetime(2020, 1, 6, tzinfo=tz)
+RESERVATION_FETCH_WORKERS = 4
+
+
+def _parse_reservation_date(v):
+    """Parses a Booked timestamp, using the fast ISO path where possible"""
+    if isinstance(v, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(v)
+            if parsed.tzinfo is not None:
+                return parsed
+        except ValueError:
+            pass
+    return safe_parse_datetime(v)
+
+
+def _fetch_reservations(start, end):
+    """Fetches reservations from Booked in a single request, parsing their
+    timestamps once"""
     url = f"/Reservations/?startDateTime={start.isoformat()}&endDateTime={end.isoformat()}"
     res = get_connector().booked_request("GET", url)
     # 2025-10-17: Sometimes reservations are returned which aren't within the query range.
     # So we parse and check them here.
     if "reservations" in res:
         rr = [
-            {
-                **r,
-                "startDate": safe_parse_datetime(r["startDate"]),
-                "endDate": safe_parse_datetime(r["endDate"]),
-                "bufferedStartDate": safe_parse_datetime(r["bufferedStartDate"]),
-                "bufferedEndDate": safe_parse_datetime(r["bufferedEndDate"]),
-            }
+            {**r, **{k: _parse_reservation_date(r[k]) for k in RESERVATION_DATE_FIELDS}}
             for r in res["reservations"]
         ]
         res["reservations"] = [
@@ -137,6 +157,116 @@ def get_reservations(start, end):
     return res
 
 
+class ReservationWindowStore(LocalDB):
+    """Persists reservations for fixed windows that lie entirely in the past,
+    so long-range queries only need to fetch recent windows from Booked."""
+
+    NAME = "booked_reservations"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS windows (
+            start TEXT PRIMARY KEY,
+            fetched REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reservations (
+            window_start TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reservations_window
+            ON reservations (window_start);
+    """
+
+    def get(self, window_start: datetime.datetime) -> list[dict] | None:
+        """Returns the stored reservations of a window, or None if not stored"""
+        key = window_start.isoformat()
+        with self.mu:
+            if not self.execute("SELECT 1 FROM windows WHERE start = ?", (key,)):
+                return None
+            rows = self.execute(
+                "SELECT data FROM reservations WHERE window_start = ?", (key,)
+            )
+        result = []
+        for (data,) in rows:
+            r = json.loads(data)
+            for k in RESERVATION_DATE_FIELDS:
+                r[k] = datetime.datetime.fromisoformat(r[k])
+            result.append(r)
+        return result
+
+    def put(self, window_start: datetime.datetime, reservations: list[dict]):
+        """Stores the (already parsed) reservations of a window"""
+        key = window_start.isoformat()
+        rows = [
+            (
+                key,
+                json.dumps(
+                    {**r, **{k: r[k].isoformat() for k in RESERVATION_DATE_FIELDS}}
+                ),
+            )
+            for r in reservations
+        ]
+        with self.mu:
+            self.execute("DELETE FROM reservations WHERE window_start = ?", (key,))
+            self.executemany(
+                "INSERT INTO reservations (window_start, data) VALUES (?, ?)", rows
+            )
+            self.execute(
+                "INSERT OR REPLACE INTO windows (start, fetched) VALUES (?, ?)",
+                (key, time.time()),
+            )
+
+
+reservation_store = ReservationWindowStore()
+
+
+def _reservation_windows(start, end) -> list[datetime.datetime]:
+    """Returns the starts of the fixed windows overlapping [start, end]"""
+    n = (start - RESERVATION_WINDOW_EPOCH) // RESERVATION_WINDOW
+    ws = RESERVATION_WINDOW_EPOCH + n * RESERVATION_WINDOW
+    result = []
+    while ws <= end:
+        result.append(ws)
+        ws += RESERVATION_WINDOW
+    return result
+
+
+def _get_window_reservations(ws, cutoff) -> list[dict]:
+    """Fetches the reservations starting within the window at `ws`, using the
+    local store for windows that ended before `cutoff`"""
+    we = ws + RESERVATION_WINDOW
+    cacheable = we <= cutoff
+    if cacheable:
+        cached = reservation_store.get(ws)
+        if cached is not None:
+            return cached
+    rr = [
+        r
+        for r in _fetch_reservations(ws, we).get("reservations", [])
+        if r["startDate"] < we
+    ]
+    if cacheable:
+        reservation_store.put(ws, rr)
+    return rr
+
+
+def get_reservations(start, end):
+    """Get all reservations within the start and end times.
+
+    Ranges spanning more than one fixed window are fetched window by window
+    in parallel; windows entirely before today are served from local storage
+    after their first fetch."""
+    windows = _reservation_windows(start, end)
+    if len(windows) <= 1:
+        return _fetch_reservations(start, end)
+
+    cutoff = tznow().replace(hour=0, minute=0, second=0, microsecond=0)
+    with ThreadPoolExecutor(max_workers=RESERVATION_FETCH_WORKERS) as executor:
+        results = executor.map(lambda ws: _get_window_reservations(ws, cutoff), windows)
+        rr = [r for window in results for r in window]
+    return {
+        "reservations": [r for r in rr if start <= r["startDate"] <= end],
+    }
+
+
 def delete_reservation(refnum):
     """Deletes a reservation by its reference number - be very careful with
     this one!"""
@@ -210,9 +340,11 @@ def reserve_resource(
 
 def update_resource(data):
     """Updates a resource given a dict of data"""
-    return get_connector().booked_request(
+    result = get_connector().booked_request(
         "POST", f"/Resources/{data['resourceId']}", json=data
     )
+    catalog.invalidate()
+    return result
 
 
 def stage_custom_attributes(resource, **kwargs):
@@ -278,15 +410,17 @@ def apply_resource_custom_fields(resource, **kwargs):
     data["customAttributes"] = [
         {"attributeId": k, "attributeValue": v} for k, v in attrs.items()
     ]
-    return get_connector().booked_request(
+    result = get_connector().booked_request(
         "POST", f"/Resources/{data['resourceId']}", json=data
     )
+    catalog.invalidate()
+    return result
 
 
 def create_resource(name):
     """Creates a named resource and returns the creation result"""
     # Not sure how many of these fields are needed - there are more as well.
-    return get_connector().booked_request(
+    result = get_connector().booked_request(
         "POST",
         "/Resources/",
         json={
@@ -303,6 +437,8 @@ def create_resource(name):
             "autoAssignPermissions": True,
         },
     )
+    catalog.invalidate()
+    return result
 
 
 def create_user_as_member(fname, lname, email):
@@ -352,8 +488,80 @@ def assign_members_group_users(user_ids: list):
     )
 
 
+@dataclass
+class ReservationView:  # pylint: disable=too-many-instance-attributes
+    """A reservation with its times parsed and display strings formatted,
+    computed once per ReservationCache refresh"""
+
+    ref: str
+    booked_id: str
+    neon_id: str | None
+    tool_code: str | None
+    area: str
+    resource: str
+    name: str
+    start: datetime.datetime
+    end: datetime.datetime
+    start_str: str  # "open" if starting at or before opening time
+    end_str: str  # "close" if ending at or after closing time
+
+    @classmethod
+    def from_booked(cls, r, tool_code_attr, neon_id=None):
+        """Builds a view of a reservation returned by `get_reservations()`"""
+        start, end = r["startDate"], r["endDate"]
+        open_time = start.replace(hour=10, minute=0, second=0, microsecond=0)
+        close_time = open_time.replace(hour=22)
+        if "-" in r["resourceName"]:
+            area, resource = [t.strip() for t in r["resourceName"].split("-", 1)]
+        else:
+            area, resource = "", r["resourceName"].strip()
+        tool_code = [
+            a["value"]
+            for a in r.get("customAttributes") or []
+            if a["id"] == tool_code_attr
+        ]
+        return cls(
+            ref=r["referenceNumber"],
+            booked_id=str(r.get("userId", "")),
+            neon_id=neon_id,
+            tool_code=tool_code[0] if len(tool_code) == 1 else None,
+            area=area,
+            resource=resource,
+            name=f"{r.get('firstName', '')} {r.get('lastName', '')}".strip(),
+            start=start,
+            end=end,
+            start_str="open" if start <= open_time else start.strftime("%-I:%M %p"),
+            end_str="close" if end >= close_time else end.strftime("%-I:%M %p"),
+        )
+
+    def as_display(self):
+        """Returns a dict suitable for rendering in a list of reservations"""
+        return {
+            "id": self.ref,
+            "resource": self.resource,
+            "area": self.area,
+            "start": self.start_str,
+            "end": self.end_str,
+            "name": self.name,
+        }
+
+    def as_state(self):
+        """Returns a JSON-serializable dict describing the reservation to
+        devices; matches the payload of `mqtt.notify_reservation`"""
+        return {
+            "ref": self.ref,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "uid": self.neon_id,
+        }
+
+
 class ReservationCache(WarmDict):
-    """Fetches tool reservation info"""
+    """Fetches tool reservation info.
+
+    Each refresh builds indexes of today's reservations by tool code, Booked
+    user ID and Neon ID, so readers only pay for a dict lookup.
+    """
 
     NAME = "reservations"
     REFRESH_PD_SEC = datetime.timedelta(minutes=5).total_seconds()
@@ -361,14 +569,56 @@ class ReservationCache(WarmDict):
 
     def __init__(self, update_cb=None):
         self.cb = update_cb
+        self.published: dict[ToolCode, list[dict]] | None = None
         super().__init__()
 
+    def _resolve_neon_ids(self, booked_ids) -> dict[str, str | None]:
+        """Maps each Booked user ID to its Neon ID, if known, in one request"""
+        try:
+            resolved = neon.cached_neon_ids_from_booked_ids(booked_ids)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.log.warning(f"Could not resolve Booked users {booked_ids}: {e}")
+            return {}
+        return {str(k): v for k, v in resolved.items()}
+
+    def set_reservations(self, reservations):
+        """Replaces the cached reservations and rebuilds all indexes"""
+        tool_code_attr = get_config("booked/resource_custom_attribute/tool_code")
+        neon_ids = self._resolve_neon_ids(
+            {str(r["userId"]) for r in reservations if r.get("userId")}
+        )
+        views = [
+            ReservationView.from_booked(
+                r, tool_code_attr, neon_ids.get(str(r.get("userId")))
+            )
+            for r in reservations
+        ]
+        by_tool = defaultdict(list)
+        by_booked_id = defaultdict(list)
+        by_neon_id = defaultdict(list)
+        for v in views:
+            if v.tool_code:
+                by_tool[v.tool_code].append(v)
+            by_booked_id[v.booked_id].append(v)
+            if v.neon_id:
+                by_neon_id[v.neon_id].append(v)
+        with self.mu:
+            self.cache.update(
+                {
+                    "reservations": reservations,
+                    "views": views,
+                    "by_tool": dict(by_tool),
+                    "by_booked_id": dict(by_booked_id),
+                    "by_neon_id": dict(by_neon_id),
+                }
+            )
+
     def refresh(self):
         # We want reservations for the whole day, not just future ones
         start = tznow().replace(hour=0, minute=0, second=0, microsecond=0)
         end = start.replace(hour=23, minute=59, second=59, microsecond=0)
         res = get_reservations(start, end)
-        self["reservations"] = res["reservations"]
+        self.set_reservations(res["reservations"])
         self.log.info(
             f"Reservation cache updated - {len(self['reservations'])} reservation(s)"
         )
@@ -379,29 +629,119 @@ class ReservationCache(WarmDict):
             minutes=15 if 10 <= start.hour <= 22 else 60
         ).total_seconds()
 
+    def take_changed_tools(
+        self, known_tools: Iterable[ToolCode] = ()
+    ) -> dict[ToolCode, list[ReservationView]]:
+        """Returns the tools whose reservation state differs from the previous
+        call, mapped to their current reservations (empty if all were removed).
+
+        On the first call every tool is considered changed, including
+        `known_tools` without reservations, so stale state can be cleared."""
+        with self.mu:
+            by_tool = self.cache.get("by_tool", {})
+        current: dict[ToolCode, list[dict]] = {k: [] for k in known_tools}
+        current.update({k: [v.as_state() for v in vv] for k, vv in by_tool.items()})
+        prev = self.published
+        self.published = current
+        if prev is None:
+            changed = set(current.keys())
+        else:
+            changed = {
+                k
+                for k in current.keys() | prev.keys()
+                if current.get(k, []) != prev.get(k, [])
+            }
+        return {k: by_tool.get(k, []) for k in changed}
+
     def get_next_24h_reservations(self) -> Iterable[Any]:
         """Fetches the raw contents of the cache"""
         log.info(f"Returning reservations: {self.get('reservations')}")
         return self["reservations"]
 
-    def get_today_reservations_by_tool(self):
+    def get_views(self) -> list[ReservationView]:
+        """Fetches today's reservations"""
+        return self.get("views", [])
+
+    def get_today_reservations_by_tool(self) -> dict[ToolCode, list[ReservationView]]:
         """Fetches today's reservations, keyed by tool code"""
-        tool_code_attr = get_config("booked/resource_custom_attribute/tool_code")
-        result = defaultdict(list)
-        for r in self["reservations"]:
-            tool_code = [
-                a["value"] for a in r["customAttributes"] if a["id"] == tool_code_attr
-            ]
-            if len(tool_code) == 1:
-                result[tool_code[0]].append(
-                    {
-                        "ref": r["referenceNumber"],
-                        "user": r["userId"],
-                        "start": r["startDate"],
-                        "end": r["endDate"],
-                    }
-                )
-        return result
+        return self.get("by_tool", {})
+
+    def get_for_booked_user(self, booked_id) -> list[ReservationView]:
+        """Fetches today's reservations made by a Booked user"""
+        return self.get("by_booked_id", {}).get(str(booked_id), [])
+
+    def get_for_neon_id(self, neon_id) -> list[ReservationView]:
+        """Fetches today's reservations made by a Neon account"""
+        return self.get("by_neon_id", {}).get(str(neon_id), [])
 
 
 cache = ReservationCache()
+
+
+class ResourceCatalog(WarmDict):
+    """Caches the Booked resource listing and the maps derived from it.
+
+    The catalog refreshes on a schedule when started, and lazily on read when
+    it has gone stale or been invalidated by one of our own writes - so one-shot
+    commands share a single `/Resources/` fetch across all their lookups.
+    """
+
+    NAME = "booked_resources"
+    REFRESH_PD_SEC = datetime.timedelta(minutes=15).total_seconds()
+    RETRY_PD_SEC = datetime.timedelta(minutes=5).total_seconds()
+    MAX_AGE_SEC = REFRESH_PD_SEC
+
+    def __init__(self):
+        super().__init__()
+        self.fetched: float | None = None
+
+    def refresh(self):
+        resources = fetch_resources()
+        tool_code_id = get_config("booked/resource_custom_attribute/tool_code")
+        area_id = get_config("booked/resource_custom_attribute/area")
+        by_tool_code = {}
+        by_area = defaultdict(list)
+        for r in resources:
+            for attr in r["customAttributes"]:
+                if attr["id"] == tool_code_id and attr["value"]:
+                    by_tool_code[attr["value"]] = r["resourceId"]
+                    break
+            for attr in r["customAttributes"]:
+                if attr["id"] == area_id and attr["value"]:
+                    by_area[attr["value"]].append(r["resourceId"])
+                    break
+        with self.mu:
+            self.cache.update(
+                {
+                    "resources": resources,
+                    "id_to_name": {r["resourceId"]: r.get("name") for r in resources},
+                    "by_tool_code": by_tool_code,
+                    "by_area": dict(by_area),
+                }
+            )
+            self.fetched = time.monotonic()
+        self.log.info(f"Resource catalog updated - {len(resources)} resource(s)")
+
+    def invalidate(self):
+        """Marks the catalog stale so the next read refetches it"""
+        with self.mu:
+            self.fetched = None
+
+    def _ensure_fresh(self):
+        with self.mu:
+            fetched = self.fetched
+        if fetched is None or time.monotonic() - fetched > self.MAX_AGE_SEC:
+            self.refresh()
+
+    def get_resources(self) -> list[dict]:
+        """Returns a copy of all resources, safe for callers to modify"""
+        self._ensure_fresh()
+        return deepcopy(self["resources"])
+
+    def get_map(self, name: str) -> dict:
+        """Returns a copy of one of the derived resource maps"""
+        self._ensure_fresh()
+        return dict(self[name])
+
+
+catalog = ResourceCatalog()
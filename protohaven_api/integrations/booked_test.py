@@ -1,7 +1,23 @@
 """Unit tests for Booked API integration"""
 
+import datetime
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
 from protohaven_api.config import safe_parse_datetime
 from protohaven_api.integrations import booked
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.testing import d
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog():
+    """Prevents resources cached by one test from leaking into the next"""
+    booked.catalog.invalidate()
+    yield
+    booked.catalog.invalidate()
 
 
 def test_get_resource_map(mocker):
@@ -16,6 +32,37 @@ def test_get_resource_map(mocker):
     assert booked.get_resource_map() == {"ABC": 123}
 
 
+def test_resource_catalog_shared_and_invalidated(mocker):
+    """All resource maps share one fetch until one of our writes invalidates it"""
+    mocker.patch.object(booked, "get_connector")
+    req = booked.get_connector().booked_request
+    req.return_value = {
+        "resources": [
+            {
+                "customAttributes": [{"id": 3, "value": "ABC"}],
+                "resourceId": 123,
+                "name": "Saw",
+            }
+        ]
+    }
+    mocker.patch.object(booked, "get_config", return_value=3)
+    assert booked.get_resource_map() == {"ABC": 123}
+    assert booked.get_resource_area_map() == {"ABC": [123]}
+    assert booked.get_resource_id_to_name_map() == {123: "Saw"}
+    booked.get_resources()[0]["name"] = "mutated"
+    assert booked.get_resources()[0]["name"] == "Saw"
+    assert req.call_count == 1
+
+    # Status is set using the cached name, without a GET of its own
+    booked.set_resource_status(123, booked.STATUS_UNAVAILABLE)
+    assert req.call_args.args[:2] == ("POST", "/Resources/123")
+    assert req.call_args.kwargs["json"]["name"] == "Saw"
+    assert req.call_count == 2
+
+    booked.get_resource_map()
+    assert req.call_count == 3
+
+
 def test_get_resource_singleton(mocker):
     """Basic test of get_resource() to fetch a Booked resource"""
     mocker.patch.object(booked, "get_connector")
@@ -26,7 +73,8 @@ def test_get_resource_singleton(mocker):
 
 
 def test_get_reservations(mocker):
-    """Ensure the correct URL is formed when checking reservations"""
+    """Ensure the correct URL is formed when checking reservations within a
+    single window"""
     mocker.patch.object(booked, "get_connector")
     booked.get_connector().booked_request.return_value = {
         "reservations": [
@@ -45,15 +93,94 @@ def test_get_reservations(mocker):
         ]
     }
     res = booked.get_reservations(
-        safe_parse_datetime("2024-01-01"), safe_parse_datetime("2024-02-02")
+        safe_parse_datetime("2024-01-01"), safe_parse_datetime("2024-01-10")
     )
     booked.get_connector().booked_request.assert_called_once_with(  # pylint: disable=no-member
         "GET",
-        "/Reservations/?startDateTime=2024-01-01T00:00:00-05:00&endDateTime=2024-02-02T00:00:00-05:00",  # pylint: disable=line-too-long
+        "/Reservations/?startDateTime=2024-01-01T00:00:00-05:00&endDateTime=2024-01-10T00:00:00-05:00",  # pylint: disable=line-too-long
     )
     assert len(res["reservations"]) == 1
 
 
+@pytest.fixture(name="windowed")
+def fixture_windowed(mocker):
+    """Serves a reservation per day from a mock Booked, with a fresh
+    in-memory window store and "today" at the end of 2025"""
+    mocker.patch.object(
+        booked, "reservation_store", booked.ReservationWindowStore(MEMORY)
+    )
+    mocker.patch.object(booked, "tznow", return_value=d(364, 12))
+    mocker.patch.object(booked, "get_connector")
+
+    def _request(_, url):
+        q = parse_qs(urlparse(url).query)
+        start = safe_parse_datetime(q["startDateTime"][0])
+        end = safe_parse_datetime(q["endDateTime"][0])
+        time.sleep(0.005)  # Simulated round trip
+        rr = []
+        cur = start.replace(hour=12)
+        while cur <= end:
+            rr.append(
+                {
+                    "referenceNumber": cur.isoformat(),
+                    "startDate": cur.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "endDate": cur.strftime("%Y-%m-%dT13:00:00%z"),
+                    "bufferedStartDate": cur.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "bufferedEndDate": cur.strftime("%Y-%m-%dT13:00:00%z"),
+                }
+            )
+            cur += datetime.timedelta(days=1)
+        return {"reservations": rr}
+
+    req = booked.get_connector().booked_request
+    req.side_effect = _request
+    return req
+
+
+def test_get_reservations_windowed(windowed):
+    """Long ranges are split into windows, with no duplicates at window
+    boundaries; only past windows are stored locally"""
+    res = booked.get_reservations(d(0), d(40))["reservations"]
+    assert [r["startDate"] for r in res] == [d(i, 12) for i in range(40)]
+    # d(0) and d(40) are mid-window, so four windows are touched
+    assert windowed.call_count == 4
+
+    windowed.reset_mock()
+    assert booked.get_reservations(d(0), d(40))["reservations"] == res
+    windowed.assert_not_called()
+
+    # Windows reaching into today or later are always refetched
+    booked.get_reservations(d(340), d(380))
+    windowed.reset_mock()
+    booked.get_reservations(d(340), d(380))
+    assert windowed.call_count == 2
+
+
+@pytest.mark.benchmark
+def test_get_reservations_one_year_benchmark(windowed):
+    """Benchmark a one-year reservation fetch, cold and then warm. Only the
+    window containing today is refetched when warm."""
+    windows = booked._reservation_windows(  # pylint: disable=protected-access
+        d(0), d(363)
+    )
+    t0 = time.perf_counter()
+    cold = booked.get_reservations(d(0), d(363))["reservations"]
+    t1 = time.perf_counter()
+    assert windowed.call_count == len(windows)
+    assert len(cold) == 363
+
+    windowed.reset_mock()
+    t2 = time.perf_counter()
+    warm = booked.get_reservations(d(0), d(363))["reservations"]
+    t3 = time.perf_counter()
+    assert windowed.call_count == 1
+    assert warm == cold
+    print(
+        f"One year of reservations ({len(windows)} windows): "
+        f"cold {t1 - t0:.3f}s, warm {t3 - t2:.3f}s"
+    )
+
+
 def test_reserve_resource(mocker):
     """Ensure data is properly formatted when submitting a reservation"""
     mocker.patch.object(booked, "get_connector")
@@ -128,3 +255,89 @@ def test_stage_tool_update(mocker):
         "statusId (NOT_AVAILABLE->AVAILABLE)",
         "typeId (0->1)",
     }
+
+
+def _reservation(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    ref, user, tool_code, start, end, name="Area - Tool"
+):
+    return {
+        "referenceNumber": ref,
+        "userId": user,
+        "firstName": "First",
+        "lastName": "Last",
+        "resourceName": name,
+        "customAttributes": [{"id": 3, "value": tool_code}],
+        "startDate": start,
+        "endDate": end,
+    }
+
+
+def test_reservation_cache_indexes(mocker):
+    """Reservations are indexed by tool, Booked user and Neon ID on refresh"""
+    mocker.patch.object(booked, "get_config", return_value=3)
+    resolve = mocker.patch.object(
+        booked.neon,
+        "cached_neon_ids_from_booked_ids",
+        return_value={1: "100", 2: None},
+    )
+    c = booked.ReservationCache()
+    c.set_reservations(
+        [
+            _reservation("R1", 1, "ABC", d(0, 10), d(0, 12)),
+            _reservation("R2", 1, "DEF", d(0, 14), d(0, 22)),
+            _reservation("R3", 2, "ABC", d(0, 13), d(0, 14), name="NoArea"),
+        ]
+    )
+    # All users are resolved in one bulk request
+    resolve.assert_called_once_with({"1", "2"})
+
+    assert [v.ref for v in c.get_today_reservations_by_tool()["ABC"]] == [
+        "R1",
+        "R3",
+    ]
+    assert [v.ref for v in c.get_for_booked_user(1)] == ["R1", "R2"]
+    assert [v.ref for v in c.get_for_neon_id("100")] == ["R1", "R2"]
+    assert not c.get_for_neon_id("200")
+
+    r1, r2, r3 = c.get_views()
+    assert r1.as_display() == {
+        "id": "R1",
+        "resource": "Tool",
+        "area": "Area",
+        "start": "open",
+        "end": "12:00 PM",
+        "name": "First Last",
+    }
+    assert (r2.start_str, r2.end_str) == ("2:00 PM", "close")
+    assert (r3.area, r3.resource, r3.neon_id) == ("", "NoArea", None)
+
+
+def test_reservation_cache_take_changed_tools(mocker):
+    """Only tools whose reservation state changed are returned after the
+    first call, including tools whose reservations were all removed"""
+    mocker.patch.object(booked, "get_config", return_value=3)
+    mocker.patch.object(
+        booked.neon, "cached_neon_ids_from_booked_ids", side_effect=RuntimeError
+    )
+    c = booked.ReservationCache()
+    r1 = _reservation("R1", 1, "ABC", d(0, 10), d(0, 12))
+    r2 = _reservation("R2", 1, "DEF", d(0, 14), d(0, 16))
+    c.set_reservations([r1, r2])
+    got = c.take_changed_tools(known_tools=["ABC", "DEF", "GHI"])
+    assert {k: [v.ref for v in vv] for k, vv in got.items()} == {
+        "ABC": ["R1"],
+        "DEF": ["R2"],
+        "GHI": [],
+    }
+
+    c.set_reservations([r1, r2])
+    assert not c.take_changed_tools(known_tools=["ABC", "DEF", "GHI"])
+
+    r3 = _reservation("R3", 1, "GHI", d(0, 14), d(0, 16))
+    c.set_reservations([{**r1, "endDate": d(0, 13)}, r3])
+    got = c.take_changed_tools(known_tools=["ABC", "DEF", "GHI"])
+    assert {k: [v.ref for v in vv] for k, vv in got.items()} == {
+        "ABC": ["R1"],
+        "DEF": [],
+        "GHI": ["R3"],
+    }
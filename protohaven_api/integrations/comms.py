@@ -6,16 +6,25 @@ see https://myaccount.google.com/u/3/lesssecureapps
 
 import logging
 import re
+import time
 import traceback
 from dataclasses import dataclass, field
 from functools import lru_cache
 from typing import Any, List, Tuple
 
-from jinja2 import Environment, PackageLoader, StrictUndefined, select_autoescape
+from jinja2 import (
+    Environment,
+    PackageLoader,
+    StrictUndefined,
+    Template,
+    nodes,
+    select_autoescape,
+)
 
 from protohaven_api.config import get_config
 from protohaven_api.integrations.cronicle import exec_details_footer
 from protohaven_api.integrations.data.connector import get as get_connector
+from protohaven_api.metrics import LatencyStats
 
 log = logging.getLogger("integrations.comms")
 
@@ -40,6 +49,92 @@ def get_all_templates() -> List[str]:
     return [e.replace(".jinja2", "") for e in _env()[0].list_templates()]
 
 
+# Separates subject from body in single-pass renders
+SUBJECT_BODY_SEP = "\x1e"
+
+
+def _is_blank(n) -> bool:
+    return isinstance(n, nodes.Output) and all(
+        isinstance(c, nodes.TemplateData) and not c.data.strip() for c in n.nodes
+    )
+
+
+def _merge_subject_body(ast: nodes.Template) -> nodes.Template | None:
+    """Rewrites a template's top-level `{% if subject %}A{% else %}B{% endif %}`
+    to output A, SUBJECT_BODY_SEP, B - so both are rendered in one pass.
+    Returns None if the template doesn't have that shape."""
+    splits = [
+        i
+        for i, n in enumerate(ast.body)
+        if isinstance(n, nodes.If)
+        and isinstance(n.test, nodes.Name)
+        and n.test.name == "subject"
+        and not n.elif_
+    ]
+    others = [
+        n
+        for i, n in enumerate(ast.body)
+        if i not in splits and not (_is_blank(n) or isinstance(n, nodes.Assign))
+    ]
+    if len(splits) != 1 or others:
+        return None
+    if sum(1 for n in ast.find_all(nodes.Name) if n.name == "subject") != 1:
+        return None  # `subject` is used elsewhere too
+    i = splits[0]
+    branch = ast.body[i]
+    ast.body[i : i + 1] = [
+        *branch.body,  # type: ignore[attr-defined]
+        nodes.Output([nodes.TemplateData(SUBJECT_BODY_SEP)]),
+        *branch.else_,  # type: ignore[attr-defined]
+    ]
+    return ast
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """A comms template, compiled once and reused for every render"""
+
+    name: str
+    tmpl: Template
+    merged: Template | None
+    is_html: bool
+
+    def render(self, **kwargs: Any) -> Tuple[str, str, bool]:
+        """Renders the subject and body. This is a single pass when the
+        template has the usual shape (see `_merge_subject_body`)."""
+        if self.merged is not None:
+            parts = self.merged.render(**kwargs).split(SUBJECT_BODY_SEP)
+            if len(parts) == 2:
+                return parts[0].strip(), parts[1].strip(), self.is_html
+            # The separator turned up in the rendered data; render normally
+        return (
+            self.tmpl.render(**kwargs, subject=True).strip(),
+            self.tmpl.render(**kwargs, subject=False).strip(),
+            self.is_html,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_template(template_name: str) -> CompiledTemplate:
+    """Loads and compiles the named template; cached for the life of the process"""
+    fname = f"{template_name}.jinja2"
+    e, l = _env()
+    src, _, _ = l.get_source(e, fname)
+    ast = _merge_subject_body(e.parse(src, template_name, fname))
+    merged = None
+    if ast is not None:
+        # Compiled under the template's own name, so autoescaping matches
+        merged = e.template_class.from_code(
+            e, e.compile(ast, fname, fname), e.make_globals(None)
+        )
+    return CompiledTemplate(
+        name=template_name,
+        tmpl=e.get_template(fname),
+        merged=merged,
+        is_html=src.strip().startswith("{# html #}"),
+    )
+
+
 def render(template_name: str, **kwargs: Any) -> Tuple[str, str, bool]:
     """Returns a rendered template in two parts - subject and body.
     Template must be of the form:
@@ -49,16 +144,7 @@ def render(template_name: str, **kwargs: Any) -> Tuple[str, str, bool]:
     HTML template is optionally indicated with {# html #} at the
     very start of the template.
     """
-    fname = f"{template_name}.jinja2"
-    e, l = _env()
-    src, _, _ = l.get_source(e, fname)
-    is_html = src.strip().startswith("{# html #}")
-    tmpl = e.get_template(fname)
-    return (
-        tmpl.render(**kwargs, subject=True).strip(),
-        tmpl.render(**kwargs, subject=False).strip(),
-        is_html,
-    )
+    return get_template(template_name).render(**kwargs)
 
 
 @dataclass
@@ -116,6 +202,9 @@ def send_email(subject, body, recipients, html):
 # Actual character limit is 2000, but we add some headroom here
 DISCORD_CHAR_LIMIT = 1950
 
+# Time spent resolving @mentions, per message
+mention_resolution = LatencyStats()
+
 
 def send_discord_message(content, channel=None, blocking=True):
     """Sends a message to the techs-live channel"""
@@ -173,7 +262,10 @@ def send_discord_message(content, channel=None, blocking=True):
                 log.info(f"Replacing {s} with role id tag {role_id}")
                 return f"<@&{role_id}>"
 
-            user_id = get_connector().discord_bot_fn("resolve_user_id", name)
+            # Reads the bot's local member index; no round trip to its loop
+            user_id = get_connector().discord_bot_fn_nonblocking(
+                "resolve_user_id", name
+            )
             if user_id is not None:
                 log.info(f"Replacing {s} with user id tag {user_id}")
                 return f"<@{user_id}>"
@@ -191,9 +283,13 @@ def send_discord_message(content, channel=None, blocking=True):
     # Improved regex: @ followed by 2+ chars of [a-zA-Z0-9._],
     # not matching if @ is preceded by word char
     # This avoids matching email addresses like user@gmail.com
+    start = time.perf_counter()
     content = re.sub(
         r"(?<!\w)@[\w\._]{2,}", sub_roles_and_users, content, flags=re.MULTILINE
     )
+    elapsed = time.perf_counter() - start
+    mention_resolution.add(elapsed)
+    log.debug(f"Resolved mentions in {elapsed*1000:.2f}ms")
 
     for i in range(0, len(content), DISCORD_CHAR_LIMIT):
         chunk = content[i : i + DISCORD_CHAR_LIMIT]
@@ -224,6 +320,14 @@ def get_all_members():
     return get_connector().discord_bot_fn("get_all_members")
 
 
+def get_member_changes(cursor=None):
+    """Gets Discord members whose names or roles changed since `cursor`, as
+    reported by the bot's gateway-fed member cache. Pass the returned
+    "cursor" to the next call; all members are returned (with "full" set)
+    the first time, or whenever the cache has been reloaded."""
+    return get_connector().discord_bot_fn_nonblocking("get_member_changes", cursor)
+
+
 def get_member_details(discord_id):
     """Gets specific discord's member details"""
     return get_connector().discord_bot_fn("get_member_details", discord_id)
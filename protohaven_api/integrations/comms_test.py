@@ -1,11 +1,16 @@
 """Testing comms integration methods"""
 
+import asyncio
 import hashlib
+import threading
+import time
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 
 import pytest
 
 from protohaven_api.integrations import comms as c
+from protohaven_api.integrations import discord_bot
 from protohaven_api.testing import MatchStr, d
 
 
@@ -21,9 +26,9 @@ def test_send_discord_message_with_role_embed(mocker):
 def test_send_discord_message_with_user_embed(mocker):
     """Ensure that @user mentions are properly converted to user IDs"""
     mocker.patch.object(c, "get_connector")
-    c.get_connector().discord_bot_fn.return_value = "userid"
+    c.get_connector().discord_bot_fn_nonblocking.return_value = "userid"
     c.send_discord_message("Hello @displayname", "#techs-live")
-    c.get_connector().discord_bot_fn.assert_called_with(
+    c.get_connector().discord_bot_fn_nonblocking.assert_called_with(
         "resolve_user_id", "displayname"
     )
     c.get_connector().discord_webhook.assert_called_with(  # pylint: disable=no-member
@@ -34,13 +39,66 @@ def test_send_discord_message_with_user_embed(mocker):
 def test_send_discord_message_with_user_embed_error(mocker):
     """Ensure that errors when resolving user IDs are ignored"""
     mocker.patch.object(c, "get_connector")
-    c.get_connector().discord_bot_fn.side_effect = RuntimeError("test")
+    c.get_connector().discord_bot_fn_nonblocking.side_effect = RuntimeError("test")
     c.send_discord_message("Hello @displayname", "#techs-live")
     c.get_connector().discord_webhook.assert_called_with(  # pylint: disable=no-member
         mocker.ANY, "Hello @displayname"
     )
 
 
+@pytest.mark.benchmark
+def test_send_discord_message_mentions_benchmark(mocker):
+    """Mentions resolve from the bot's local index, without a round trip
+    through its event loop"""
+    bot = discord_bot.PHClient(intents=None)
+    bot.index.load(
+        [
+            SimpleNamespace(
+                id=i,
+                name=f"tech{i}",
+                display_name=f"Tech {i}",
+                joined_at=None,
+                roles=[],
+            )
+            for i in range(2000)
+        ],
+        [],
+    )
+    mocker.patch.object(c, "get_connector")
+    conn = c.get_connector()
+    conn.discord_bot_fn_nonblocking.side_effect = lambda fn, *a: getattr(bot, fn)(*a)
+    mocker.patch.object(c, "mention_resolution", c.LatencyStats())
+    content = " ".join(f"@tech{i}" for i in range(50))
+    n = 100
+
+    start = time.perf_counter()
+    for _ in range(n):
+        c.send_discord_message(content, "#techs-live")
+    local_sec = time.perf_counter() - start
+    assert conn.discord_webhook.call_args[0][1].startswith("<@0> <@1> <@2>")
+    assert c.mention_resolution.summary()["count"] == n
+
+    # Previous approach: each mention hops into the bot's event loop
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def resolve(name):
+        return bot.index.user_id(name)
+
+    conn.discord_bot_fn_nonblocking.side_effect = (
+        lambda _, name: asyncio.run_coroutine_threadsafe(resolve(name), loop).result()
+    )
+    start = time.perf_counter()
+    for _ in range(n):
+        c.send_discord_message(content, "#techs-live")
+    hop_sec = time.perf_counter() - start
+    loop.call_soon_threadsafe(loop.stop)
+    print(
+        f"{n} messages x 50 mentions: local index {local_sec:.3f}s, "
+        f"event loop round trip {hop_sec:.3f}s; {c.mention_resolution.summary()}"
+    )
+
+
 def test_send_discord_message_dm(mocker):
     """Ensure #user targets are sent via DM"""
     mocker.patch.object(
@@ -541,6 +599,53 @@ def test_template_rendering(template_name, template_kwargs):
     assert got[0] != got[1]  # Subject should never match body
 
 
+@pytest.mark.parametrize("template_name, template_kwargs", TESTED_TEMPLATES)
+def test_template_single_pass_matches(template_name, template_kwargs):
+    """Single-pass rendering matches rendering subject and body separately"""
+    t = c.get_template(template_name)
+    assert t.merged is not None
+    assert t.render(**template_kwargs) == (
+        t.tmpl.render(**template_kwargs, subject=True).strip(),
+        t.tmpl.render(**template_kwargs, subject=False).strip(),
+        t.is_html,
+    )
+
+
+def test_render_separator_in_data_falls_back():
+    """Data containing the subject/body separator still renders correctly"""
+    val = f"a{c.SUBJECT_BODY_SEP}b"
+    assert c.render("test_template", val=val) == ("Test Subject", val, False)
+
+
+@pytest.mark.benchmark
+def test_render_benchmark():
+    """Rendering 10k messages reuses the compiled template"""
+    n = 10000
+    contexts = [{"val": f"body {i}"} for i in range(n)]
+    e, l = c._env()  # pylint: disable=protected-access
+
+    start = time.perf_counter()
+    for ctx in contexts[:1000]:  # Previous approach, sampled
+        src, _, _ = l.get_source(e, "test_template.jinja2")
+        tmpl = e.get_template("test_template.jinja2")
+        _ = (
+            tmpl.render(**ctx, subject=True).strip(),
+            tmpl.render(**ctx, subject=False).strip(),
+            src.strip().startswith("{# html #}"),
+        )
+    per_call_sec = (time.perf_counter() - start) * n / 1000
+
+    start = time.perf_counter()
+    got = [c.render("test_template", **ctx) for ctx in contexts]
+    compiled_sec = time.perf_counter() - start
+    print(
+        f"{n} renders: per-call load + two passes {per_call_sec:.3f}s "
+        f"(extrapolated), compiled single pass {compiled_sec:.3f}s"
+    )
+    assert len(got) == n
+    assert got[-1] == ("Test Subject", f"body {n-1}", False)
+
+
 @pytest.mark.parametrize("tmpl", c.get_all_templates())
 def test_all_templates_tested(tmpl):
     """Ensure that we have at least one test for every template file"""
@@ -1,5 +1,9 @@
 """Convenience methods for acting as a Cronicle job"""
 
+import json
+import logging
+import time
+from contextlib import contextmanager
 from functools import lru_cache
 from os import getenv
 
@@ -9,6 +13,8 @@ from protohaven_api.config import get_config
 # https://github.com/jhuckaby/Cronicle/blob/6cf86b783f15f4d0754c7fb6e58cad0332fd79f9/docs/Plugins.md#job-environment-variables
 JOB_ID_ENV = "JOB_ID"
 
+log = logging.getLogger("integrations.cronicle")
+
 
 @lru_cache(maxsize=1)
 def get_execution_log_link():
@@ -40,6 +46,8 @@ class Progress:
     def __init__(self, n=1, on=None):
         self.on = on or (get_execution_log_link() is not None)
         self.n = n
+        self.timings: dict[str, float] = {}
+        self.stats: dict[str, float | int] = {}
 
     def set_stages(self, n):
         """Set the number of stages of progress"""
@@ -51,3 +59,39 @@ class Progress:
         pct = f"{(v + i) / self.n:.2f}"
         if self.on:
             print('{ "progress": ' + pct + " }")
+
+    @contextmanager
+    def phase(self, name):
+        """Times a named phase of the job. Durations are logged and reported
+        to Cronicle as performance metrics; repeated phases accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            log.info(f"Phase {name} took {elapsed:.2f}s")
+            if self.on:
+                print(
+                    json.dumps(
+                        {"perf": {k: round(v, 3) for k, v in self.timings.items()}}
+                    )
+                )
+
+    def stat(self, **kwargs):
+        """Records job statistics (counts, rates etc.). These are shown as a
+        table in the Cronicle job details; repeated calls update it."""
+        self.stats.update(kwargs)
+        log.info(f"Stats: {self.stats}")
+        if self.on:
+            print(
+                json.dumps(
+                    {
+                        "table": {
+                            "title": "Stats",
+                            "header": ["Stat", "Value"],
+                            "rows": [[k, v] for k, v in self.stats.items()],
+                        }
+                    }
+                )
+            )
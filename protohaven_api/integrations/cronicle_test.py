@@ -1,5 +1,7 @@
 """Test cronicle integration"""
 
+import json
+
 from protohaven_api.integrations import cronicle as c
 
 
@@ -13,3 +15,28 @@ def test_exec_details_footer_empty(mocker):
     """Test that the footer is empty when not run in a Cronicle job context"""
     mocker.patch.object(c, "get_execution_log_link", return_value=None)
     assert c.exec_details_footer() == ""
+
+
+def test_progress_phase_timings(capsys):
+    """Phase durations accumulate and are reported as Cronicle perf metrics"""
+    p = c.Progress(on=True)
+    with p.phase("fetch"):
+        pass
+    with p.phase("fetch"):
+        pass
+    with p.phase("push"):
+        pass
+    assert set(p.timings.keys()) == {"fetch", "push"}
+    out = capsys.readouterr().out.strip().split("\n")
+    assert len(out) == 3
+    assert '"perf"' in out[-1] and '"push"' in out[-1]
+
+
+def test_progress_stat_table(capsys):
+    """Stats accumulate and are reported as a Cronicle data table"""
+    p = c.Progress(on=True)
+    p.stat(sent=1)
+    p.stat(sent=2, failed=0)
+    assert p.stats == {"sent": 2, "failed": 0}
+    out = json.loads(capsys.readouterr().out.strip().split("\n")[-1])
+    assert out["table"]["rows"] == [["sent", 2], ["failed", 0]]
@@ -14,17 +14,17 @@ from urllib.parse import urlencode, urljoin
 
 import asana
 import requests
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from square_legacy.client import Client as SquareClient
 from wyze_sdk import Client
 
 from protohaven_api.config import get_config
-from protohaven_api.integrations import discord_bot
+from protohaven_api.integrations import discord_bot, google_services
 
 log = logging.getLogger("integrations.data.connector")
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def _fmt_content(content) -> str:
     """Return response content as a string, decoding bytes when needed."""
@@ -164,23 +164,20 @@ class Connector:  # pylint: disable=too-many-public-methods
         """
         try:
             from_addr = get_config("comms/email/username")
-            creds = (
-                service_account.Credentials.from_service_account_file(
-                    get_config("google/token_path")
-                )
-                # IMPORTANT: impersonating workspace users requires configuring domain-wide
-                # delegation for the service account user, which restricts the scopes allowed.
-                # We have configured *only* sending gmail messages, and not the other scopes
-                # specified in config.yaml.
-                #
-                # Therefore, we must specifically use domain_wide_delegated_scopes
-                # See https://admin.google.com/ac/owl/domainwidedelegation
-                # https://developers.google.com/identity/protocols/oauth2/service-account#python
-                .with_scopes(
-                    get_config("google/domain_wide_delegated_scopes")
-                ).with_subject(from_addr)
+            # IMPORTANT: impersonating workspace users requires configuring domain-wide
+            # delegation for the service account user, which restricts the scopes allowed.
+            # We have configured *only* sending gmail messages, and not the other scopes
+            # specified in config.yaml.
+            #
+            # Therefore, we must specifically use domain_wide_delegated_scopes
+            # See https://admin.google.com/ac/owl/domainwidedelegation
+            # https://developers.google.com/identity/protocols/oauth2/service-account#python
+            service = google_services.get_service(
+                "gmail",
+                "v1",
+                scopes=get_config("google/domain_wide_delegated_scopes"),
+                subject=from_addr,
             )
-            service = build("gmail", "v1", credentials=creds)
             msg = MIMEText(body, "html" if html else "plain")
             msg["Subject"] = subject
             msg["From"] = from_addr
@@ -262,7 +259,7 @@ class Connector:  # pylint: disable=too-many-public-methods
         response.raise_for_status()
 
         with open(dest, "wb") as file:
-            for chunk in response.raw.stream(1024, decode_content=False):
+            for chunk in response.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False):
                 if chunk:
                     file.write(chunk)
 
@@ -317,6 +314,10 @@ class Connector:  # pylint: disable=too-many-public-methods
         """Create and return asana SectionsApi"""
         return asana.SectionsApi(self.asana_client())
 
+    def asana_events(self):
+        """Create and return asana EventsApi"""
+        return asana.EventsApi(self.asana_client())
+
     def asana_webhooks(self):
         """Create and return asana WebhooksApi"""
         return asana.WebhooksApi(self.asana_client())
@@ -338,10 +339,7 @@ class Connector:  # pylint: disable=too-many-public-methods
         self, calendar_id: str, time_min: datetime.datetime, time_max: datetime.datetime
     ):
         """Sends a calendar read request to Google Calendar"""
-        creds = service_account.Credentials.from_service_account_file(
-            get_config("google/token_path")
-        ).with_scopes(get_config("google/scopes"))
-        service = build("calendar", "v3", credentials=creds)
+        service = google_services.get_service("calendar", "v3")
         return (
             service.events()  # pylint: disable=no-member
             .list(
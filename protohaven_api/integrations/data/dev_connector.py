@@ -111,7 +111,7 @@ class DevConnector(Connector):
         """Sends a calendar read request to Google Calendar"""
         return dev_google.get_calendar(calendar_id, time_min, time_max)
 
-    def cache_server_request(  # pylint: disable=too-many-locals
+    def cache_server_request(  # pylint: disable=too-many-locals,too-many-return-statements
         self, endpoint: str, params: dict
     ):
         """Dev mode: query the local AccountCache directly instead of making HTTP calls."""
@@ -146,6 +146,15 @@ class DevConnector(Connector):
             neon_id: str = neon.cache.neon_id_from_booked_id(booked_id)
             return {"neon_id": neon_id}
 
+        if endpoint == "/neon_ids_from_booked_ids":
+            booked_ids_str: str = params.get("booked_ids", "")
+            if not booked_ids_str:
+                return {"error": "booked_ids parameter is required"}
+            neon_ids = neon.cache.neon_ids_from_booked_ids(
+                [int(b) for b in booked_ids_str.split(",")]
+            )
+            return {"neon_ids": {str(k): v for k, v in neon_ids.items()}}
+
         if endpoint == "/neon_ratelimit_ok":
             # Dev mode: use the parent's local lock-based ratelimiting.
             # No-op in dev since neon_request is fully mocked anyway.
@@ -22,6 +22,16 @@ def get_all_members():
         )
 
 
+def get_member_changes(cursor=None):  # pylint: disable=unused-argument
+    """There are no gateway events in dev, so every call is a full listing"""
+    return {
+        "cursor": None,
+        "full": True,
+        "members": list(get_all_members()),
+        "removed": [],
+    }
+
+
 def resolve_user_id(name):
     """Resolve user ID from display name"""
     for row in airtable_base.get_all_records("fake_discord", "members"):
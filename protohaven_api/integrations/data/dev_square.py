@@ -25,6 +25,14 @@ class Customers:  # pylint: disable=too-few-public-methods
                 result.append(rec["fields"]["Data"])
         return Response({"customers": result})
 
+    def search_customers(self, body):
+        """Returns customers updated since the filter's start time"""
+        since = body["query"]["filter"]["updated_at"]["start_at"]
+        result = self.list_customers().body["customers"]
+        return Response(
+            {"customers": [c for c in result if c.get("updated_at", "") >= since]}
+        )
+
 
 class Catalog:  # pylint: disable=too-few-public-methods
     """Mock catalog data"""
@@ -38,6 +46,18 @@ class Catalog:  # pylint: disable=too-few-public-methods
                 result.append(rec["fields"]["Data"])
         return Response({"objects": result})
 
+    def search_catalog_objects(self, body):
+        """Returns subscription plans updated since `begin_time`"""
+        assert body["object_types"] == ["SUBSCRIPTION_PLAN_VARIATION"]
+        result = self.list_catalog(types=body["object_types"][0]).body["objects"]
+        return Response(
+            {
+                "objects": [
+                    o for o in result if o.get("updated_at", "") >= body["begin_time"]
+                ]
+            }
+        )
+
 
 class Subscriptions:  # pylint: disable=too-few-public-methods
     """Mock subscription data"""
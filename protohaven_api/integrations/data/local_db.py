@@ -0,0 +1,67 @@
+"""Persistent local storage for data that is expensive to refetch from
+upstream services. Backed by sqlite so it has no external dependencies."""
+
+import logging
+import sqlite3
+from pathlib import Path
+from threading import RLock
+
+from protohaven_api.config import get_config
+
+MEMORY = ":memory:"
+
+
+def local_db_path(name: str) -> str:
+    """Resolves the on-disk path of the named local database, creating its
+    directory if needed. If `general/local_store_dir` is not configured, the
+    database is kept in memory and lost when the process exits."""
+    d = get_config("general/local_store_dir")
+    if not d or str(d).startswith("$"):
+        return MEMORY
+    Path(d).mkdir(parents=True, exist_ok=True)
+    return str(Path(d) / f"{name}.sqlite3")
+
+
+class LocalDB:
+    """Lazily opened, thread-safe sqlite database.
+
+    Inheritors set NAME (used for the file name) and SCHEMA (executed on open;
+    should only contain idempotent `CREATE ... IF NOT EXISTS` statements).
+    """
+
+    NAME = ""
+    SCHEMA = ""
+
+    def __init__(self, path: str | None = None):
+        self.log = logging.getLogger(f"LocalDB({self.NAME})")
+        self.path = path
+        self.mu = RLock()
+        self._conn: sqlite3.Connection | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Returns the open connection, opening it if needed"""
+        with self.mu:
+            if self._conn is None:
+                self.path = self.path or local_db_path(self.NAME)
+                self.log.info(f"Opening {self.path}")
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.executescript(self.SCHEMA)
+            return self._conn
+
+    def execute(self, sql: str, params=()) -> list[tuple]:
+        """Runs a single statement and returns all resulting rows"""
+        with self.mu, self.conn:
+            return self.conn.execute(sql, params).fetchall()
+
+    def executemany(self, sql: str, seq_of_params) -> None:
+        """Runs a statement once per entry of `seq_of_params`"""
+        with self.mu, self.conn:
+            self.conn.executemany(sql, seq_of_params)
+
+    def close(self):
+        """Closes the connection; it will be reopened on next use"""
+        with self.mu:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
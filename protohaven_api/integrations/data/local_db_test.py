@@ -0,0 +1,28 @@
+"""Test the local sqlite storage helpers"""
+
+from protohaven_api.integrations.data import local_db as l
+
+
+class DB(l.LocalDB):
+    """Simple test class"""
+
+    NAME = "test"
+    SCHEMA = "CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT);"
+
+
+def test_local_db_path_unconfigured(mocker):
+    """Local storage falls back to memory if no directory is configured"""
+    mocker.patch.object(l, "get_config", return_value=None)
+    assert l.local_db_path("test") == l.MEMORY
+    mocker.patch.object(l, "get_config", return_value="${PH_LOCAL_STORE_DIR}")
+    assert l.local_db_path("test") == l.MEMORY
+
+
+def test_local_db_persists_across_reopen(mocker, tmp_path):
+    """Data written to disk survives closing and reopening the DB"""
+    mocker.patch.object(l, "get_config", return_value=str(tmp_path / "store"))
+    db = DB()
+    db.executemany("INSERT INTO kv VALUES (?, ?)", [("a", "1"), ("b", "2")])
+    db.close()
+    assert db.path == str(tmp_path / "store" / "test.sqlite3")
+    assert DB().execute("SELECT v FROM kv ORDER BY k") == [("1",), ("2",)]
@@ -2,6 +2,10 @@
 
 import asyncio
 import logging
+import queue
+import threading
+import uuid
+from contextlib import aclosing
 from typing import Any, Callable
 from urllib.parse import urlparse
 
@@ -12,13 +16,181 @@ from protohaven_api.config import get_config
 log = logging.getLogger("discord_bot")
 
 
-class PHClient(discord.Client):
+class MemberIndex:  # pylint: disable=too-many-instance-attributes
+    """Cache of guild members and roles, so member lookups and @mention
+    resolution can be served locally from any thread instead of via the
+    bot's event loop.
+
+    Loaded in full when the bot connects, then kept current from gateway
+    member and role events. Every change bumps `version`, so consumers can
+    fetch only what changed since they last looked (see `changes_since`).
+    """
+
+    LOAD_TIMEOUT_SEC = 60.0
+
+    def __init__(self):
+        self.mu = threading.Lock()
+        self.loaded = threading.Event()
+        # Distinguishes this process's cursors from ones persisted by others
+        self.session = uuid.uuid4().hex
+        self.users: dict[str, int] = {}  # name or display name -> user ID
+        self.roles: dict[str, int] = {}  # role name -> role ID
+        self._user_names: dict[int, tuple[str, ...]] = {}
+        self._role_names: dict[int, str] = {}
+        # user ID -> (name, display_name, joined_at, role IDs)
+        self._members: dict[int, tuple] = {}
+        self.generation = 0  # Bumped on every full load
+        self.version = 0
+        self._changed: dict[int, int] = {}  # user ID -> version last changed
+        self._removed: dict[str, int] = {}  # name -> version removed
+
+    def _touch(self, uid):
+        self.version += 1
+        self._changed[uid] = self.version
+
+    def _drop_user(self, uid):
+        for n in self._user_names.pop(uid, ()):
+            if self.users.get(n) == uid:
+                del self.users[n]
+
+    def _put_user(self, m):
+        self._drop_user(m.id)
+        names = tuple({m.name, m.display_name})
+        for n in names:
+            self.users[n] = m.id
+        self._user_names[m.id] = names
+        self._members[m.id] = (
+            m.name,
+            m.display_name,
+            m.joined_at,
+            tuple(r.id for r in m.roles),
+        )
+        self._removed.pop(m.name, None)
+
+    def _put_role(self, r):
+        old = self._role_names.get(r.id)
+        if old is not None and self.roles.get(old) == r.id:
+            del self.roles[old]
+        self.roles[r.name] = r.id
+        self._role_names[r.id] = r.name
+
+    def _touch_holders(self, rid):
+        for uid, m in self._members.items():
+            if rid in m[3]:
+                self._touch(uid)
+
+    def _details(self, uid):
+        name, display_name, joined_at, rids = self._members[uid]
+        return (
+            name,
+            display_name,
+            joined_at,
+            [(self._role_names[r], r) for r in rids if r in self._role_names],
+        )
+
+    def load(self, members, roles):
+        """Replaces the index contents"""
+        with self.mu:
+            self.users, self._user_names = {}, {}
+            self.roles, self._role_names = {}, {}
+            self._members, self._changed, self._removed = {}, {}, {}
+            for m in members:
+                self._put_user(m)
+            for r in roles:
+                self._put_role(r)
+            self.generation += 1
+        self.loaded.set()
+
+    def upsert_member(self, m):
+        """Adds a member, or updates their names and roles"""
+        with self.mu:
+            old = self._members.get(m.id)
+            self._put_user(m)
+            self._touch(m.id)
+            if old is not None and old[0] != m.name:
+                self._removed[old[0]] = self.version
+
+    def remove_member(self, m):
+        """Removes a member who left the guild"""
+        with self.mu:
+            self._drop_user(m.id)
+            self._changed.pop(m.id, None)
+            old = self._members.pop(m.id, None)
+            if old is not None:
+                self.version += 1
+                self._removed[old[0]] = self.version
+
+    def upsert_role(self, r):
+        """Adds a role, or updates its name"""
+        with self.mu:
+            renamed = self._role_names.get(r.id) not in (None, r.name)
+            self._put_role(r)
+            if renamed:
+                self._touch_holders(r.id)
+
+    def remove_role(self, r):
+        """Removes a deleted role"""
+        with self.mu:
+            name = self._role_names.pop(r.id, None)
+            if name is not None and self.roles.get(name) == r.id:
+                del self.roles[name]
+            self._touch_holders(r.id)
+
+    def user_id(self, name):
+        """Returns the ID of the member with this name or display name"""
+        with self.mu:
+            return self.users.get(name)
+
+    def member(self, name):
+        """Returns details of the named member in the same format as
+        `PHClient.get_all_members`, or None if not found"""
+        with self.mu:
+            uid = self.users.get(name)
+            return None if uid is None else self._details(uid)
+
+    def members(self):
+        """Returns details of all members"""
+        with self.mu:
+            return [self._details(uid) for uid in self._members]
+
+    def changes_since(self, cursor=None, timeout=LOAD_TIMEOUT_SEC):
+        """Returns members changed since `cursor`, a value previously returned
+        by this method. All members are returned (with "full" set) if the
+        cursor is None or predates the last full load, including loads by
+        other processes.
+
+        Waits up to `timeout` seconds for the bot to load the index, and
+        raises RuntimeError if it hasn't - an empty index isn't a valid
+        full listing. Don't call this from the bot's event loop."""
+        if not self.loaded.wait(timeout):
+            raise RuntimeError("Discord member index not loaded; is the bot connected?")
+        with self.mu:
+            full = cursor is None or list(cursor[:2]) != [
+                self.session,
+                self.generation,
+            ]
+            since = 0 if full else cursor[2]
+            return {
+                "cursor": (self.session, self.generation, self.version),
+                "full": full,
+                "members": [
+                    self._details(uid)
+                    for uid in (self._members if full else self._changed)
+                    if full or self._changed[uid] > since
+                ],
+                "removed": (
+                    [] if full else [n for n, v in self._removed.items() if v > since]
+                ),
+            }
+
+
+class PHClient(discord.Client):  # pylint: disable=too-many-public-methods
     """A discord bot that handles non-webhook tasks on the Protohaven discord server"""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.role_map = {}
-        self.user_map = {}
+        self.index = MemberIndex()
         self.member_join_hook_fn: Callable[..., list[Any]] = lambda details: []
         self._stored_loop = None
 
@@ -46,14 +218,48 @@ class PHClient(discord.Client):
             self.role_map[r.name] = r
         log.info(f"Loaded {len(self.role_map)} roles")
 
-        for m in self.guild.members:
-            self.user_map[m.name] = m.id
-            self.user_map[m.display_name] = m.id
-        log.info(f"Loaded {len(self.user_map)} users")
-
-    async def resolve_user_id(self, name):
-        """Resolves a user ID from a name or display name"""
-        return self.user_map.get(name)
+        self.index.load(self.guild.members, self.guild.roles)
+        log.info(f"Loaded {len(self.index.users)} user names")
+
+    def resolve_user_id(self, name):
+        """Resolves a user ID from a name or display name. Reads only the
+        local index, so it's safe to call directly from any thread."""
+        return self.index.user_id(name)
+
+    async def on_member_update(self, _, after):
+        """Keeps the index current when a member's nickname or roles change"""
+        if after.guild == self.guild:
+            self.index.upsert_member(after)
+
+    async def on_user_update(self, _, after):
+        """Keeps the index current when a user's name changes"""
+        mem = self.guild.get_member(after.id)
+        if mem is not None:
+            self.index.upsert_member(mem)
+
+    async def on_member_remove(self, member):
+        """Drops members who leave the server from the index"""
+        if member.guild == self.guild:
+            self.index.remove_member(member)
+
+    async def on_guild_role_create(self, role):
+        """Indexes new roles"""
+        if role.guild == self.guild:
+            self.role_map[role.name] = role
+            self.index.upsert_role(role)
+
+    async def on_guild_role_update(self, before, after):
+        """Keeps role names current"""
+        if after.guild == self.guild:
+            self.role_map.pop(before.name, None)
+            self.role_map[after.name] = after
+            self.index.upsert_role(after)
+
+    async def on_guild_role_delete(self, role):
+        """Drops deleted roles"""
+        if role.guild == self.guild:
+            self.role_map.pop(role.name, None)
+            self.index.remove_role(role)
 
     async def handle_hook_action(self, fn_name, *args):
         """Handle actions yielded back from calling a hook_fn (see `on_member_join`)"""
@@ -64,6 +270,8 @@ class PHClient(discord.Client):
     async def on_member_join(self, member):
         """Runs when a new member joins the server"""
         log.info(f"New member joined: {member.name}")
+        if member.guild == self.guild:
+            self.index.upsert_member(member)
         if not self.hook_on_user_is_permitted(member.name):
             log.warning("Hook on member not permitted; skipping join hook action")
             return
@@ -121,7 +329,13 @@ class PHClient(discord.Client):
 
     async def get_all_members(self):  # pylint: disable=invalid-overridden-method
         """Retrieves all data on members and roles for the server"""
-        return [self._member_details(m) for m in self.guild.members]
+        return self.index.members()
+
+    def get_member_changes(self, cursor=None):
+        """Returns members whose names or roles changed since `cursor`; see
+        `MemberIndex.changes_since`. Reads only the local index, so it's safe
+        to call directly from any thread."""
+        return self.index.changes_since(cursor)
 
     async def get_member_channels(self):
         """Returns all channels in self.guild visible to the Members role.
@@ -178,6 +392,9 @@ class PHClient(discord.Client):
     async def get_member_details(self, discord_id):
         """Returns data in the same format as `get_all_members`
         just for a single member (if exists)"""
+        details = self.index.member(discord_id)
+        if details is not None:
+            return details
         m = self.guild.get_member_named(discord_id)
         if m is None:
             return None
@@ -270,24 +487,100 @@ def invoke_sync(fn_name, *args, **kwargs):
     ).result()
 
 
+# Items from async generators are handed to the calling thread in chunks, with
+# at most GENERATOR_MAX_CHUNKS in flight. A partial chunk is sent once its
+# first item is GENERATOR_FLUSH_SEC old, even if the source is still waiting
+# for its next item, so slow sources still stream.
+GENERATOR_CHUNK_SIZE = 100
+GENERATOR_MAX_CHUNKS = 4
+GENERATOR_FLUSH_SEC = 0.05
+
+
+def iter_async_generator(
+    agen,
+    loop,
+    chunk_size=GENERATOR_CHUNK_SIZE,
+    max_chunks=GENERATOR_MAX_CHUNKS,
+    flush_sec=GENERATOR_FLUSH_SEC,
+):
+    """Synchronously iterates the async generator `agen`, which runs on `loop`
+    (in another thread).
+
+    Items cross threads in chunks through a bounded queue: the generator
+    pauses when the consumer falls `max_chunks` behind, and is cancelled
+    (and closed) if the consumer stops iterating early. A loop timer sends a
+    partial chunk `flush_sec` after its first item, even while the generator
+    is waiting on its next one."""
+    chunks: queue.Queue = queue.Queue()
+    slots = asyncio.Semaphore(max_chunks)
+
+    async def pump():
+        chunk: list = []
+        timer = None  # Flushes the partial chunk if the source stalls
+        flushing = None  # Task sending a flushed chunk; later sends wait on it
+
+        async def send(kind, payload, after=None):
+            if after is not None:
+                await after
+            await slots.acquire()
+            chunks.put_nowait((kind, payload))
+
+        def flush():
+            nonlocal chunk, timer, flushing
+            timer = None
+            if chunk:
+                flushing = loop.create_task(send("items", chunk, flushing))
+                chunk = []
+
+        try:
+            try:
+                async with aclosing(agen):
+                    async for item in agen:
+                        if not chunk:
+                            timer = loop.call_later(flush_sec, flush)
+                        chunk.append(item)
+                        if len(chunk) >= chunk_size:
+                            timer.cancel()
+                            await send("items", chunk, flushing)
+                            chunk = []
+                end: tuple = ("done", None)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                end = ("error", e)
+            if timer:
+                timer.cancel()
+            # Items yielded before an error are still delivered
+            if chunk:
+                await send("items", chunk, flushing)
+            await send(*end, flushing)
+        finally:
+            if timer:
+                timer.cancel()
+            if flushing is not None:
+                flushing.cancel()
+
+    fut = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            kind, payload = chunks.get()
+            loop.call_soon_threadsafe(slots.release)
+            if kind == "items":
+                yield from payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+    finally:
+        fut.cancel()
+
+
 def invoke_sync_generator(fn_name, *args, **kwargs):
     """Execute synchronous function yielding results from an async generator"""
     stored_loop = client.get_stored_loop()
     if stored_loop is None:
         raise RuntimeError("Discord bot client not initialized yet")
-
-    async def wrapper():
-        async for item in getattr(client, fn_name)(*args, **kwargs):
-            yield item
-
-    generator = wrapper()
-    try:
-        while True:
-            yield asyncio.run_coroutine_threadsafe(
-                generator.__anext__(), stored_loop
-            ).result()
-    except StopAsyncIteration:
-        pass
+    yield from iter_async_generator(
+        getattr(client, fn_name)(*args, **kwargs), stored_loop
+    )
 
 
 if __name__ == "__main__":
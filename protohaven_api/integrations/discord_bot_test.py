@@ -1,6 +1,10 @@
 """Test methods for Discord bot"""
 
+import asyncio
+import threading
+import time
 from collections import namedtuple
+from types import SimpleNamespace
 
 import pytest
 from discord import HTTPException
@@ -111,3 +115,290 @@ async def test_revoke_role_http_exception(discord_bot, mocker):
     member.remove_roles.side_effect = HTTPException(mocker.MagicMock(), "HTTP error")
     result = await discord_bot.revoke_role("test_user", "Members")
     assert "HTTP error" in result
+
+
+def _obj(i, name, display_name=None, guild=None, roles=()):
+    return SimpleNamespace(
+        id=i,
+        name=name,
+        display_name=display_name or name,
+        guild=guild,
+        joined_at=None,
+        roles=list(roles),
+    )
+
+
+def test_member_index_tracks_changes():
+    """Renames, departures and name collisions are handled"""
+    idx = db.MemberIndex()
+    idx.load([_obj(1, "alice", "Al"), _obj(2, "bob")], [_obj(10, "Techs")])
+    assert idx.user_id("Al") == 1 and idx.user_id("alice") == 1
+    assert idx.roles == {"Techs": 10}
+
+    idx.upsert_member(_obj(1, "alice", "Alice B"))
+    assert idx.user_id("Al") is None
+    assert idx.user_id("Alice B") == 1
+
+    # A display name shared with another member isn't dropped when the
+    # first member changes theirs
+    idx.upsert_member(_obj(3, "carol", "bob"))
+    idx.upsert_member(_obj(2, "bobby"))
+    assert idx.user_id("bob") == 3
+
+    idx.remove_member(_obj(3, "carol", "bob"))
+    assert idx.user_id("bob") is None and idx.user_id("carol") is None
+
+    idx.upsert_role(_obj(10, "Shop Techs"))
+    idx.upsert_role(_obj(11, "Members"))
+    idx.remove_role(_obj(11, "Members"))
+    assert idx.roles == {"Shop Techs": 10}
+
+
+def test_member_index_change_feed():
+    """Only members changed since the cursor are returned"""
+    idx = db.MemberIndex()
+    techs, members = _obj(10, "Techs"), _obj(11, "Members")
+    idx.load(
+        [_obj(1, "alice", roles=[techs]), _obj(2, "bob", roles=[members])],
+        [techs, members],
+    )
+    rep = idx.changes_since(None)
+    assert rep["full"]
+    assert rep["members"] == [
+        ("alice", "alice", None, [("Techs", 10)]),
+        ("bob", "bob", None, [("Members", 11)]),
+    ]
+    cursor = rep["cursor"]
+    assert idx.changes_since(cursor) == {
+        "cursor": cursor,
+        "full": False,
+        "members": [],
+        "removed": [],
+    }
+
+    idx.upsert_member(_obj(2, "bob", "Bobby", roles=[members, techs]))
+    idx.remove_member(_obj(1, "alice"))
+    rep = idx.changes_since(cursor)
+    assert rep["members"] == [("bob", "Bobby", None, [("Members", 11), ("Techs", 10)])]
+    assert rep["removed"] == ["alice"]
+    assert idx.member("Bobby") == rep["members"][0]
+
+    # Renaming a role changes every member holding it; a username change
+    # removes the old name
+    cursor = rep["cursor"]
+    idx.upsert_member(_obj(3, "carol"))
+    cursor2 = idx.changes_since(cursor)["cursor"]
+    idx.upsert_role(_obj(10, "Shop Techs"))
+    idx.upsert_member(_obj(3, "caroline"))
+    rep = idx.changes_since(cursor2)
+    assert rep["members"] == [
+        ("bob", "Bobby", None, [("Members", 11), ("Shop Techs", 10)]),
+        ("caroline", "caroline", None, []),
+    ]
+    assert rep["removed"] == ["carol"]
+
+    idx.remove_role(_obj(10, "Shop Techs"))
+    assert idx.changes_since(rep["cursor"])["members"] == [
+        ("bob", "Bobby", None, [("Members", 11)])
+    ]
+
+    # A reload invalidates old cursors, as does a restart
+    idx.load([], [])
+    assert idx.changes_since(rep["cursor"])["full"]
+    idx2 = db.MemberIndex()
+    idx2.load([], [])
+    assert idx2.changes_since(idx.changes_since()["cursor"])["full"]
+
+
+def test_member_index_changes_wait_for_load():
+    """Changes aren't served from an index the bot hasn't loaded yet"""
+    idx = db.MemberIndex()
+    with pytest.raises(RuntimeError):
+        idx.changes_since(None, timeout=0.01)
+    threading.Timer(0.05, idx.load, ([_obj(1, "alice")], [])).start()
+    assert idx.changes_since(None, timeout=5)["members"] == [
+        ("alice", "alice", None, [])
+    ]
+
+
+@pytest.mark.asyncio
+async def test_gateway_events_update_index(discord_bot, mocker):
+    """Gateway member and role events keep the index current"""
+    g = discord_bot.guild
+    discord_bot.index.load([_obj(1, "alice")], [])
+    await discord_bot.on_member_update(None, _obj(1, "alice", "Al", guild=g))
+    assert discord_bot.resolve_user_id("Al") == 1
+
+    mocker.patch.object(db, "get_config", return_value=False)  # No join hooks
+    await discord_bot.on_member_join(_obj(2, "bob", guild=g))
+    assert discord_bot.resolve_user_id("bob") == 2
+    await discord_bot.on_member_remove(_obj(2, "bob", guild=g))
+    assert discord_bot.resolve_user_id("bob") is None
+
+    await discord_bot.on_member_update(None, _obj(5, "other", guild="elsewhere"))
+    assert discord_bot.resolve_user_id("other") is None
+
+    role = _obj(20, "Instructors", guild=g)
+    await discord_bot.on_guild_role_create(role)
+    assert discord_bot.role_map["Instructors"] is role
+    renamed = _obj(20, "Educators", guild=g)
+    await discord_bot.on_guild_role_update(role, renamed)
+    assert "Instructors" not in discord_bot.role_map
+    assert discord_bot.index.roles["Educators"] == 20
+    await discord_bot.on_guild_role_delete(renamed)
+    assert "Educators" not in discord_bot.role_map
+    assert "Educators" not in discord_bot.index.roles
+
+
+@pytest.fixture(name="bg_loop")
+def fixture_bg_loop():
+    """An event loop running in another thread, like the bot's"""
+    loop = asyncio.new_event_loop()
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    t.join()
+
+
+class FakeSource:  # pylint: disable=too-few-public-methods
+    """In-process async source of `n` messages that records progress"""
+
+    def __init__(self, n, fail_at=None):
+        self.n = n
+        self.fail_at = fail_at
+        self.produced = 0
+        self.closed = False
+
+    async def history(self):
+        """Yields fake channel messages"""
+        try:
+            for i in range(self.n):
+                if i == self.fail_at:
+                    raise RuntimeError("source failed")
+                self.produced += 1
+                yield {"ref": i, "content": f"message {i}"}
+        finally:
+            self.closed = True
+
+
+def test_iter_async_generator_streams_in_order(bg_loop):
+    """All items arrive in order, including a final partial chunk"""
+    src = FakeSource(250)
+    got = list(db.iter_async_generator(src.history(), bg_loop, chunk_size=100))
+    assert [m["ref"] for m in got] == list(range(250))
+    assert src.closed
+
+
+def test_iter_async_generator_propagates_errors(bg_loop):
+    """Errors in the source are raised in the consumer after all earlier
+    items, including those in the partial chunk"""
+    src = FakeSource(250, fail_at=120)
+    got = []
+    with pytest.raises(RuntimeError, match="source failed"):
+        for m in db.iter_async_generator(src.history(), bg_loop, chunk_size=50):
+            got.append(m)
+    assert [m["ref"] for m in got] == list(range(120))
+
+
+def test_iter_async_generator_error_before_first_chunk(bg_loop):
+    """Items yielded before an error arrive even if no chunk was sent yet"""
+
+    async def fails():
+        for i in range(5):
+            yield i
+        raise ValueError("partway")
+
+    got = []
+    with pytest.raises(ValueError, match="partway"):
+        for i in db.iter_async_generator(fails(), bg_loop, flush_sec=60):
+            got.append(i)
+    assert got == [0, 1, 2, 3, 4]
+
+
+def test_iter_async_generator_backpressure_and_cancel(bg_loop):
+    """The source pauses when the consumer falls behind, and is closed when
+    the consumer stops early"""
+    src = FakeSource(100000)
+    it = db.iter_async_generator(src.history(), bg_loop, chunk_size=10, max_chunks=2)
+    next(it)
+    time.sleep(0.1)
+    # The chunk being read, two queued, and one waiting for a slot
+    assert src.produced <= 10 * 4
+    it.close()
+    deadline = time.monotonic() + 2
+    while not src.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert src.closed
+    assert src.produced < 100000
+
+
+def test_iter_async_generator_flushes_slow_source(bg_loop):
+    """Items from a slow source aren't held back waiting for a full chunk"""
+
+    resume = asyncio.Event()
+
+    async def slow():
+        yield 1
+        await resume.wait()
+        yield 2
+
+    it = db.iter_async_generator(slow(), bg_loop, chunk_size=100, flush_sec=0.0)
+    # Resumes eventually regardless, so a regression fails instead of hanging
+    bg_loop.call_soon_threadsafe(bg_loop.call_later, 2, resume.set)
+    assert next(it) == 1
+    assert not resume.is_set()
+    bg_loop.call_soon_threadsafe(resume.set)
+    assert list(it) == [2]
+
+
+def test_iter_async_generator_flushes_stalled_source(bg_loop):
+    """A partial chunk is delivered after flush_sec even while the source is
+    stalled waiting for its next item"""
+    resume = asyncio.Event()
+
+    async def stalls():
+        for i in range(3):
+            yield i
+        await resume.wait()
+        yield 3
+
+    it = db.iter_async_generator(stalls(), bg_loop, chunk_size=100, flush_sec=0.05)
+    got = []
+    t = threading.Thread(target=lambda: got.extend(it), daemon=True)
+    t.start()
+    deadline = time.monotonic() + 2
+    while len(got) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert got == [0, 1, 2]
+    bg_loop.call_soon_threadsafe(resume.set)
+    t.join(2)
+    assert got == [0, 1, 2, 3]
+
+
+@pytest.mark.benchmark
+def test_iter_async_generator_benchmark(bg_loop):
+    """Chunked streaming vs. one thread hop per item"""
+    n = 20000
+
+    def per_item(agen):  # Previous approach
+        try:
+            while True:
+                yield asyncio.run_coroutine_threadsafe(anext(agen), bg_loop).result()
+        except StopAsyncIteration:
+            pass
+
+    start = time.perf_counter()
+    assert sum(1 for _ in per_item(FakeSource(n).history())) == n
+    per_item_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert (
+        sum(1 for _ in db.iter_async_generator(FakeSource(n).history(), bg_loop)) == n
+    )
+    chunked_sec = time.perf_counter() - start
+    print(
+        f"{n} items: per-item hops {per_item_sec:.3f}s "
+        f"({n / per_item_sec:.0f}/s), chunked {chunked_sec:.3f}s "
+        f"({n / chunked_sec:.0f}/s)"
+    )
@@ -2,21 +2,24 @@
 
 import logging
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
-from protohaven_api.config import get_config
+from protohaven_api.integrations import google_services
 
 log = logging.getLogger("integrations.drive")
 
+# Uploads are sent in chunks. A chunk that fails is retried with backoff
+# UPLOAD_RETRIES times; if it still fails, the upload is resumed from the last
+# byte Drive acknowledged, up to UPLOAD_RESUMES times, instead of restarting.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_RETRIES = 5
+UPLOAD_RESUMES = 3
+
 
 def _svc():
-    """Creates the service"""
-    creds = service_account.Credentials.from_service_account_file(
-        get_config("google/token_path")
-    ).with_scopes(get_config("google/scopes"))
-    return build("drive", "v3", credentials=creds)
+    """Returns the (cached) service"""
+    return google_services.get_service("drive", "v3")
 
 
 def get_drive_map():
@@ -28,23 +31,39 @@ def get_drive_map():
 
 def upload_file(src, mimetype, dest, parent_id):
     """Uploads a file to Google Drive on the specified `parent_id`"""
-    media = MediaFileUpload(src, mimetype=mimetype, resumable=True)
+    media = MediaFileUpload(
+        src, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True
+    )
     file_metadata = {
         "name": str(dest),
         "parents": [parent_id],  # Use the drive ID for a shared drive location
     }
 
     log.info(f"Uploading {src} to {dest} on gdrive {parent_id}")
-    file = (
-        _svc()  # pylint: disable=no-member
+    request = (
+        _svc()
         .files()
-        .create(
+        .create(  # pylint: disable=no-member
             body=file_metadata,
             media_body=media,
             fields="id",
             supportsAllDrives=True,  # https://stackoverflow.com/a/56468780
         )
-        .execute()
     )
+    file = None
+    resumes = 0
+    while file is None:
+        try:
+            status, file = request.next_chunk(num_retries=UPLOAD_RETRIES)
+        except (HttpError, OSError) as e:
+            if resumes >= UPLOAD_RESUMES or (
+                isinstance(e, HttpError) and e.resp.status < 500
+            ):
+                raise
+            resumes += 1
+            log.warning(f"Upload of {dest} interrupted ({e}); resuming")
+            continue
+        if status:
+            log.info(f"Uploaded {status.progress():.0%} of {dest}")
 
     return file.get("id")
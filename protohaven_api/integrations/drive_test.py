@@ -1,6 +1,12 @@
 """Tests for google drive integration"""
 
+import os
+import time
+
+import pytest
+
 import protohaven_api.integrations.drive as d
+from protohaven_api.testing import StubFileServer
 
 
 def test_get_drive_map(mocker):
@@ -24,7 +30,10 @@ def test_upload_file(mocker):
     mock_media_upload = mocker.patch.object(d, "MediaFileUpload")
     mock_svc = mocker.patch.object(d, "_svc")
     mock_files_create = mock_svc.return_value.files.return_value.create
-    mock_files_create.return_value.execute.return_value = {"id": "test_id"}
+    mock_files_create.return_value.next_chunk.side_effect = [
+        (mocker.Mock(progress=lambda: 0.5), None),
+        (None, {"id": "test_id"}),
+    ]
 
     src = "path/to/source/file"
     mimetype = "test/mimetype"
@@ -33,7 +42,9 @@ def test_upload_file(mocker):
 
     file_id = d.upload_file(src, mimetype, dest, parent_id)
 
-    mock_media_upload.assert_called_once_with(src, mimetype=mimetype, resumable=True)
+    mock_media_upload.assert_called_once_with(
+        src, mimetype=mimetype, chunksize=d.UPLOAD_CHUNK_SIZE, resumable=True
+    )
     mock_svc.assert_called_once()
     mock_files_create.assert_called_once_with(
         body={"name": dest, "parents": [parent_id]},
@@ -42,3 +53,64 @@ def test_upload_file(mocker):
         supportsAllDrives=True,
     )
     assert file_id == "test_id"
+
+
+def _upload(mocker, tmp_path, stub, size):
+    src = tmp_path / "backup.tar.gz"
+    content = os.urandom(size)
+    src.write_bytes(content)
+    mocker.patch.object(d, "_svc", return_value=stub.drive())
+    file_id = d.upload_file(str(src), "application/x-gzip-compressed", "dest", "p")
+    assert file_id == f"file{size}"
+    assert bytes(stub.uploads["0"]) == content
+
+
+def test_upload_file_resumes(mocker, tmp_path):
+    """A chunk that keeps failing resumes from the last acknowledged byte
+    instead of restarting the upload"""
+    mocker.patch.object(d, "UPLOAD_CHUNK_SIZE", 256 * 1024)
+    mocker.patch.object(d, "UPLOAD_RETRIES", 0)
+    size = 4 * 256 * 1024 + 100
+    with StubFileServer({}, fail_puts={2}) as stub:
+        _upload(mocker, tmp_path, stub, size)
+
+    puts = [r[2] for r in stub.requests if r[0] == "PUT"]
+    assert puts == [
+        f"0-262143/{size}",
+        f"262144-524287/{size}",
+        f"524288-786431/{size}",  # Fails
+        f"*/{size}",  # Asks where to resume
+        f"524288-786431/{size}",
+        f"786432-1048575/{size}",
+        f"1048576-1048675/{size}",
+    ]
+
+
+def test_upload_file_gives_up(mocker, tmp_path):
+    """Uploads fail once they've been resumed UPLOAD_RESUMES times"""
+    mocker.patch.object(d, "UPLOAD_CHUNK_SIZE", 256 * 1024)
+    mocker.patch.object(d, "UPLOAD_RETRIES", 0)
+    with StubFileServer({}, fail_puts=range(100)) as stub:
+        with pytest.raises(d.HttpError):
+            _upload(mocker, tmp_path, stub, 1024 * 1024)
+    chunk_puts = [r for r in stub.requests if r[0] == "PUT" and "*" not in r[2]]
+    assert len(chunk_puts) == d.UPLOAD_RESUMES + 1
+
+
+@pytest.mark.benchmark
+def test_upload_file_benchmark(mocker, tmp_path):
+    """Upload throughput with small vs. large chunks, against a local
+    endpoint adding 10ms of latency per request"""
+    size = 32 * 1024 * 1024
+    got = {}
+    for chunksize in (256 * 1024, d.UPLOAD_CHUNK_SIZE):
+        mocker.patch.object(d, "UPLOAD_CHUNK_SIZE", chunksize)
+        with StubFileServer({}, latency=0.01) as stub:
+            start = time.perf_counter()
+            _upload(mocker, tmp_path, stub, size)
+            got[chunksize] = time.perf_counter() - start
+    for chunksize, sec in got.items():
+        print(
+            f"Upload {size >> 20}MB in {chunksize >> 10}KB chunks: "
+            f"{sec:.2f}s ({size / sec / 1e6:.1f}MB/s)"
+        )
@@ -0,0 +1,123 @@
+"""Shared Google API service clients (Calendar, Gmail, Sheets, Drive).
+
+Building a service client loads the service account key file and parses the
+API's discovery document, which costs far more than a typical request. Clients
+are built once and reused instead.
+
+Credentials are shared by all threads and refresh their access token as
+needed. The underlying httplib2 transport is not thread-safe, so each client is
+leased to one thread at a time. Clients leased to threads that have exited are
+returned to a small idle pool for the next thread to pick up, so short-lived
+request and executor threads don't each build their own. Clients are rebuilt
+after MAX_AGE_SEC, or after `invalidate()` (e.g. when the key file is rotated).
+"""
+
+import logging
+import threading
+import time
+from typing import Any
+
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+from protohaven_api.config import get_config
+
+log = logging.getLogger("integrations.google_services")
+
+
+class ServiceCache:
+    """Thread-safe pool of Google API service clients.
+
+    `transport` is a factory for the HTTP object that carries requests; it is
+    wrapped with the cached credentials for each client.
+    """
+
+    MAX_AGE_SEC = 3600.0
+    # Idle clients kept per API, scopes and subject; extras are dropped
+    MAX_IDLE = 4
+
+    def __init__(self, transport=build_http):
+        self.transport = transport
+        self.mu = threading.Lock()
+        self._creds: dict[tuple, service_account.Credentials] = {}
+        # Clients in use, by key and then by the ident of the thread using them
+        self._leased: dict[tuple, dict[int, tuple[float, Any]]] = {}
+        self._idle: dict[tuple, list[tuple[float, Any]]] = {}
+        self.builds = 0
+
+    def credentials(self, scopes: tuple, subject: str | None = None):
+        """Returns service account credentials for `scopes`, impersonating
+        `subject` if given (requires domain-wide delegation)"""
+        key = (scopes, subject)
+        with self.mu:
+            if key not in self._creds:
+                creds = service_account.Credentials.from_service_account_file(
+                    get_config("google/token_path")
+                ).with_scopes(list(scopes))
+                if subject:
+                    creds = creds.with_subject(subject)
+                self._creds[key] = creds
+            return self._creds[key]
+
+    def _reclaim(self):
+        """Returns clients leased to exited threads to the idle pool. Must be
+        called with `mu` held."""
+        alive = {t.ident for t in threading.enumerate()}
+        for key, leased in self._leased.items():
+            for ident in [i for i in leased if i not in alive]:
+                entry = leased.pop(ident)
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.MAX_IDLE:
+                    idle.append(entry)
+
+    def _lease(self, key, now):
+        """Returns a fresh client for `key` leased to the calling thread, or
+        None if one must be built. Must be called with `mu` held."""
+        ident = threading.get_ident()
+        leased = self._leased.setdefault(key, {})
+        entry = leased.pop(ident, None)
+        if entry is None:
+            self._reclaim()
+            idle = self._idle.get(key, [])
+            entry = idle.pop() if idle else None
+        if entry is None or now - entry[0] > self.MAX_AGE_SEC:
+            return None
+        leased[ident] = entry
+        return entry[1]
+
+    def get(self, name: str, version: str, scopes=None, subject: str | None = None):
+        """Returns a client for the `name` API at `version` for use by the
+        calling thread, building it if needed. `scopes` defaults to
+        `google/scopes`."""
+        scopes = tuple(scopes or get_config("google/scopes"))
+        key = (name, version, scopes, subject)
+        now = time.monotonic()
+        with self.mu:
+            svc = self._lease(key, now)
+        if svc is not None:
+            return svc
+
+        http = AuthorizedHttp(self.credentials(scopes, subject), http=self.transport())
+        svc = build(name, version, http=http, cache_discovery=False)
+        with self.mu:
+            self._leased.setdefault(key, {})[threading.get_ident()] = (now, svc)
+            self.builds += 1
+        log.debug(f"Built {name} {version} client for {subject or 'default'}")
+        return svc
+
+    def invalidate(self):
+        """Drops all credentials and clients; they are rebuilt on next use"""
+        with self.mu:
+            self._creds.clear()
+            self._leased.clear()
+            self._idle.clear()
+
+
+services = ServiceCache()
+
+
+def get_service(name: str, version: str, scopes=None, subject: str | None = None):
+    """Returns a reusable client for the named Google API"""
+    return services.get(name, version, scopes, subject)
@@ -0,0 +1,206 @@
+"""Tests for shared Google API service clients"""
+
+import json
+import threading
+import time
+
+import httplib2
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+
+from protohaven_api.integrations import google_services as g
+from protohaven_api.testing import d
+
+SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
+
+
+class StubTransport:  # pylint: disable=too-few-public-methods
+    """Local stand-in for httplib2.Http. Answers OAuth token requests and
+    returns an empty event list for everything else."""
+
+    calls: list[str] = []
+
+    def __init__(self):
+        self.timeout = None
+        self.connections: dict = {}
+        self.follow_redirects = True
+        self.redirect_codes = set()
+
+    def request(self, uri, method="GET", body=None, headers=None, **_):
+        """Records and answers a request"""
+        self.calls.append(uri)
+        if "token" in uri:
+            content = {"access_token": "tok", "expires_in": 3600}
+        else:
+            assert headers["authorization"] == "Bearer tok"
+            content = {"items": [], "method": method, "body": body}
+        return httplib2.Response({"status": "200"}), json.dumps(content).encode()
+
+
+@pytest.fixture(name="key_file")
+def fixture_key_file(tmp_path, mocker):
+    """A throwaway service account key, configured as google/token_path"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "credentials.json"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "service_account",
+                "project_id": "test",
+                "private_key_id": "1",
+                "private_key": key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption(),
+                ).decode(),
+                "client_email": "test@test.iam.gserviceaccount.com",
+                "client_id": "1",
+                "token_uri": "https://oauth2.googleapis.com/token",
+            }
+        )
+    )
+    mocker.patch.object(
+        g,
+        "get_config",
+        side_effect=lambda k, *_: {
+            "google/token_path": str(path),
+            "google/scopes": SCOPES,
+        }[k],
+    )
+    StubTransport.calls = []
+    return str(path)
+
+
+def _list_events(svc):
+    return (
+        svc.events()
+        .list(
+            calendarId="cal",
+            timeMin=d(0).isoformat(),
+            timeMax=d(1).isoformat(),
+            singleEvents=True,
+        )
+        .execute()
+    )
+
+
+def test_get_service_reused_per_thread(key_file):  # pylint: disable=unused-argument
+    """Concurrent threads get their own clients, which share credentials"""
+    sc = g.ServiceCache(transport=StubTransport)
+    svc = sc.get("calendar", "v3")
+    assert sc.get("calendar", "v3") is svc
+    assert _list_events(svc)["items"] == []
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(sc.get("calendar", "v3")))
+    t.start()
+    t.join()
+    assert other[0] is not svc
+    assert sc.builds == 2
+    assert len(sc._creds) == 1  # pylint: disable=protected-access
+
+    # Impersonation uses separate credentials
+    assert sc.get("gmail", "v1", scopes=SCOPES, subject="a@b.com") is not svc
+    assert len(sc._creds) == 2  # pylint: disable=protected-access
+
+
+def _in_threads(n, fn):
+    """Runs `fn` in `n` threads that all call it before any of them exit"""
+    barrier = threading.Barrier(n)
+    got = []
+
+    def run():
+        got.append(fn())
+        barrier.wait(5)
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return got
+
+
+def test_get_service_reused_after_thread_exits(
+    key_file,
+):  # pylint: disable=unused-argument
+    """Clients of exited threads are picked up by later threads, and only
+    MAX_IDLE of them are kept"""
+    sc = g.ServiceCache(transport=StubTransport)
+    for _ in range(5):
+        _in_threads(1, lambda: sc.get("calendar", "v3"))
+    assert sc.builds == 1
+
+    n = sc.MAX_IDLE + 2
+    got = _in_threads(n, lambda: _list_events(sc.get("calendar", "v3")))
+    assert len(got) == n
+    assert sc.builds == n
+    sc.get("calendar", "v3")
+    assert sc.builds == n
+    key = ("calendar", "v3", tuple(SCOPES), None)
+    assert len(sc._idle[key]) == sc.MAX_IDLE - 1  # pylint: disable=protected-access
+
+
+def test_get_service_lifetime(mocker, key_file):  # pylint: disable=unused-argument
+    """Clients are rebuilt after MAX_AGE_SEC or on invalidate()"""
+    sc = g.ServiceCache(transport=StubTransport)
+    svc = sc.get("drive", "v3")
+    sc.invalidate()
+    svc2 = sc.get("drive", "v3")
+    assert svc2 is not svc
+    mocker.patch.object(g.time, "monotonic", return_value=time.monotonic() + 7200)
+    assert sc.get("drive", "v3") is not svc2
+    assert sc.builds == 3
+
+
+def test_get_service_refreshes_token(key_file):  # pylint: disable=unused-argument
+    """The access token is fetched once and reused until it expires"""
+    sc = g.ServiceCache(transport=StubTransport)
+    svc = sc.get("calendar", "v3")
+    for _ in range(3):
+        _list_events(svc)
+    assert sum("token" in c for c in StubTransport.calls) == 1
+
+    sc.credentials(tuple(SCOPES)).expiry = d(-1).replace(tzinfo=None)
+    _list_events(svc)
+    assert sum("token" in c for c in StubTransport.calls) == 2
+
+
+@pytest.mark.benchmark
+def test_get_service_benchmark(key_file):
+    """Per-call overhead of cached clients vs. building one per call"""
+    n = 20
+    start = time.perf_counter()
+    for _ in range(n):
+        creds = service_account.Credentials.from_service_account_file(
+            key_file
+        ).with_scopes(SCOPES)
+        svc = build(
+            "calendar",
+            "v3",
+            http=g.AuthorizedHttp(creds, http=StubTransport()),
+            cache_discovery=False,
+        )
+        _list_events(svc)
+    uncached_sec = time.perf_counter() - start
+    uncached_tokens = sum("token" in c for c in StubTransport.calls)
+
+    StubTransport.calls = []
+    sc = g.ServiceCache(transport=StubTransport)
+    start = time.perf_counter()
+    for _ in range(n):
+        _list_events(sc.get("calendar", "v3"))
+    cached_sec = time.perf_counter() - start
+    cached_tokens = sum("token" in c for c in StubTransport.calls)
+
+    print(
+        f"{n} calendar requests: built per call {uncached_sec:.3f}s "
+        f"({uncached_tokens} token fetches), cached {cached_sec:.3f}s "
+        f"({cached_tokens} token fetches)"
+    )
+    assert sc.builds == 1
+    assert uncached_tokens == n
+    assert cached_tokens == 1
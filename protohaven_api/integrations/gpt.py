@@ -1,23 +1,123 @@
 """Functions invoking LLMs and passing prompts"""
 
+import hashlib
+import json
+import logging
+import time
+
 from openai import OpenAI
 
 from protohaven_api.config import get_config
+from protohaven_api.integrations.data.local_db import LocalDB
+
+log = logging.getLogger("integrations.gpt")
+
+MODEL = "gpt-4o"
+STUB_MODEL = "stub"
+
+
+# Cached results older than this are pruned
+RESULT_MAX_AGE_SEC = 180 * 24 * 3600
+
+
+class ResultCache(LocalDB):
+    """Results of past LLM calls. Each result is stored under a scope (e.g.
+    one channel on one day) along with a digest of the model, directive and
+    content that produced it; a new result for the same scope replaces the
+    old one, and results are pruned once they're RESULT_MAX_AGE_SEC old."""
+
+    NAME = "gpt_results"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scoped_results (
+            scope TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS scoped_results_created
+            ON scoped_results (created);
+    """
+
+    def get(self, scope: str, digest: str) -> str | None:
+        """Returns the cached result for `scope`, if it was produced from
+        content with the given digest"""
+        rows = self.execute(
+            "SELECT result FROM scoped_results WHERE scope=? AND digest=?",
+            (scope, digest),
+        )
+        return rows[0][0] if rows else None
+
+    def put(self, scope: str, digest: str, result: str, now=None):
+        """Caches a result, replacing any older one for the same scope"""
+        now = now or time.time()
+        self.execute(
+            "INSERT OR REPLACE INTO scoped_results VALUES (?, ?, ?, ?)",
+            (scope, digest, result, now),
+        )
+        self.prune(now - RESULT_MAX_AGE_SEC)
+
+    def prune(self, before: float):
+        """Deletes results created before `before`"""
+        self.execute("DELETE FROM scoped_results WHERE created < ?", (before,))
+
 
+cache = ResultCache()
 
-def _act_on_content(directive, content):
-    """Invoke GPT on sequential content and return the result"""
+
+def _model() -> str:
+    """Returns the model to complete with. A stub stands in for the LLM in
+    dev mode (and tests) when no API key is configured; anywhere else, a
+    missing key is an error rather than made-up summaries."""
+    key = get_config("openai/api_key")
+    if key and not str(key).startswith("$"):
+        return MODEL
+    if get_config("general/server_mode").lower() == "dev":
+        return STUB_MODEL
+    log.error("openai/api_key is not configured; can't summarize")
+    raise RuntimeError("openai/api_key is not configured")
+
+
+def _stub_complete(directive, content):
+    """Deterministic stand-in for an LLM completion"""
+    digest = hashlib.sha256(json.dumps([directive, content]).encode()).hexdigest()
+    first = content[0][:80] if content else ""
+    return f"Summary of {len(content)} item(s) [{digest[:8]}]: {first}"
+
+
+def _complete(model, directive, content):
+    if model == STUB_MODEL:
+        return _stub_complete(directive, content)
     client = OpenAI(api_key=get_config("openai/api_key"))
     response = client.chat.completions.create(
-        model="gpt-4o",
+        model=model,
         messages=[{"role": "system", "content": directive}]
         + [{"role": "user", "content": c} for c in content],
     )
     return response.choices[0].message.content
 
 
-def summarize_message_history(msgs):
-    """Summarize history of chat messages"""
+def _act_on_content(directive, content, scope=None):
+    """Invoke GPT on sequential content and return the result. Results are
+    cached under `scope` (or the content digest, if no scope is given) and
+    reused while the content is unchanged."""
+    model = _model()
+    digest = hashlib.sha256(
+        json.dumps([model, directive, list(content)]).encode()
+    ).hexdigest()
+    scope = scope or digest
+    result = cache.get(scope, digest)
+    if result is not None:
+        log.info(f"Using cached result for {scope} ({len(content)} item(s))")
+        return result
+    result = _complete(model, directive, content)
+    if result is not None:
+        cache.put(scope, digest, result)
+    return result
+
+
+def summarize_message_history(msgs, scope=None):
+    """Summarize history of chat messages. `scope` names what the messages
+    cover (e.g. a channel and day) for caching."""
     return _act_on_content(
         "Create a summary for a newsletter about Protohaven, Pittsburgh’s Premier Makerspace, \
         using highlights from Discord chats by members. The audience consists of Protohaven \
@@ -30,6 +130,21 @@ def summarize_message_history(msgs):
         Integrate these insights directly into the content without introductory or concluding \
         remarks.",
         msgs,
+        scope,
+    )
+
+
+def merge_summaries(summaries, scope=None):
+    """Combines sequential summaries of the same chat (e.g. one per day) into
+    one summary"""
+    return _act_on_content(
+        "Combine these consecutive daily summaries of one Discord channel of \
+        Protohaven, Pittsburgh’s Premier Makerspace, into a single summary for a \
+        newsletter. Keep the 2-3 most notable topics, emphasizing recurring themes \
+        over isolated comments. Use simple and informal language, without \
+        introductory or concluding remarks.",
+        summaries,
+        scope,
     )
 
 
@@ -0,0 +1,57 @@
+"""Tests for LLM invocation"""
+
+import pytest
+
+from protohaven_api.integrations import gpt as g
+from protohaven_api.integrations.data.local_db import MEMORY
+
+
+def _config(mocker, mode, key):
+    mocker.patch.object(
+        g,
+        "get_config",
+        side_effect=lambda k, *_: {
+            "general/server_mode": mode,
+            "openai/api_key": key,
+        }[k],
+    )
+
+
+@pytest.mark.parametrize(
+    "mode,key,want",
+    [
+        ("prod", "sk-123", g.MODEL),
+        ("dev", "sk-123", g.MODEL),
+        ("dev", "${OPENAI_API_KEY}", g.STUB_MODEL),
+        ("dev", None, g.STUB_MODEL),
+    ],
+)
+def test_model(mocker, mode, key, want):
+    """The stub is only used in dev mode without a key"""
+    _config(mocker, mode, key)
+    assert g._model() == want  # pylint: disable=protected-access
+
+
+@pytest.mark.parametrize("key", [None, "", "${OPENAI_API_KEY}"])
+def test_missing_key_in_prod_raises(mocker, key):
+    """A prod deployment without a key fails rather than returning stub
+    summaries"""
+    _config(mocker, "prod", key)
+    mocker.patch.object(g, "cache", g.ResultCache(MEMORY))
+    with pytest.raises(RuntimeError, match="api_key"):
+        g.summarize_message_history(["hello"])
+
+
+def test_result_cache_scopes_and_prunes():
+    """A new result replaces the old one for its scope, and old results are
+    pruned"""
+    c = g.ResultCache(MEMORY)
+    c.put("chan/day", "d1", "first", now=100)
+    assert c.get("chan/day", "d1") == "first"
+    c.put("chan/day", "d2", "second", now=200)
+    assert c.get("chan/day", "d1") is None
+    assert c.get("chan/day", "d2") == "second"
+
+    c.put("other", "d3", "third", now=200 + g.RESULT_MAX_AGE_SEC + 1)
+    assert c.get("chan/day", "d2") is None
+    assert c.get("other", "d3") == "third"
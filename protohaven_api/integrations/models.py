@@ -1206,6 +1206,7 @@ class SignInEvent:
             "email": ("Email", "UNKNOWN"),
             "status": ("Status", "UNKNOWN"),
             "name": ("Full Name", ""),
+            "neon_id": ("Neon ID", None),
         }
         if attr in resolvable_fields:
             k, d = resolvable_fields[attr]
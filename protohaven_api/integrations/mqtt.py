@@ -2,15 +2,22 @@
 
 import json
 import logging
+import os
+import queue
 import socket
 import threading
 import time
+import zlib
+from collections.abc import MutableMapping
 from pathlib import Path
+from typing import Any
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import MQTTProtocolVersion
 
 from protohaven_api.config import get_config
+from protohaven_api.integrations.data.local_db import LocalDB
+from protohaven_api.metrics import LatencyStats
 
 log = logging.getLogger("integrations.mqtt")
 
@@ -29,15 +36,185 @@ class TopicAttribute:  # pylint: disable=too-few-public-methods
 
     MAINTENANCE = "maint"
     RESERVATION = "resrv"
+    RESERVATION_STATE = "resrv_state"
     HEARTBEAT = "heartbeat"
     SIGNIN = "signin"
     CLEARANCE = "clearance"
 
 
-class Client:
+class TopicTrie(MutableMapping):
+    """Maps MQTT topic filters (which may contain `+` and `#` wildcards) to
+    values, matching concrete topics in time proportional to topic depth
+    rather than to the number of filters.
+
+    Behaves as a dict keyed by filter for registration bookkeeping."""
+
+    def __init__(self):
+        self._root: dict = {}  # level -> child node; values kept under None
+        self._filters: dict[str, Any] = {}
+
+    def __getitem__(self, topic_filter):
+        return self._filters[topic_filter]
+
+    def __setitem__(self, topic_filter, value):
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.setdefault(level, {})
+        node[None] = topic_filter
+        self._filters[topic_filter] = value
+
+    def __delitem__(self, topic_filter):
+        del self._filters[topic_filter]
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            path.append(path[-1][level])
+        del path[-1][None]
+        # Prune now-empty branches
+        for parent, level, node in zip(
+            reversed(path[:-1]), reversed(topic_filter.split("/")), reversed(path)
+        ):
+            if node:
+                break
+            del parent[level]
+
+    def __iter__(self):
+        return iter(list(self._filters))
+
+    def __len__(self):
+        return len(self._filters)
+
+    def match(self, topic) -> list[str]:
+        """Returns all registered filters matching the concrete `topic`"""
+        levels = topic.split("/")
+        result = []
+        # Per the MQTT spec, wildcards at the first level don't match topics
+        # starting with "$" (e.g. $SYS)
+        wild_ok = not topic.startswith("$")
+        nodes = [self._root]
+        for i, level in enumerate(levels):
+            nxt = []
+            for node in nodes:
+                if "#" in node and (i > 0 or wild_ok):
+                    result.append(node["#"][None])
+                if level in node:
+                    nxt.append(node[level])
+                if "+" in node and (i > 0 or wild_ok):
+                    nxt.append(node["+"])
+            nodes = nxt
+            if not nodes:
+                return result
+        for node in nodes:
+            if None in node:
+                result.append(node[None])
+            # "a/#" also matches "a"
+            if "#" in node and None in node["#"]:
+                result.append(node["#"][None])
+        return result
+
+
+class Outbox(LocalDB):
+    """Bounded, disk-backed queue of messages waiting to be published.
+
+    Messages are kept until the broker acknowledges them, so anything
+    published while disconnected (or before a restart) is replayed in order
+    once the connection is back. When full, the oldest messages are dropped.
+    A newer retained message replaces any pending one on the same topic, as
+    only the latest state matters.
+
+    All server processes share the file; a short lease ensures only one of
+    them sends at a time, keeping the replay in order.
+    """
+
+    NAME = "mqtt_outbox"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            qos INTEGER NOT NULL,
+            retain INTEGER NOT NULL,
+            enqueued REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lease (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+    """
+    MAX_BACKLOG = 5000
+    LEASE_SEC = 30.0
+
+    def __init__(self, path: str | None = None):
+        super().__init__(path)
+        self.dropped = 0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+
+    def put(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, topic, payload, qos=0, retain=False, enqueued=None
+    ):
+        """Appends a message, dropping the oldest if the backlog is full"""
+        with self.mu:
+            if retain:
+                self.execute("DELETE FROM outbox WHERE topic=? AND retain=1", (topic,))
+            excess = len(self) - self.MAX_BACKLOG + 1
+            if excess > 0:
+                self.execute(
+                    "DELETE FROM outbox WHERE seq IN "
+                    "(SELECT seq FROM outbox ORDER BY seq LIMIT ?)",
+                    (excess,),
+                )
+                self.dropped += excess
+                self.log.warning(f"Backlog full; dropped {excess} oldest message(s)")
+            self.execute(
+                "INSERT INTO outbox (topic, payload, qos, retain, enqueued) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (topic, payload, qos, int(retain), enqueued or time.time()),
+            )
+
+    def peek(self, n) -> list[tuple]:
+        """Returns up to `n` of the oldest messages as
+        (seq, topic, payload, qos, retain, enqueued) tuples"""
+        return self.execute(
+            "SELECT seq, topic, payload, qos, retain, enqueued "
+            "FROM outbox ORDER BY seq LIMIT ?",
+            (n,),
+        )
+
+    def ack(self, seq):
+        """Removes all messages up to and including `seq`"""
+        self.execute("DELETE FROM outbox WHERE seq <= ?", (seq,))
+
+    def acquire(self, now=None) -> bool:
+        """Takes or renews the sending lease; returns True if held"""
+        now = now or time.time()
+        with self.mu:
+            self.execute(
+                "INSERT INTO lease (id, owner, expires) VALUES (0, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET owner=excluded.owner, "
+                "expires=excluded.expires "
+                "WHERE lease.owner=excluded.owner OR lease.expires < ?",
+                (self.owner, now + self.LEASE_SEC, now),
+            )
+            return self.execute("SELECT owner FROM lease")[0][0] == self.owner
+
+    def oldest_age_sec(self) -> float:
+        """Seconds since the oldest pending message was enqueued"""
+        rows = self.execute("SELECT MIN(enqueued) FROM outbox")
+        return max(0.0, time.time() - rows[0][0]) if rows[0][0] else 0.0
+
+    def __len__(self):
+        return self.execute("SELECT COUNT(*) FROM outbox")[0][0]
+
+
+class Client:  # pylint: disable=too-many-instance-attributes
     """An MQTT client for managing shop signals"""
 
     HEARTBEAT_PD_SEC = 5.0
+    DISPATCH_WORKERS = 4
+    DISPATCH_QUEUE_SIZE = 256
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_POLL_SEC = 1.0
+    OUTBOX_ACK_TIMEOUT_SEC = 5.0
 
     def __init__(self, notify_discord_cb):
         # Note: we use MQTTv5 to support shared subscription groups.
@@ -46,9 +223,31 @@ class Client:
             protocol=MQTTProtocolVersion.MQTTv5,
         )
         self.notify_discord_cb = notify_discord_cb
-        self._topic_callbacks = {}  # topic -> list of callbacks
+        self._topic_callbacks = TopicTrie()  # topic -> list of callbacks
         self._topic_callbacks_lock = threading.Lock()
 
+        # Callbacks run on worker threads, so a slow callback can't stall the
+        # paho network thread (and the heartbeat). Messages are sharded to
+        # workers by topic, preserving per-topic ordering.
+        self._dispatch_queues: list[queue.Queue] = [
+            queue.Queue(maxsize=self.DISPATCH_QUEUE_SIZE)
+            for _ in range(self.DISPATCH_WORKERS)
+        ]
+        self._workers_started = False
+        self._workers_lock = threading.Lock()
+        self.dispatch_latency = LatencyStats()
+        self.callback_duration = LatencyStats()
+        self.max_queue_depth = 0
+        self.dropped = 0
+
+        # Outbound messages go through a persistent queue drained by a
+        # single sender thread, so nothing is lost while the broker is
+        # unreachable and bursts don't hold up the heartbeat.
+        self.outbox = Outbox()
+        self._outbox_wake = threading.Event()
+        self.publish_latency = LatencyStats()
+        self.published = 0
+
         # For topics we subscribe to on all gunicorn workers,
         # we use MQTT5 shared subscription groups so that messages are only
         # delivered to one worker. This prevents duplicate handling.
@@ -127,6 +326,8 @@ class Client:
                 self.c.subscribe(self._group_topic(topic))
                 log.info(f"Subscribed to {topic}")
 
+        self._outbox_wake.set()  # Replay anything queued while disconnected
+
     def on_message(self, _, userdata, msg):  # pylint:disable=unused-argument
         """Receive messages from MQTT"""
         # Wrap in a big ol' try as any uncaught exception kills the thread
@@ -146,40 +347,160 @@ class Client:
 
             # Dispatch to registered topic callbacks
             with self._topic_callbacks_lock:
-                for topic, callbacks in list(self._topic_callbacks.items()):
-                    if mqtt.topic_matches_sub(topic, msg.topic) and len(callbacks) > 0:
-                        # Only one callback may fire per topic; we just pick
-                        # the last one.
-                        cb = callbacks[-1]
-                        try:
-                            cb(msg.topic, data)
-                        except Exception as e:  # pylint: disable=broad-exception-caught
-                            log.warning(f"Topic callback error for {msg.topic}: {e}")
+                callbacks = [
+                    cbs[-1]
+                    for topic in self._topic_callbacks.match(msg.topic)
+                    if (cbs := self._topic_callbacks[topic])
+                ]
+            # Only one callback may fire per topic filter; we just pick
+            # the last one.
+            for cb in callbacks:
+                self._enqueue(msg.topic, data, cb)
         except Exception as e:  # pylint: disable=broad-exception-caught
             log.warning(f"on_message error: {e}")
 
+    def _start_workers(self):
+        with self._workers_lock:
+            if self._workers_started:
+                return
+            for q in self._dispatch_queues:
+                threading.Thread(target=self._work, args=(q,), daemon=True).start()
+            self._workers_started = True
+
+    def _enqueue(self, topic, data, cb):
+        self._start_workers()
+        q = self._dispatch_queues[
+            zlib.crc32(topic.encode()) % len(self._dispatch_queues)
+        ]
+        try:
+            # Never block here: this runs on the paho network thread, which
+            # also handles keepalive and acks for every other topic.
+            q.put_nowait((time.perf_counter(), topic, data, cb))
+        except queue.Full:
+            self.dropped += 1
+            log.error(f"Dispatch queue full; dropped message on {topic}")
+            return
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth())
+
+    def _work(self, q):
+        while True:
+            enqueued, topic, data, cb = q.get()
+            start = time.perf_counter()
+            self.dispatch_latency.add(start - enqueued)
+            try:
+                cb(topic, data)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log.warning(f"Topic callback error for {topic}: {e}")
+            finally:
+                self.callback_duration.add(time.perf_counter() - start)
+                q.task_done()
+
+    def queue_depth(self) -> int:
+        """Number of messages waiting for a dispatch worker"""
+        return sum(q.qsize() for q in self._dispatch_queues)
+
+    def join(self):
+        """Blocks until all queued callbacks have run"""
+        for q in self._dispatch_queues:
+            q.join()
+
+    def metrics(self) -> dict:
+        """Reports dispatch latency, callback duration and queue depth, plus
+        the outbound backlog and publish latency"""
+        with self._topic_callbacks_lock:
+            n_topics = len(self._topic_callbacks)
+        return {
+            "topics": n_topics,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "dropped": self.dropped,
+            "dispatch_latency": self.dispatch_latency.summary(),
+            "callback_duration": self.callback_duration.summary(),
+            "outbox": {
+                "backlog": len(self.outbox),
+                "oldest_age_sec": round(self.outbox.oldest_age_sec(), 3),
+                "dropped": self.outbox.dropped,
+                "published": self.published,
+                "publish_latency": self.publish_latency.summary(),
+            },
+        }
+
     def _fmt_topic(self, resource, resource_id, attribute):
         """Constructs topic name based on the type of message being sent"""
         return f"protohaven_api/v1/{resource}/{resource_id}/{attribute}"
 
-    def pub(self, resource, resource_id, attribute, payload):
-        """Publish a message using standard topic formatting"""
+    def pub(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, resource, resource_id, attribute, payload, retain=False
+    ):
+        """Queue a message for publishing using standard topic formatting.
+        Retained messages are delivered by the broker to new subscribers as
+        current state."""
         if not isinstance(payload, str):
             payload = json.dumps(payload)
-        return self.c.publish(
-            self._fmt_topic(resource, resource_id, attribute), payload
+        self.outbox.put(
+            self._fmt_topic(resource, resource_id, attribute),
+            payload,
+            qos=1 if retain else 0,
+            retain=retain,
         )
+        self._outbox_wake.set()
+
+    def flush_outbox(self) -> int:
+        """Publishes queued messages in order, a batch at a time, for as long
+        as the broker is connected. Messages are removed only once the broker
+        has them. Returns the number of messages published."""
+        n = 0
+        while self.c.is_connected() and self.outbox.acquire():
+            batch = self.outbox.peek(self.OUTBOX_BATCH_SIZE)
+            if not batch:
+                break
+            infos = []
+            for seq, topic, payload, qos, retain, enqueued in batch:
+                info = self.c.publish(topic, payload, qos=qos, retain=bool(retain))
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    break
+                infos.append((seq, enqueued, info))
+
+            acked = None
+            for seq, enqueued, info in infos:
+                info.wait_for_publish(self.OUTBOX_ACK_TIMEOUT_SEC)
+                if not info.is_published():
+                    break
+                acked = seq
+                n += 1
+                self.publish_latency.add(time.time() - enqueued)
+            if acked is not None:
+                self.outbox.ack(acked)
+            if acked is None or acked != batch[-1][0]:
+                break  # Retry the rest once the connection settles
+        self.published += n
+        return n
+
+    def _outbox_loop(self):
+        while True:
+            # Also poll, to pick up messages queued by other processes
+            self._outbox_wake.wait(self.OUTBOX_POLL_SEC)
+            self._outbox_wake.clear()
+            try:
+                self.flush_outbox()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log.warning(f"Outbox flush error: {e}")
 
     def _notify_heartbeat(self):
-        """A periodic message published to reassure listeners that the server is operational"""
-        return self.pub(
-            TopicResource.SELF, socket.gethostname(), TopicAttribute.HEARTBEAT, "1"
+        """A periodic message published to reassure listeners that the server
+        is operational. Sent directly, as a stale heartbeat is meaningless."""
+        return self.c.publish(
+            self._fmt_topic(
+                TopicResource.SELF, socket.gethostname(), TopicAttribute.HEARTBEAT
+            ),
+            "1",
         )
 
     def run_forever(self):
         """Starts up dependent threads and loops forever"""
         self._start()
         threading.Thread(target=client.c.loop_forever, daemon=True).start()
+        threading.Thread(target=self._outbox_loop, daemon=True).start()
         while True:
             time.sleep(self.HEARTBEAT_PD_SEC)
             self._notify_heartbeat()
@@ -218,6 +539,20 @@ def notify_reservation(tool_code, ref, start_time, end_time, user_id):
     )
 
 
+def notify_reservation_state(tool_code, reservations: list[dict]):
+    """Publish the full list of today's reservations for a tool as a retained
+    message, so new subscribers receive the current state immediately"""
+    if not client:
+        return None
+    return client.pub(
+        TopicResource.TOOL,
+        tool_code,
+        TopicAttribute.RESERVATION_STATE,
+        reservations,
+        retain=True,
+    )
+
+
 def notify_maintenance(tool_code, status, reason):
     """Notify that equipment maintenance status is changing"""
     if not client:
@@ -2,8 +2,62 @@
 """Tests for MQTT integration"""
 
 import json
+import threading
+import time
+
+import pytest
 
 from protohaven_api.integrations import mqtt as m
+from protohaven_api.integrations.data.local_db import MEMORY
+
+
+class FakeBroker:
+    """In-process stand-in for the broker, as seen through the paho client.
+    Publishes only succeed while `connected`; `acks` controls whether the
+    broker acknowledges them."""
+
+    class Info:
+        def __init__(self, rc, published):
+            self.rc = rc
+            self.published = published
+
+        def wait_for_publish(self, timeout=None):
+            pass
+
+        def is_published(self):
+            return self.published
+
+    def __init__(self, connected=True, ack_delay=0.0):
+        self.connected = connected
+        self.acks = True
+        self.ack_delay = ack_delay
+        self.messages = []
+        self.retained = {}
+        self.subscriptions = []
+
+    def subscribe(self, topic):
+        self.subscriptions.append(topic)
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if not self.connected:
+            return self.Info(m.mqtt.MQTT_ERR_NO_CONN, False)
+        if self.ack_delay:
+            time.sleep(self.ack_delay)
+        if self.acks:
+            self.messages.append((topic, payload))
+            if retain:
+                self.retained[topic] = payload
+        return self.Info(m.mqtt.MQTT_ERR_SUCCESS, self.acks)
+
+
+def _client(mocker, broker, outbox=None):
+    c = m.Client(None)
+    mocker.patch.object(c, "c", broker)
+    mocker.patch.object(c, "outbox", m.Outbox(MEMORY) if outbox is None else outbox)
+    return c
 
 
 def test_on_connect(mocker):
@@ -97,6 +151,7 @@ def test_on_message_dispatches_to_callbacks(mocker):
     msg.payload = json.dumps({"neon_id": "123"})
 
     c.on_message(None, None, msg)
+    c.join()
     assert len(results) == 1
     assert results[0][0] == "protohaven_api/v1/user/123/signin"
     assert results[0][1] == {"neon_id": "123"}
@@ -130,3 +185,232 @@ def test_on_connect_registered_callbacks(mocker):
     c.on_connect(None, None, {}, 0, None)
     c.c.subscribe.assert_any_call("$share/group1/protohaven_api/v1/notify_discord")
     c.c.subscribe.assert_any_call("$share/group1/custom/topic")
+
+
+def test_notify_reservation_state_retained(mocker):
+    """Reservation state is published as a retained message"""
+    c = m.Client(None)
+    mocker.patch.object(c, "c")
+    mocker.patch.object(c, "outbox", m.Outbox(MEMORY))
+    mocker.patch.object(m, "client", c)
+    c.c.publish.return_value.rc = m.mqtt.MQTT_ERR_SUCCESS
+    m.notify_reservation_state("ABC", [{"ref": "R1"}])
+    c.c.publish.assert_not_called()  # Queued until the sender runs
+    assert c.flush_outbox() == 1
+    c.c.publish.assert_called_once_with(
+        "protohaven_api/v1/tool/ABC/resrv_state",
+        json.dumps([{"ref": "R1"}]),
+        qos=1,
+        retain=True,
+    )
+
+
+def test_outbox_replays_in_order_after_reconnect(mocker):
+    """Messages published while disconnected are delivered in order, in
+    batches, once the broker is back"""
+    broker = FakeBroker(connected=False)
+    c = _client(mocker, broker)
+    for i in range(120):
+        c.pub(m.TopicResource.USER, i, m.TopicAttribute.SIGNIN, "1")
+    assert c.flush_outbox() == 0
+    assert c.metrics()["outbox"]["backlog"] == 120
+
+    broker.connected = True
+    c.on_connect(None, None, {}, 0, None)  # Doesn't throw; wakes the sender
+    assert c.flush_outbox() == 120
+    assert [t for t, _ in broker.messages] == [
+        f"protohaven_api/v1/user/{i}/signin" for i in range(120)
+    ]
+    got = c.metrics()["outbox"]
+    assert got["backlog"] == 0
+    assert got["published"] == 120
+    assert got["publish_latency"]["count"] == 120
+
+
+def test_outbox_keeps_unacknowledged(mocker):
+    """Messages the broker didn't acknowledge are retried, not lost"""
+    broker = FakeBroker()
+    broker.acks = False
+    c = _client(mocker, broker)
+    c.pub(m.TopicResource.USER, 1, m.TopicAttribute.SIGNIN, "1")
+    assert c.flush_outbox() == 0
+    assert len(c.outbox) == 1
+    broker.acks = True
+    assert c.flush_outbox() == 1
+    assert len(c.outbox) == 0
+
+
+def test_outbox_persists_across_restart(mocker, tmp_path):
+    """The backlog survives the process restarting"""
+    path = str(tmp_path / "outbox.sqlite3")
+    c1 = _client(mocker, FakeBroker(connected=False), m.Outbox(path))
+    for i in range(3):
+        c1.pub(m.TopicResource.USER, i, m.TopicAttribute.SIGNIN, "1")
+    c1.outbox.close()
+
+    broker = FakeBroker()
+    c2 = _client(mocker, broker, m.Outbox(path))
+    assert c2.flush_outbox() == 3
+    assert [t for t, _ in broker.messages] == [
+        f"protohaven_api/v1/user/{i}/signin" for i in range(3)
+    ]
+
+
+def test_outbox_bounded_and_coalesces_retained(mocker):
+    """The oldest messages are dropped when full, and only the latest
+    retained state per topic is kept"""
+    broker = FakeBroker(connected=False)
+    c = _client(mocker, broker)
+    mocker.patch.object(c.outbox, "MAX_BACKLOG", 10)
+    for i in range(15):
+        c.pub(m.TopicResource.USER, i, m.TopicAttribute.SIGNIN, "1")
+    assert len(c.outbox) == 10
+    assert c.outbox.dropped == 5
+    assert c.outbox.peek(1)[0][1] == "protohaven_api/v1/user/5/signin"
+
+    mocker.patch.object(c.outbox, "MAX_BACKLOG", 100)
+    for i in range(3):
+        c.pub(
+            m.TopicResource.TOOL, "ABC", m.TopicAttribute.RESERVATION_STATE, [i], True
+        )
+    assert len(c.outbox) == 11
+    broker.connected = True
+    c.flush_outbox()
+    assert broker.retained == {"protohaven_api/v1/tool/ABC/resrv_state": "[2]"}
+
+
+def test_outbox_lease_single_sender(tmp_path):
+    """Only one process sends from a shared outbox at a time"""
+    path = str(tmp_path / "outbox.sqlite3")
+    a, b = m.Outbox(path), m.Outbox(path)
+    assert a.acquire(now=100)
+    assert not b.acquire(now=101)
+    assert a.acquire(now=120)  # Renewed
+    assert not b.acquire(now=120 + a.LEASE_SEC - 1)
+    assert b.acquire(now=120 + a.LEASE_SEC + 1)  # Expired
+
+
+def test_outbox_burst_does_not_delay_heartbeat(mocker):
+    """A burst of queued messages drains in the background while the
+    heartbeat goes straight to the broker"""
+    broker = FakeBroker(ack_delay=0.001)
+    c = _client(mocker, broker)
+    threading.Thread(target=c._outbox_loop, daemon=True).start()
+
+    for i in range(500):
+        c.pub(m.TopicResource.USER, i, m.TopicAttribute.SIGNIN, "1")
+    c._notify_heartbeat()
+    # Published before returning, rather than queued behind the burst
+    assert any(t.endswith("/heartbeat") for t, _ in broker.messages)
+
+    deadline = time.monotonic() + 10
+    while len(c.outbox) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    got = c.metrics()["outbox"]
+    assert got["backlog"] == 0
+    assert got["published"] == 500
+    assert [t for t, _ in broker.messages if "/user/" in t] == [
+        f"protohaven_api/v1/user/{i}/signin" for i in range(500)
+    ]
+
+
+def test_topic_trie_match():
+    """Filters with wildcards are matched per MQTT semantics"""
+    t = m.TopicTrie()
+    for f in ("a/b/c", "a/+/c", "a/#", "+/b/+", "#", "a/b"):
+        t[f] = [f]
+    assert set(t.match("a/b/c")) == {"a/b/c", "a/+/c", "a/#", "+/b/+", "#"}
+    assert set(t.match("a/b")) == {"a/b", "a/#", "#"}
+    assert set(t.match("a")) == {"a/#", "#"}
+    assert set(t.match("x/y/z")) == {"#"}
+    assert not t.match("$SYS/b/c")
+
+    del t["#"]
+    del t["a/+/c"]
+    assert set(t.match("a/x/c")) == {"a/#"}
+    assert set(t) == {"a/b/c", "a/#", "+/b/+", "a/b"}
+    assert t["a/b"] == ["a/b"]
+
+
+def test_on_message_slow_callback_does_not_block(mocker):
+    """Callbacks run on worker threads, and dispatch metrics are collected"""
+    c = m.Client(None)
+    mocker.patch.object(c, "c")
+    mocker.patch.object(c, "outbox", m.Outbox(MEMORY))
+    release = threading.Event()
+    results = []
+    c._topic_callbacks["slow/topic"] = [lambda t, d: release.wait(5)]
+    c._topic_callbacks["fast/+"] = [lambda t, d: results.append(t)]
+
+    for topic in ("slow/topic", "fast/1", "fast/2"):
+        msg = mocker.MagicMock()
+        msg.topic = topic
+        msg.payload = json.dumps({})
+        c.on_message(None, None, msg)  # Returns immediately
+
+    release.set()
+    c.join()
+    assert sorted(results) == ["fast/1", "fast/2"]
+    got = c.metrics()
+    assert got["topics"] == 2
+    assert got["queue_depth"] == 0
+    assert got["dropped"] == 0
+    assert got["dispatch_latency"]["count"] == 3
+    assert got["callback_duration"]["count"] == 3
+
+
+def test_on_message_full_queue_drops_without_blocking(mocker):
+    """A full dispatch queue drops the message instead of stalling the
+    network thread"""
+    c = m.Client(None)
+    mocker.patch.object(c, "c")
+    mocker.patch.object(c, "outbox", m.Outbox(MEMORY))
+    c._dispatch_queues = [m.queue.Queue(maxsize=1)]
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(t, d):
+        started.set()
+        release.wait(5)
+
+    c._topic_callbacks["slow/topic"] = [slow]
+    msg = mocker.MagicMock()
+    msg.topic = "slow/topic"
+    msg.payload = json.dumps({})
+    c.on_message(None, None, msg)  # Picked up by the worker
+    started.wait(5)
+    c.on_message(None, None, msg)  # Fills the queue
+    put = mocker.spy(c._dispatch_queues[0], "put")
+    c.on_message(None, None, msg)  # Dropped
+    assert put.call_args.kwargs["block"] is False
+    assert c.metrics()["dropped"] == 1
+    release.set()
+    c.join()
+
+
+@pytest.mark.benchmark
+def test_topic_trie_match_benchmark():
+    """Matching cost depends on topic depth, not the number of filters"""
+    t = m.TopicTrie()
+    for i in range(5000):
+        t[f"protohaven_api/v1/tool/T{i}/resrv"] = [None]
+    t["protohaven_api/v1/user/+/signin"] = [None]
+    start = time.perf_counter()
+    for i in range(10000):
+        assert t.match(f"protohaven_api/v1/user/{i}/signin") == [
+            "protohaven_api/v1/user/+/signin"
+        ]
+    trie_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(10):
+        [
+            f
+            for f in t
+            if m.mqtt.topic_matches_sub(f, f"protohaven_api/v1/user/{i}/signin")
+        ]
+    linear_sec = (time.perf_counter() - start) * 1000
+    print(
+        f"10k matches against {len(t)} filters: trie {trie_sec:.3f}s, "
+        f"linear scan (extrapolated) {linear_sec:.3f}s"
+    )
@@ -779,6 +779,14 @@ class AccountCache(WarmDict):
         """Fetches the Neon ID associated with a Booked user ID"""
         return self.by_booked_id[booked_id].neon_id
 
+    def neon_ids_from_booked_ids(self, booked_ids) -> dict[int, str | None]:
+        """Bulk version of `neon_id_from_booked_id`; unmapped IDs resolve to None"""
+        result: dict[int, str | None] = {}
+        for booked_id in booked_ids:
+            a = self.by_booked_id.get(int(booked_id))
+            result[int(booked_id)] = a.neon_id if a else None
+        return result
+
     def _find_best_match_internal(self, search_string, top_n, score_cutoff):
         """Find and return the top_n best matches to the key in `self` based on a search string."""
         # Could probably use a priority queue / heap here for faster lookups, but we only have
@@ -867,6 +875,27 @@ def cached_neon_id_from_booked_id(booked_id: int) -> str:
     return str(data["neon_id"])
 
 
+def cached_neon_ids_from_booked_ids(booked_ids) -> dict[int, str | None]:
+    """Resolves many Booked user IDs to Neon IDs with a single cache server
+    request. Booked IDs without an associated Neon account map to None.
+
+    Falls back to local neon.cache if cache_server is not enabled in config.
+    """
+    ids = sorted({int(b) for b in booked_ids})
+    if not ids:
+        return {}
+    if not get_config("cache_server/enabled", False, as_bool=True):
+        return cache.neon_ids_from_booked_ids(ids)
+
+    data: dict = get_connector().cache_server_request(
+        "/neon_ids_from_booked_ids",
+        {"booked_ids": ",".join(str(b) for b in ids)},
+    )
+    return {
+        int(k): (str(v) if v is not None else None) for k, v in data["neon_ids"].items()
+    }
+
+
 def cached_get(email: str, fetch_if_missing: bool = True) -> dict[str, Member]:
     """Query the cache server for members by email.
 
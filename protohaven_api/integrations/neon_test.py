@@ -161,6 +161,16 @@ def test_account_cache_case_insensitive(mocker):
     assert c["nonE"] == want3
 
 
+def test_cached_neon_ids_from_booked_ids(mocker):
+    """Booked IDs are resolved in bulk from the local cache; unmapped IDs are None"""
+    mocker.patch.object(n, "get_config", return_value=False)
+    c = n.AccountCache()
+    mocker.patch.object(n, "cache", c)
+    c.update(mocker.MagicMock(email="a@b.com", neon_id="123", booked_id=1))
+    assert n.cached_neon_ids_from_booked_ids(["1", 2, 1]) == {1: "123", 2: None}
+    assert not n.cached_neon_ids_from_booked_ids([])
+
+
 def test_find_best_match_without_cache(mocker):
     c = n.AccountCache()
     mocker.patch.object(
@@ -1,13 +1,18 @@
 """Square point of sale integration for Protohaven"""
 
+import json
 import logging
+import time
 from functools import lru_cache
 
 from protohaven_api.config import get_config
 from protohaven_api.integrations.data.connector import get as get_connector
+from protohaven_api.integrations.data.local_db import LocalDB
 
 log = logging.getLogger("protohaven_api.integrations.sales")
 
+PLAN_TYPE = "SUBSCRIPTION_PLAN_VARIATION"
+
 
 @lru_cache(maxsize=1)
 def client():
@@ -82,46 +87,151 @@ def subscription_tax_pct(sub, price):
     return 100 * ((amt / price) - 1.0)
 
 
+def _paginate(fetch, key):
+    """Yields `key` items from each page of a cursor-paginated request;
+    `fetch` is called with the cursor of the next page (None for the first)"""
+    cursor = None
+    while True:
+        result = fetch(cursor)
+        if not result.is_success():
+            raise RuntimeError(result.errors)
+        yield from result.body.get(key, [])
+        cursor = result.body.get("cursor")
+        if not cursor:
+            return
+
+
+def _with_cursor(body, cursor):
+    return {**body, "cursor": cursor} if cursor else body
+
+
+def _list_customers():
+    return _paginate(lambda c: client().customers.list_customers(cursor=c), "customers")
+
+
+def _search_customers(since):
+    body = {"limit": 100, "query": {"filter": {"updated_at": {"start_at": since}}}}
+    return _paginate(
+        lambda c: client().customers.search_customers(body=_with_cursor(body, c)),
+        "customers",
+    )
+
+
+def _list_plans():
+    return _paginate(
+        lambda c: client().catalog.list_catalog(cursor=c, types=PLAN_TYPE), "objects"
+    )
+
+
+def _search_plans(since):
+    body = {
+        "object_types": [PLAN_TYPE],
+        "begin_time": since,
+        "include_deleted_objects": True,
+    }
+    return _paginate(
+        lambda c: client().catalog.search_catalog_objects(body=_with_cursor(body, c)),
+        "objects",
+    )
+
+
+class SquareCache(LocalDB):
+    """Local copy of Square customers and subscription plans.
+
+    Each read only fetches the objects updated since the newest `updated_at`
+    already stored. Deleted customers don't show up in those searches, so
+    everything is refetched every FULL_SYNC_PD_SEC.
+    """
+
+    NAME = "square_cache"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS objects (
+            kind TEXT NOT NULL,
+            id TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, id)
+        );
+        CREATE TABLE IF NOT EXISTS syncs (
+            kind TEXT PRIMARY KEY,
+            full_sync REAL NOT NULL
+        );
+    """
+    FULL_SYNC_PD_SEC = 24 * 3600
+
+    def _needs_full_sync(self, kind) -> bool:
+        rows = self.execute("SELECT full_sync FROM syncs WHERE kind=?", (kind,))
+        return not rows or rows[0][0] < time.time() - self.FULL_SYNC_PD_SEC
+
+    def _sync(self, kind, fetch_all, fetch_since) -> list[dict]:
+        ((since,),) = self.execute(
+            "SELECT MAX(updated_at) FROM objects WHERE kind=?", (kind,)
+        )
+        full = since is None or self._needs_full_sync(kind)
+        objs = list(fetch_all() if full else fetch_since(since))
+        with self.mu, self.conn:
+            if full:
+                self.conn.execute("DELETE FROM objects WHERE kind=?", (kind,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO syncs VALUES (?, ?)", (kind, time.time())
+                )
+            for o in objs:
+                if o.get("is_deleted"):
+                    self.conn.execute(
+                        "DELETE FROM objects WHERE kind=? AND id=?", (kind, o["id"])
+                    )
+                else:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                        (kind, o["id"], o.get("updated_at", ""), json.dumps(o)),
+                    )
+        log.info(f"Synced {len(objs)} {kind} ({'full' if full else 'since ' + since})")
+        return [
+            json.loads(data)
+            for (data,) in self.execute(
+                "SELECT data FROM objects WHERE kind=?", (kind,)
+            )
+        ]
+
+    def customers(self) -> list[dict]:
+        """Returns all customers, after fetching any that changed"""
+        return self._sync("customers", _list_customers, _search_customers)
+
+    def plans(self) -> list[dict]:
+        """Returns all subscription plan variations, after fetching any that
+        changed"""
+        return self._sync("plans", _list_plans, _search_plans)
+
+
+cache = SquareCache()
+
+
 def get_subscription_plan_map():
     """Get available subscription options, mapped by ID to type"""
-    data = client().catalog.list_catalog(types="SUBSCRIPTION_PLAN_VARIATION")
-    if not data.is_success():
-        raise RuntimeError(data.errors)
-
     result = {}
-    for v in data.body["objects"]:
-        if not v["is_deleted"]:
-            name = v["subscription_plan_variation_data"]["name"]
-            price = v["subscription_plan_variation_data"]["phases"][0]["pricing"][
-                "price"
-            ]["amount"]
-            result[v["id"]] = (name, price)
+    for v in cache.plans():
+        name = v["subscription_plan_variation_data"]["name"]
+        price = v["subscription_plan_variation_data"]["phases"][0]["pricing"]["price"][
+            "amount"
+        ]
+        result[v["id"]] = (name, price)
     return result
 
 
 def get_customer_name_map(include_pii=False, include_email=False):
     """Get full list of customers, mapping ID to name"""
-
     data = {}
-    result = client().customers.list_customers()
-    while result:
-        if not result.is_success():
-            raise RuntimeError(result.errors)
-        for v in result.body["customers"]:
-            given = v.get("given_name", "")
-            family = v.get("family_name", "")
-            nick = v.get("nickname")
-            fmt = nick if nick else given
-            if include_pii:
-                fmt = f"{given} {family}"
-                if nick:
-                    fmt += f"({nick})"
-            email = v.get("email_address") if include_email else None
-            data[v["id"]] = (fmt, email)
-        if result.body.get("cursor"):
-            result = client().customers.list_customers(cursor=result.body["cursor"])
-        else:
-            return data
+    for v in cache.customers():
+        given = v.get("given_name", "")
+        family = v.get("family_name", "")
+        nick = v.get("nickname")
+        fmt = nick if nick else given
+        if include_pii:
+            fmt = f"{given} {family}"
+            if nick:
+                fmt += f"({nick})"
+        email = v.get("email_address") if include_email else None
+        data[v["id"]] = (fmt, email)
     return data
 
 
@@ -1,6 +1,52 @@
 """Test of sales integration module"""
 
+import datetime
+import time
+
+import pytest
+
 from protohaven_api.integrations import sales as s
+from protohaven_api.integrations.data.local_db import MEMORY
+from protohaven_api.testing import StubSquare
+
+JAN = "2025-01-01T00:00:00Z"
+FEB = "2025-02-01T00:00:00Z"
+
+
+def _ts(i):
+    """Timestamp `i` minutes into 2024, formatted like Square's"""
+    t = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i)
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@pytest.fixture(autouse=True)
+def fixture_cache(mocker):
+    """Keeps the Square cache in memory"""
+    mocker.patch.object(s, "cache", s.SquareCache(MEMORY))
+
+
+def _customer(i, updated=None, **kwargs):
+    return {
+        "id": f"c{i}",
+        "given_name": f"First{i}",
+        "family_name": "Last",
+        "email_address": f"{i}@example.com",
+        "updated_at": updated or _ts(i),
+        **kwargs,
+    }
+
+
+def _plan(i, price, updated=JAN, deleted=False):
+    return {
+        "id": f"p{i}",
+        "type": s.PLAN_TYPE,
+        "is_deleted": deleted,
+        "updated_at": updated,
+        "subscription_plan_variation_data": {
+            "name": f"Plan{i}",
+            "phases": [{"pricing": {"price": {"amount": price}}}],
+        },
+    }
 
 
 def test_get_unpaid_invoices_by_id(mocker):
@@ -49,3 +95,74 @@ def test_get_subscriptions_paginates_with_cursor_in_body(mocker):
         mocker.call(body={}),
         mocker.call(body={"cursor": "next-page"}),
     ]
+
+
+def test_customer_name_map_syncs_incrementally(mocker):
+    """After the first full listing, only customers updated since the newest
+    cached one are fetched; deletions are picked up by the periodic full sync"""
+    stub = StubSquare(customers=[_customer(i) for i in range(5)], page_size=2)
+    mocker.patch.object(s, "client", return_value=stub)
+
+    got = s.get_customer_name_map(include_pii=True, include_email=True)
+    assert got["c1"] == ("First1 Last", "1@example.com")
+    assert len(got) == 5
+    assert stub.calls == ["list_customers"] * 3
+
+    stub.calls = []
+    stub.data["customers"]["c1"] = _customer(1, FEB, nickname="Nick")
+    stub.data["customers"]["c9"] = _customer(9, FEB)
+    del stub.data["customers"]["c0"]
+    got = s.get_customer_name_map()
+    # c4 (the newest cached customer, as start_at is inclusive), c1 and c9
+    assert stub.calls == ["search_customers"] * 2
+    assert stub.bodies[-1]["query"]["filter"]["updated_at"]["start_at"] == _ts(4)
+    assert got["c1"] == ("Nick", None)
+    assert got["c9"] == ("First9", None)
+    assert "c0" in got  # Deletions aren't visible to searches
+
+    stub.calls = []
+    mocker.patch.object(
+        s.time, "time", return_value=s.time.time() + s.SquareCache.FULL_SYNC_PD_SEC
+    )
+    got = s.get_customer_name_map()
+    assert stub.calls == ["list_customers"] * 3
+    assert "c0" not in got
+    assert len(got) == 5
+
+
+def test_subscription_plan_map_syncs_incrementally(mocker):
+    """Deleted plans are dropped, both from the full listing and from
+    incremental catalog searches"""
+    stub = StubSquare(plans=[_plan(1, 5000), _plan(2, 100, deleted=True)])
+    mocker.patch.object(s, "client", return_value=stub)
+    assert s.get_subscription_plan_map() == {"p1": ("Plan1", 5000)}
+
+    stub.data["objects"]["p1"] = _plan(1, 5000, FEB, deleted=True)
+    stub.data["objects"]["p3"] = _plan(3, 7500, FEB)
+    assert s.get_subscription_plan_map() == {"p3": ("Plan3", 7500)}
+    assert stub.calls == ["list_catalog", "search_catalog_objects"]
+    assert stub.bodies[1]["begin_time"] == JAN
+    assert stub.bodies[1]["include_deleted_objects"]
+
+
+@pytest.mark.benchmark
+def test_customer_name_map_benchmark(mocker):
+    """Times repeat customer lookups against a slow, paginated Square"""
+    stub = StubSquare(
+        customers=[_customer(i) for i in range(2000)], latency=0.02, page_size=100
+    )
+    mocker.patch.object(s, "client", return_value=stub)
+    start = time.perf_counter()
+    s.get_customer_name_map()
+    cold_sec = time.perf_counter() - start
+
+    stub.data["customers"]["c1"] = _customer(1, FEB)
+    start = time.perf_counter()
+    got = s.get_customer_name_map()
+    warm_sec = time.perf_counter() - start
+    print(
+        f"{len(got)} customers: full listing {cold_sec:.3f}s, "
+        f"incremental {warm_sec:.3f}s ({len(stub.calls)} API calls)"
+    )
+    assert stub.calls.count("list_customers") == 20
+    assert stub.calls.count("search_customers") == 1
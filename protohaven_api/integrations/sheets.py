@@ -1,22 +1,36 @@
 """Read from google spreadsheets"""
 
 import datetime
+import hashlib
 import io
+import json
 import logging
 import re
 import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import getsize
-from typing import Iterator
+from typing import Any, Callable, Iterator
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 
 from protohaven_api.config import get_config, safe_parse_datetime
+from protohaven_api.integrations import google_services
+from protohaven_api.integrations.data.local_db import LocalDB
 from protohaven_api.integrations.models import ClearanceCodeShort, Email
 
 log = logging.getLogger("integrations.sheets")
 
+# Sheets are exported concurrently, each into a spooled buffer that spills to
+# disk past SPOOL_MAX_BYTES, and copied into the archive as soon as it's done.
+BACKUP_WORKERS = 4
+BACKUP_COMPRESSLEVEL = 6
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+COPY_BUFSIZE = 1024 * 1024
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 
 def _get_service_client(name: str, version: str):
     """
@@ -24,43 +38,216 @@ def _get_service_client(name: str, version: str):
     protohaven-api.iam.gserviceaccount.com service account,
     managed by the `workshop` account.
     This account must have read access for the call to succeed.
+    Clients are cached and reused across calls.
     """
-    creds = service_account.Credentials.from_service_account_file(
-        get_config("google/token_path")
-    ).with_scopes(get_config("google/scopes"))
+    return google_services.get_service(name, version)
+
 
-    service = build(name, version, credentials=creds)
-    return service
+def _get_values(sheet_id, range_name) -> list[list[str]]:
+    service = _get_service_client("sheets", "v4")
+    sheet = service.spreadsheets()  # pylint: disable=no-member
+    result = sheet.values().get(spreadsheetId=sheet_id, range=range_name).execute()
+    return result.get("values", [])
 
 
 def get_sheet_range(sheet_id, range_name):
     """Shows basic usage of the Sheets API.
     Prints values from a sample spreadsheet.
     """
-    service = _get_service_client("sheets", "v4")
-    # Call the Sheets API
-    sheet = service.spreadsheets()  # pylint: disable=no-member
-    result = sheet.values().get(spreadsheetId=sheet_id, range=range_name).execute()
-    values = result.get("values", [])
-
+    values = _get_values(sheet_id, range_name)
     if not values:
         raise RuntimeError("No data found")
     return values
 
 
+def _digest(row) -> str:
+    return hashlib.sha1(json.dumps(row).encode()).hexdigest()
+
+
+class SheetRowCache(LocalDB):
+    """Rows of append-mostly sheets (e.g. form responses), cached locally so
+    each read only fetches the rows appended since the last one.
+
+    Every read re-fetches the last OVERLAP cached rows along with any new
+    ones; every VERIFY_PD_SEC the last VERIFY_ROWS rows are re-fetched
+    instead. If a re-fetched row no longer matches its cached digest (it was
+    edited, or rows were inserted or deleted above it) or the header row
+    changed, the range is reloaded. Rows older than VERIFY_ROWS are assumed
+    not to change.
+
+    Parsed rows are also kept in memory per parse function, so only new or
+    changed rows are parsed again.
+    """
+
+    NAME = "sheet_rows"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ranges (
+            key TEXT PRIMARY KEY,
+            headers TEXT NOT NULL,
+            first_row INTEGER NOT NULL,
+            verified REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS rows (
+            key TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (key, row)
+        ) WITHOUT ROWID;
+    """
+    OVERLAP = 20
+    VERIFY_ROWS = 1000
+    VERIFY_PD_SEC = datetime.timedelta(hours=24).total_seconds()
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        self._rows: dict[str, dict[int, tuple[str, list]]] = {}
+        self._parsed: dict[tuple[str, Callable], dict[int, tuple[str, Any]]] = {}
+        # Held while a range syncs; `mu` is only held for cache access, so
+        # readers of other sheets aren't blocked by Sheets requests
+        self._key_mu: dict[str, threading.Lock] = {}
+        self.fetched_rows = 0
+        self.reloads = 0
+
+    def _cached_rows(self, key):
+        if key not in self._rows:
+            self._rows[key] = {
+                row: (digest, json.loads(data))
+                for row, digest, data in self.execute(
+                    "SELECT row, digest, data FROM rows WHERE key=? ORDER BY row",
+                    (key,),
+                )
+            }
+        return self._rows[key]
+
+    def _fetch(self, sheet_id, tab, cols, from_row):
+        fetched = _get_values(sheet_id, f"{tab}!{cols[0]}{from_row}:{cols[1]}")
+        with self.mu:
+            self.fetched_rows += len(fetched)
+        return {from_row + i: (_digest(r), r) for i, r in enumerate(fetched)}
+
+    def _reload_reason(self, state, headers, first_row):
+        if not state:
+            return "not cached"
+        if json.loads(state[0][0]) != headers:
+            return "headers changed"
+        if first_row < state[0][1]:
+            return "earlier rows requested"
+        return None
+
+    def _fetch_appended(self, rng, rows, first_row, verify):
+        """Fetches rows of `rng` (sheet ID, tab and columns) past the cached
+        ones, along with the last OVERLAP (or VERIFY_ROWS, if `verify`) cached
+        rows to compare against. Returns a reload reason if the compared rows
+        changed, and the new rows."""
+        next_row = max(rows, default=first_row - 1) + 1
+        window = self.VERIFY_ROWS if verify else self.OVERLAP
+        fetched = self._fetch(*rng, max(first_row, next_row - window))
+        if any(rows.get(r, v)[0] != v[0] for r, v in fetched.items()):
+            return "cached rows were edited", {}
+        if rows and max(fetched, default=0) < next_row - 1:
+            return "cached rows were deleted", {}
+        return None, {r: v for r, v in fetched.items() if r not in rows}
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self.mu:
+            return self._key_mu.setdefault(key, threading.Lock())
+
+    def sync(self, sheet_id, tab, cols, first_row) -> tuple[list[str], str]:
+        """Fetches rows appended to `tab` columns `cols` (e.g. ("A", "N")) of
+        the sheet since the last sync, reloading if needed; returns the
+        header row and cache key"""
+        key = f"{sheet_id}!{tab}!{cols[0]}:{cols[1]}"
+        with self._key_lock(key):
+            header_range = f"{tab}!{cols[0]}1:{cols[1]}1"
+            headers = (_get_values(sheet_id, header_range) or [[]])[0]
+            with self.mu:
+                # Only modified by this method, under the range's lock
+                rows = self._cached_rows(key)
+                state = self.execute(
+                    "SELECT headers, first_row, verified FROM ranges WHERE key=?",
+                    (key,),
+                )
+            now = time.time()
+            reason = self._reload_reason(state, headers, first_row)
+            verify = False
+            new: dict = {}
+            if reason is None:
+                verify = now - state[0][2] > self.VERIFY_PD_SEC
+                reason, new = self._fetch_appended(
+                    (sheet_id, tab, cols), rows, state[0][1], verify
+                )
+            if reason is not None:
+                if state:
+                    first_row = min(first_row, state[0][1])
+                log.info(f"Reloading {key} from row {first_row} ({reason})")
+                new = self._fetch(sheet_id, tab, cols, first_row)
+
+            with self.mu:
+                if reason is not None:
+                    self.reloads += 1
+                    rows.clear()
+                    for k in [k for k in self._parsed if k[0] == key]:
+                        del self._parsed[k]
+                    self.execute("DELETE FROM rows WHERE key=?", (key,))
+                if reason is not None or verify:
+                    self.execute(
+                        "INSERT OR REPLACE INTO ranges VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(headers), first_row, now),
+                    )
+                rows.update(new)
+                self.executemany(
+                    "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                    [(key, r, dg, json.dumps(data)) for r, (dg, data) in new.items()],
+                )
+            if new:
+                log.info(f"Cached {len(new)} new rows of {key}")
+        return headers, key
+
+    def read(  # pylint: disable=too-many-arguments
+        self, sheet_id, tab, cols, first_row, parse: Callable[[list, list], Any]
+    ) -> list[Any]:
+        """Syncs the range, then returns `parse(headers, row)` for each row from
+        `first_row` onward, skipping rows it returns None for. Parsed values
+        are shared between calls and must not be modified."""
+        first_row = max(first_row, 2)  # Row 1 is the header row
+        headers, key = self.sync(sheet_id, tab, cols, first_row)
+        with self.mu:
+            memo = self._parsed.setdefault((key, parse), {})
+            result = []
+            for r, (dg, data) in self._rows[key].items():
+                if r < first_row:
+                    continue
+                m = memo.get(r)
+                if m is None or m[0] != dg:
+                    m = (dg, parse(headers, data))
+                    memo[r] = m
+                if m[1] is not None:
+                    result.append(m[1])
+            return result
+
+
+row_cache = SheetRowCache()
+
+
+def _instructor_submission(headers, row):
+    data = dict(zip(headers, row))
+    if not data.get("Timestamp"):
+        return None
+    data["Timestamp"] = safe_parse_datetime(data["Timestamp"])
+    return data
+
+
 def get_instructor_submissions_raw(from_row=1300):
     """Get log submissions from instructors
 
     Note: columns up to Neon ID are included
     """
     sheet_id = get_config("google/sheets/ids/instructor_hours")
-    headers = get_sheet_range(sheet_id, "Form Responses 1!A1:N")[0]
-    for row in get_sheet_range(sheet_id, f"Form Responses 1!A{from_row}:N"):
-        data = dict(zip(headers, row))
-        if not data.get("Timestamp"):
-            continue
-        data["Timestamp"] = safe_parse_datetime(data["Timestamp"])
-        yield data
+    for data in row_cache.read(
+        sheet_id, "Form Responses 1", ("A", "N"), from_row, _instructor_submission
+    ):
+        yield dict(data)
 
 
 PASS_HDR = "Protohaven emails of each student who PASSED (This should be the email address they used to sign up for the class or for their Protohaven account). If none of them passed, enter N/A."  # pylint: disable=line-too-long
@@ -68,54 +255,66 @@ CLEARANCE_HDR = "Which clearance(s) was covered?"
 TOOLS_HDR = "Which tools were cleared (if any?)"
 
 
+def _passing_student_clearances(headers, row):
+    sub = _instructor_submission(headers, row)
+    if sub is None:
+        return None
+    emails = sub.get(PASS_HDR)
+    mm = re.findall(r"[\w.+-]+@[\w-]+\.[\w.-]+", emails)
+    if not mm:
+        log.warning(f"No valid emails parsed from row: {emails}")
+    emails = [m.replace("(", "").replace(")", "").replace(",", "").strip() for m in mm]
+
+    tool_codes = sub.get(TOOLS_HDR)
+    tool_codes = (
+        # Handle e.g. "Welding - WGR: Tungsten Grinder" -> "WGR"
+        [s.split(":")[0].split(" ")[-1].strip() for s in tool_codes.split(",")]
+        if tool_codes
+        else None
+    )
+    return sub["Timestamp"], [e.strip().lower() for e in emails], tool_codes
+
+
 def get_passing_student_clearances(
     dt=None, from_row=1300
 ) -> Iterator[tuple[Email, list[ClearanceCodeShort], datetime.datetime]]:
     """Minimally parse and return instructor submissions after from_row in the sheet.
     Yields a sequence of clearance info for each student that passed a class.
     """
-    for sub in get_instructor_submissions_raw(from_row):
-        if dt is not None and sub["Timestamp"] < dt:
+    sheet_id = get_config("google/sheets/ids/instructor_hours")
+    for ts, emails, tool_codes in row_cache.read(
+        sheet_id, "Form Responses 1", ("A", "N"), from_row, _passing_student_clearances
+    ):
+        if dt is not None and ts < dt:
             continue
-        emails = sub.get(PASS_HDR)
-        mm = re.findall(r"[\w.+-]+@[\w-]+\.[\w.-]+", emails)
-        if not mm:
-            log.warning(f"No valid emails parsed from row: {emails}")
-        emails = [
-            m.replace("(", "").replace(")", "").replace(",", "").strip() for m in mm
-        ]
-
-        tool_codes = sub.get(TOOLS_HDR)
-        tool_codes = (
-            # Handle e.g. "Welding - WGR: Tungsten Grinder" -> "WGR"
-            [s.split(":")[0].split(" ")[-1].strip() for s in tool_codes.split(",")]
-            if tool_codes
-            else None
-        )
         for e in emails:
-            yield (e.strip().lower(), tool_codes, sub["Timestamp"])
+            yield (e, list(tool_codes) if tool_codes else tool_codes, ts)
+
+
+SIGN_IN_HEADERS = {
+    "Email address (members must use the address from your Neon Protohaven account)": "email",  # pylint: disable=line-too-long
+    "Timestamp": "timestamp",
+    "First Name": "first",
+    "Last Name": "last",
+}
+
+
+def _sign_in(headers, row):
+    data = dict(zip((SIGN_IN_HEADERS.get(h, h) for h in headers), row))
+    if not data.get("timestamp"):
+        return None
+    data["timestamp"] = safe_parse_datetime(data["timestamp"])
+    return data
 
 
-def get_sign_ins_between(start, end):
-    """Returns sign-in events between start and end dates. Not very efficient."""
+def get_sign_ins_between(start, end, from_row=12200):
+    """Returns sign-in events between start and end dates"""
     sheet_id = get_config("google/sheets/ids/welcome_waiver_form")
-    headers = get_sheet_range(sheet_id, "Form Responses 1!A1:D")[0]
-    # Remap long header names
-    headers = [
-        {
-            "Email address (members must use the address from your Neon Protohaven account)": "email",  # pylint: disable=line-too-long
-            "Timestamp": "timestamp",
-            "First Name": "first",
-            "Last Name": "last",
-        }.get(h, h)
-        for h in headers
-    ]
-    for row in get_sheet_range(sheet_id, "Form Responses 1!A12200:D"):
-        data = dict(zip(headers, row))
-        t = safe_parse_datetime(data["timestamp"])
-        if start <= t <= end:
-            data["timestamp"] = t
-            yield data
+    for data in row_cache.read(
+        sheet_id, "Form Responses 1", ("A", "D"), from_row, _sign_in
+    ):
+        if start <= data["timestamp"] <= end:
+            yield dict(data)
 
 
 def get_ops_budget_state():
@@ -162,11 +361,10 @@ def _download_sheet(sheets_id: str):
     # create drive api client
     drive = _get_service_client("drive", "v3")
     # pylint: disable=maybe-no-member
-    request = drive.files().export_media(
-        fileId=sheets_id,
-        mimeType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    request = drive.files().export_media(fileId=sheets_id, mimeType=XLSX_MIMETYPE)
+    file = tempfile.SpooledTemporaryFile(  # pylint: disable=consider-using-with
+        max_size=SPOOL_MAX_BYTES
     )
-    file = io.BytesIO()
     downloader = MediaIoBaseDownload(file, request)
     done = False
     while done is False:
@@ -174,21 +372,26 @@ def _download_sheet(sheets_id: str):
     return file
 
 
-def fetch_sheets_backup(dest: str) -> int:
+def fetch_sheets_backup(dest: str, workers=BACKUP_WORKERS) -> int:
     """Writes a tarball of the sheets found in sheets/ids
     Args:
         dest: the output location for the tarball
+        workers: how many sheets to export at once
     Returns:
         File size
     """
-    with tarfile.open(dest, "w:gz") as tar:
-        for [name, sheets_id] in get_config("google/sheets/ids").items():
-            data_stream = _download_sheet(sheets_id)
-            content = data_stream.getvalue()
-            data_len = len(content)
-            info = tarfile.TarInfo(name=f"{name}.xls")
-            info.size = data_len
-            # We pass the stream back to the beginning before adding
-            data_stream.seek(0)
-            tar.addfile(tarinfo=info, fileobj=data_stream)
+    ids = get_config("google/sheets/ids")
+    with tarfile.open(
+        dest, "w:gz", compresslevel=BACKUP_COMPRESSLEVEL
+    ) as tar, ThreadPoolExecutor(workers) as pool:
+        tar.copybufsize = COPY_BUFSIZE  # type: ignore[attr-defined]
+        exports = {pool.submit(_download_sheet, sid): name for name, sid in ids.items()}
+        for f in as_completed(exports):
+            with f.result() as data_stream:
+                info = tarfile.TarInfo(name=f"{exports[f]}.xls")
+                info.size = data_stream.seek(0, io.SEEK_END)
+                # We pass the stream back to the beginning before adding
+                data_stream.seek(0)
+                tar.addfile(tarinfo=info, fileobj=data_stream)
+            log.info(f"Archived {exports[f]} ({info.size // 1024}KB)")
     return getsize(dest)
@@ -3,11 +3,43 @@
 import datetime
 import json
 import logging
+import threading
+import time
 from functools import lru_cache
 
+from asana.rest import ApiException
+
 from protohaven_api.config import get_config, safe_parse_datetime, tznow
 from protohaven_api.integrations import airtable_base
 from protohaven_api.integrations.data.connector import get as get_connector
+from protohaven_api.integrations.data.local_db import LocalDB
+
+log = logging.getLogger("integrations.tasks")
+
+# Readers sync the project they read at most this often
+SYNC_PD_SEC = 60
+
+# Full listings skip tasks completed longer ago than this, since there's no way
+# to order a fetch by time and old tasks would otherwise be loaded every time
+COMPLETED_SINCE_DAYS = 400
+
+TASK_FIELDS = ",".join(
+    [
+        "name",
+        "notes",
+        "completed",
+        "completed_at",
+        "created_at",
+        "modified_at",
+        "memberships.project",
+        "memberships.section",
+        "tags",
+        "custom_fields.name",
+        "custom_fields.text_value",
+        "custom_fields.number_value",
+        "custom_fields.enum_value",
+    ]
+)
 
 
 def _use_db():
@@ -29,6 +61,256 @@ def _projects():
     return get_connector().asana_projects()
 
 
+def _events():
+    """Fetches the events API client via connector"""
+    return get_connector().asana_events()
+
+
+def _section(t, project):
+    """Returns the gid of the section `t` is in within `project`"""
+    for m in t.get("memberships") or []:
+        if (m.get("project") or {}).get("gid") == project:
+            return (m.get("section") or {}).get("gid")
+    return None
+
+
+def _attrs(t, project):
+    """Yields the (attr, value) pairs a task can be queried by"""
+    section = _section(t, project)
+    if section:
+        yield ("section", section)
+    for tag in t.get("tags") or []:
+        yield ("tag", tag["gid"])
+    for cf in t.get("custom_fields") or []:
+        v = next(
+            (
+                cf[k]
+                for k in ("text_value", "number_value", "enum_value")
+                if cf.get(k) is not None
+            ),
+            None,
+        )
+        if isinstance(v, dict):
+            v = v.get("gid")
+        if v is not None:
+            yield (f"field:{cf['gid']}", str(v))
+
+
+class TaskStore(LocalDB):
+    """Local copy of the tasks in each Asana project that's read.
+
+    The first sync of a project lists all of its tasks and takes a sync token
+    from Asana's events API; later syncs fetch only the events since that
+    token and refetch the tasks they mention. If the token expires (Asana
+    returns 412 with a fresh one) the project is listed again. Tasks are
+    indexed by section, tag and custom field value so readers don't have to
+    walk the project.
+    """
+
+    NAME = "asana_tasks"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            project TEXT NOT NULL,
+            gid TEXT NOT NULL,
+            pos INTEGER NOT NULL,
+            completed INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (project, gid)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS task_attrs (
+            project TEXT NOT NULL,
+            gid TEXT NOT NULL,
+            attr TEXT NOT NULL,
+            value TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS task_attrs_value
+            ON task_attrs (project, attr, value);
+        CREATE INDEX IF NOT EXISTS task_attrs_task ON task_attrs (project, gid);
+        CREATE TABLE IF NOT EXISTS sync_tokens (
+            project TEXT PRIMARY KEY,
+            token TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        self._synced: dict[str, float] = {}
+        # Held while a project syncs; `mu` is only held for database access,
+        # so readers of other projects aren't blocked by Asana requests
+        self._project_mu: dict[str, threading.Lock] = {}
+        self.full_syncs = 0
+        self.fetched_tasks = 0
+
+    def _changes(self, project, token=None):
+        """Returns the events since `token` as (task gids changed, task gids
+        removed, new token), or Nones and a fresh token if `token` is missing
+        or expired"""
+        changed: dict[str, None] = {}
+        removed = set()
+        while True:
+            try:
+                rep = _events().get_events(
+                    project, {"sync": token} if token else {}, full_payload=True
+                )
+            except ApiException as e:
+                if e.status != 412:
+                    raise
+                return None, None, json.loads(e.body)["sync"]
+            for ev in rep.get("data") or []:
+                res = ev.get("resource") or {}
+                if res.get("resource_type") != "task":
+                    continue
+                parent = (ev.get("parent") or {}).get("gid")
+                if ev["action"] == "deleted" or (
+                    ev["action"] == "removed" and parent == project
+                ):
+                    removed.add(res["gid"])
+                    changed.pop(res["gid"], None)
+                else:
+                    changed[res["gid"]] = None
+                    removed.discard(res["gid"])
+            token = rep["sync"]
+            if not rep.get("has_more"):
+                return list(changed), removed, token
+
+    def _put(self, project, t, pos=None):
+        if pos is None:
+            # Tasks updated in place keep their position; new ones go last
+            pos = self.execute(
+                "SELECT COALESCE("
+                "(SELECT pos FROM tasks WHERE project=? AND gid=?), "
+                "(SELECT MAX(pos) + 1 FROM tasks WHERE project=?), 0)",
+                (project, t["gid"], project),
+            )[0][0]
+        self._remove(project, t["gid"])
+        self.execute(
+            "INSERT INTO tasks VALUES (?, ?, ?, ?, ?)",
+            (project, t["gid"], pos, bool(t.get("completed")), json.dumps(t)),
+        )
+        self.executemany(
+            "INSERT INTO task_attrs VALUES (?, ?, ?, ?)",
+            [(project, t["gid"], a, v) for a, v in _attrs(t, project)],
+        )
+
+    def _remove(self, project, gid):
+        self.execute("DELETE FROM tasks WHERE project=? AND gid=?", (project, gid))
+        self.execute("DELETE FROM task_attrs WHERE project=? AND gid=?", (project, gid))
+
+    def _reload(self, project):
+        """Replaces the stored tasks of `project` with a full listing"""
+        since = tznow() - datetime.timedelta(days=COMPLETED_SINCE_DAYS)
+        tasks = list(
+            _tasks().get_tasks_for_project(
+                project,
+                {"completed_since": since.isoformat(), "opt_fields": TASK_FIELDS},
+            )
+        )
+        with self.mu, self.conn:
+            for table in ("tasks", "task_attrs"):
+                self.conn.execute(f"DELETE FROM {table} WHERE project=?", (project,))
+            for i, t in enumerate(tasks):
+                self._put(project, t, pos=i)
+            self.full_syncs += 1
+            self.fetched_tasks += len(tasks)
+
+    def refetch(self, project, gid):
+        """Refetches a single task, dropping it if it's no longer in `project`"""
+        try:
+            t = _tasks().get_task(gid, {"opt_fields": TASK_FIELDS})
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            t = None
+        with self.mu, self.conn:
+            self.fetched_tasks += 1
+            if t and any(
+                (m.get("project") or {}).get("gid") == project
+                for m in t.get("memberships") or []
+            ):
+                self._put(project, {**t, "gid": gid})
+            else:
+                self._remove(project, gid)
+
+    def _project_lock(self, project) -> threading.Lock:
+        with self.mu:
+            return self._project_mu.setdefault(project, threading.Lock())
+
+    def sync(self, project, max_age=None):
+        """Brings the stored tasks of `project` up to date with Asana, unless
+        it was synced within `max_age` seconds (default SYNC_PD_SEC)"""
+        max_age = SYNC_PD_SEC if max_age is None else max_age
+        with self._project_lock(project):
+            last = self._synced.get(project)
+            if last is not None and time.monotonic() - last < max_age:
+                return
+            rows = self.execute(
+                "SELECT token FROM sync_tokens WHERE project=?", (project,)
+            )
+            changed, removed, token = self._changes(
+                project, rows[0][0] if rows else None
+            )
+            if changed is None:
+                log.info(f"Full sync of Asana project {project}")
+                self._reload(project)
+            else:
+                with self.mu, self.conn:
+                    for gid in removed:
+                        self._remove(project, gid)
+                for gid in changed:
+                    self.refetch(project, gid)
+            self.execute(
+                "INSERT OR REPLACE INTO sync_tokens VALUES (?, ?)", (project, token)
+            )
+            self._synced[project] = time.monotonic()
+
+    def query(  # pylint: disable=too-many-arguments
+        self, project, completed=None, section=None, tag=None, field=None
+    ) -> list[dict]:
+        """Returns the tasks of `project` in project order, optionally only
+        those with the given completion state, section gid, tag gid, or
+        custom field value as a (field gid, value) tuple"""
+        self.sync(project)
+        sql = "SELECT t.data FROM tasks t"
+        params: list = []
+        where, where_params = ["t.project=?"], [project]
+        filters = [("section", section), ("tag", tag)]
+        if field is not None:
+            filters.append((f"field:{field[0]}", str(field[1])))
+        for i, (attr, value) in enumerate(filters):
+            if value is None:
+                continue
+            sql += (
+                f" JOIN task_attrs a{i} ON a{i}.project=t.project"
+                f" AND a{i}.gid=t.gid AND a{i}.attr=? AND a{i}.value=?"
+            )
+            params += [attr, value]
+        if completed is not None:
+            where.append("t.completed=?")
+            where_params.append(completed)
+        sql += f" WHERE {' AND '.join(where)} ORDER BY t.pos"
+        return [json.loads(d) for (d,) in self.execute(sql, params + where_params)]
+
+    def set_completed(self, gid, completed=True):
+        """Records a completion change made through the API"""
+        with self.mu:
+            for project, data in self.execute(
+                "SELECT project, data FROM tasks WHERE gid=?", (gid,)
+            ):
+                t = json.loads(data)
+                self.execute(
+                    "UPDATE tasks SET completed=?, data=? WHERE project=? AND gid=?",
+                    (
+                        completed,
+                        json.dumps({**t, "completed": completed}),
+                        project,
+                        gid,
+                    ),
+                )
+
+
+store = TaskStore()
+
+
 def get_all_projects():
     """Get all projects in the Protohaven workspace"""
     return _projects().get_projects_for_workspace(
@@ -51,30 +333,19 @@ def get_tech_ready_tasks(modified_before):
             )
         return
 
-    for t in _tasks().search_tasks_for_workspace(
-        get_config("asana/gid"),
-        {
-            "projects.all": get_config("asana/shop_and_maintenance_tasks/gid"),
-            "completed": False,
-            "modified_on.before": modified_before.strftime("%Y-%m-%d"),
-            "tags.all": get_config("asana/shop_and_maintenance_tasks/tags/tech_ready"),
-            "opt_fields": ",".join(
-                [
-                    "name",
-                    "modified_at",
-                    "custom_fields.name",
-                    "custom_fields.number_value",
-                    "custom_fields.text_value",
-                    "memberships.section",
-                ]
-            ),
-        },
+    project = get_config("asana/shop_and_maintenance_tasks/gid")
+    on_hold = get_config("asana/shop_and_maintenance_tasks/on_hold")
+    cutoff = modified_before.replace(hour=0, minute=0, second=0, microsecond=0)
+    for t in store.query(
+        project,
+        completed=False,
+        tag=get_config("asana/shop_and_maintenance_tasks/tags/tech_ready"),
     ):
-        yield (
-            t["name"],
-            safe_parse_datetime(t["modified_at"]),
-            t.get("section", {}).get("gid"),
-        )
+        modified_at = safe_parse_datetime(t["modified_at"])
+        if modified_at >= cutoff:
+            continue
+        section = _section(t, project)
+        yield (t["name"], modified_at, "on_hold" if section == on_hold else section)
 
 
 def get_project_tracker(include_complete=False):
@@ -102,18 +373,12 @@ def get_project_tracker(include_complete=False):
             if b:
                 yield b
     else:
-        for p in _tasks().get_tasks_for_project(
-            get_config("asana/project_tracker/gid"),
-            {
-                "opt_fields": ",".join(
-                    ["completed", "name", "memberships.section", "modified_at"]
-                ),
-            },
-        ):
+        project = get_config("asana/project_tracker/gid")
+        for p in store.query(project):
             b = _build(
                 p.get("name"),
                 p.get("completed"),
-                p.get("section", {}).get("gid"),
+                _section(p, project),
                 p.get("modified_at"),
             )
             if b:
@@ -122,12 +387,7 @@ def get_project_tracker(include_complete=False):
 
 def get_project_requests():
     """Get project requests submitted by members & nonmembers"""
-    return _tasks().get_tasks_for_project(
-        get_config("asana/project_requests"),
-        {
-            "opt_fields": ",".join(["completed", "notes", "name"]),
-        },
-    )
+    return store.query(get_config("asana/project_requests"))
 
 
 def get_private_instruction_requests():
@@ -136,12 +396,7 @@ def get_private_instruction_requests():
         for rec in airtable_base.get_all_records("tasks", "private_instruction"):
             yield {**rec["fields"], "created_at": rec["fields"]["Created time"]}
     else:
-        yield from _tasks().get_tasks_for_project(
-            get_config("asana/private_instruction_requests"),
-            {
-                "opt_fields": ",".join(["completed", "notes", "name", "created_at"]),
-            },
-        )
+        yield from store.query(get_config("asana/private_instruction_requests"))
 
 
 def get_with_onhold_section(project, exclude_on_hold=False, exclude_complete=False):
@@ -177,14 +432,7 @@ def get_with_onhold_section(project, exclude_on_hold=False, exclude_complete=Fal
                 yield b
         return
 
-    for req in _tasks().get_tasks_for_project(
-        cfg["gid"],
-        {
-            "opt_fields": ",".join(
-                ["completed", "name", "memberships.section", "modified_at"]
-            ),
-        },
-    ):
+    for req in store.query(cfg["gid"]):
         section_gids = [
             m.get("section", {}).get("gid") for m in req.get("memberships", [])
         ]
@@ -243,18 +491,15 @@ def get_shop_tech_applicants(exclude_on_hold=False, exclude_complete=False):
 
 def get_phone_messages():
     """Get all uncompleted phone messages"""
-    return _tasks().get_tasks_for_project(
-        get_config("asana/phone_messages"),
-        {
-            "opt_fields": ",".join(["completed", "name", "notes", "created_at"]),
-        },
-    )
+    return store.query(get_config("asana/phone_messages"))
 
 
 def complete(gid):
     """Complete a task"""
     # https://developers.asana.com/reference/updatetask
-    return _tasks().update_task({"data": {"completed": True}}, gid, {})
+    result = _tasks().update_task({"data": {"completed": True}}, gid, {})
+    store.set_completed(gid)
+    return result
 
 
 def _get_maint_ref(t):
@@ -269,7 +514,7 @@ def last_maintenance_completion_map():
     """Builds a map of origin IDs to the last completion date.
     Returns the current time for all incomplete tasks.
 
-    Tasks completed earlier than 400 days ago are excluded.
+    Tasks completed earlier than COMPLETED_SINCE_DAYS ago are excluded.
     """
     result = {}
 
@@ -282,28 +527,11 @@ def last_maintenance_completion_map():
             result[aid] = mod
 
     now = tznow()
-
-    for t in _tasks().get_tasks_for_project(
-        get_config("asana/shop_and_maintenance_tasks/gid"),
-        {
-            # Python Asana lib is auto-paginated
-            # See https://forum.asana.com/t/pagination-using-python/38930
-            # We use completed_since to prevent excessive loading of super old tasks
-            # since there's no way to order fetch by time data
-            "completed_since": (now - datetime.timedelta(days=400)).isoformat(),
-            "opt_fields": ",".join(
-                [
-                    "completed",
-                    "name",
-                    "modified_at",
-                    "uri",
-                    "custom_fields.name",
-                    "custom_fields.number_value",
-                    "custom_fields.text_value",
-                ]
-            ),
-        },
-    ):
+    cutoff = now - datetime.timedelta(days=COMPLETED_SINCE_DAYS)
+    for t in store.query(get_config("asana/shop_and_maintenance_tasks/gid")):
+        completed_at = t.get("completed_at") or t["modified_at"]
+        if t["completed"] and safe_parse_datetime(completed_at) < cutoff:
+            continue
         _build_map(_get_maint_ref(t), t["completed"], t["modified_at"], now)
     return result
 
@@ -402,16 +630,11 @@ def add_maintenance_task_if_not_exists(name, notes, maint_ref, level, section=No
     if section is not None:
         section = _resolve_section_gid(section)
 
-    matching = list(
-        _tasks().search_tasks_for_workspace(
-            get_config("asana/gid"),
-            {
-                f"custom_fields.{get_config('asana/shop_and_maintenance_tasks/custom_fields/airtable_id/gid')}.value": maint_ref,  # pylint: disable=line-too-long
-                "completed": False,
-                "limit": 1,
-            },
-        )
+    project = get_config("asana/shop_and_maintenance_tasks/gid")
+    field_gid = get_config(
+        "asana/shop_and_maintenance_tasks/custom_fields/airtable_id/gid"
     )
+    matching = store.query(project, completed=False, field=(field_gid, maint_ref))
     if len(matching) > 0:
         return matching[0].get("gid")  # Already exists
 
@@ -420,14 +643,10 @@ def add_maintenance_task_if_not_exists(name, notes, maint_ref, level, section=No
     result = _tasks().create_task(
         {
             "data": {
-                "projects": [get_config("asana/shop_and_maintenance_tasks/gid")],
+                "projects": [project],
                 "section": section,
                 "tags": tags,
-                "custom_fields": {
-                    get_config(
-                        "asana/shop_and_maintenance_tasks/custom_fields/airtable_id/gid"
-                    ): str(maint_ref),
-                },
+                "custom_fields": {field_gid: str(maint_ref)},
                 "name": name,
                 "notes": notes,
             }
@@ -440,6 +659,9 @@ def add_maintenance_task_if_not_exists(name, notes, maint_ref, level, section=No
         _sections().add_task_for_section(
             str(section), {"body": {"data": {"task": task_gid}}}
         )
+    if task_gid:
+        # So repeat calls see it before the next sync
+        store.refetch(project, task_gid)
     return task_gid
 
 
@@ -1,9 +1,238 @@
 """Test for Asana task integration"""
 
+import json
+import threading
+import time
+from collections import Counter
+
+import pytest
+from asana.rest import ApiException
+
 from protohaven_api.config import safe_parse_datetime
 from protohaven_api.integrations import tasks as t
+from protohaven_api.integrations.data.local_db import MEMORY
 from protohaven_api.testing import d
 
+PROJECT = "proj"
+
+
+class FakeAsana:
+    """Stands in for the Asana tasks and events APIs, serving one project's
+    tasks and a log of events about them"""
+
+    def __init__(self, tasks=()):
+        self.tasks = {x["gid"]: x for x in tasks}
+        self.events: list[dict] = []
+        self.expired = False
+        self.calls: Counter = Counter()
+        self.list_opts: dict = {}
+
+    def get_tasks_for_project(self, project, opts):
+        """Lists the project's tasks"""
+        assert project == PROJECT
+        self.calls["list"] += 1
+        self.list_opts = opts
+        return list(self.tasks.values())
+
+    def get_task(self, gid, _opts):
+        """Gets a single task"""
+        self.calls["get"] += 1
+        if gid not in self.tasks:
+            raise ApiException(status=404)
+        return self.tasks[gid]
+
+    def get_events(self, _resource, opts, full_payload):
+        """Returns up to 100 events since the sync token, or a 412 with a
+        fresh token if it's missing or expired"""
+        assert full_payload
+        self.calls["events"] += 1
+        token = opts.get("sync")
+        if token is None or self.expired:
+            self.expired = False
+            e = ApiException(status=412)
+            e.body = json.dumps({"sync": str(len(self.events))}).encode()
+            raise e
+        start = int(token)
+        data = self.events[start : start + 100]
+        end = start + len(data)
+        return {"data": data, "sync": str(end), "has_more": end < len(self.events)}
+
+    def put(self, task, action="changed"):
+        """Adds or changes a task"""
+        self.tasks[task["gid"]] = task
+        self._event(task["gid"], action)
+
+    def remove(self, gid):
+        """Removes a task from the project"""
+        del self.tasks[gid]
+        self._event(gid, "removed")
+
+    def _event(self, gid, action):
+        self.events.append(
+            {
+                "action": action,
+                "resource": {"gid": gid, "resource_type": "task"},
+                "parent": {"gid": PROJECT, "resource_type": "project"},
+            }
+        )
+
+
+def _task(gid, section="s1", completed=False, tags=(), **fields):
+    return {
+        "gid": gid,
+        "name": f"task {gid}",
+        "completed": completed,
+        "modified_at": "2025-01-01T00:00:00Z",
+        "memberships": [{"project": {"gid": PROJECT}, "section": {"gid": section}}],
+        "tags": [{"gid": g} for g in tags],
+        "custom_fields": [
+            {"gid": k, "name": k, "text_value": v} for k, v in fields.items()
+        ],
+    }
+
+
+@pytest.fixture(autouse=True, name="asana")
+def fixture_asana(mocker):
+    """Serves tasks from an empty FakeAsana through a fresh in-memory store"""
+    mocker.patch.object(t, "store", t.TaskStore(MEMORY))
+    fake = FakeAsana()
+    mocker.patch.object(t, "_tasks", return_value=fake)
+    mocker.patch.object(t, "_events", return_value=fake)
+    return fake
+
+
+def test_task_store_incremental(asana):
+    """After the first listing, syncs only refetch tasks named in events"""
+    asana.tasks = {str(i): _task(str(i)) for i in range(5)}
+    assert [x["gid"] for x in t.store.query(PROJECT)] == ["0", "1", "2", "3", "4"]
+    assert asana.calls == {"events": 1, "list": 1}
+
+    asana.put(_task("1", completed=True))
+    asana.put(_task("5"), action="added")
+    asana.remove("3")
+    # Synced recently, so nothing is fetched
+    assert len(t.store.query(PROJECT)) == 5
+    assert asana.calls["events"] == 1
+
+    t.store.sync(PROJECT, max_age=0)
+    assert asana.calls == {"events": 2, "list": 1, "get": 2}
+    assert [x["gid"] for x in t.store.query(PROJECT, completed=False)] == [
+        "0",
+        "2",
+        "4",
+        "5",
+    ]
+    assert t.store.full_syncs == 1
+
+
+def test_task_store_update_keeps_position(asana):
+    """Tasks changed in place keep their listed position; added ones go last"""
+    asana.tasks = {str(i): _task(str(i)) for i in range(3)}
+    t.store.sync(PROJECT)
+    asana.put(_task("0", completed=True))
+    asana.put(_task("3"), action="added")
+    t.store.sync(PROJECT, max_age=0)
+    assert [x["gid"] for x in t.store.query(PROJECT)] == ["0", "1", "2", "3"]
+
+
+def test_task_store_indexes_zero_values(asana):
+    """A custom field number value of 0 is indexed, not skipped"""
+    task = _task("0")
+    task["custom_fields"] = [{"gid": "n", "name": "n", "number_value": 0}]
+    asana.tasks = {"0": task}
+    assert [x["gid"] for x in t.store.query(PROJECT, field=("n", "0"))] == ["0"]
+
+
+def test_task_store_expired_token(asana):
+    """An expired sync token falls back to listing the project again"""
+    asana.tasks = {"0": _task("0")}
+    t.store.sync(PROJECT)
+    asana.tasks["1"] = _task("1")  # Missed, e.g. while the server was down
+    asana.expired = True
+    t.store.sync(PROJECT, max_age=0)
+    assert asana.calls["list"] == 2
+    assert [x["gid"] for x in t.store.query(PROJECT)] == ["0", "1"]
+
+    # The fresh token is used from then on
+    asana.put(_task("0", completed=True))
+    t.store.sync(PROJECT, max_age=0)
+    assert asana.calls["list"] == 2
+    assert t.store.query(PROJECT, completed=True)[0]["gid"] == "0"
+
+
+def test_task_store_listing_skips_old_completed(asana, mocker):
+    """Full listings only ask for tasks completed in the last
+    COMPLETED_SINCE_DAYS"""
+    mocker.patch.object(t, "tznow", return_value=d(0))
+    t.store.sync(PROJECT)
+    assert safe_parse_datetime(asana.list_opts["completed_since"]) == d(
+        -t.COMPLETED_SINCE_DAYS
+    )
+    assert asana.list_opts["opt_fields"] == t.TASK_FIELDS
+
+
+def test_task_store_deleted_task(asana):
+    """Tasks that can't be fetched any more are dropped"""
+    asana.tasks = {"0": _task("0"), "1": _task("1")}
+    t.store.sync(PROJECT)
+    asana.put(_task("1"))
+    del asana.tasks["1"]
+    t.store.sync(PROJECT, max_age=0)
+    assert [x["gid"] for x in t.store.query(PROJECT)] == ["0"]
+
+
+def test_task_store_sync_doesnt_block_other_projects(asana, mocker):
+    """Asana requests for one project's sync don't hold up readers of
+    another project"""
+    asana.tasks = {"1": _task("1")}
+    t.store.query(PROJECT)
+    gate = threading.Event()
+    get_events = asana.get_events
+
+    def slow_events(resource, opts, full_payload):
+        if resource == "other":
+            gate.wait(5)
+            raise ApiException(status=404)
+        return get_events(resource, opts, full_payload)
+
+    def sync_other():
+        with pytest.raises(ApiException):
+            t.store.sync("other")
+
+    mocker.patch.object(asana, "get_events", side_effect=slow_events)
+    syncing = threading.Thread(target=sync_other)
+    syncing.start()
+    try:
+        time.sleep(0.05)
+        assert [x["gid"] for x in t.store.query(PROJECT)] == ["1"]
+        t.store.set_completed("1")
+        assert syncing.is_alive()  # Served while the other sync is blocked
+    finally:
+        gate.set()
+        syncing.join()
+
+
+def test_task_store_query_indexes(asana):
+    """Tasks can be looked up by section, tag and custom field"""
+    asana.tasks = {
+        "0": _task("0", section="a", tags=["x"], ref="r0"),
+        "1": _task("1", section="b", tags=["x", "y"], ref="r1"),
+        "2": _task("2", section="b", completed=True, ref="r0"),
+    }
+
+    def gids(**kwargs):
+        return [x["gid"] for x in t.store.query(PROJECT, **kwargs)]
+
+    assert gids(section="b") == ["1", "2"]
+    assert gids(tag="x") == ["0", "1"]
+    assert gids(tag="x", section="b") == ["1"]
+    assert gids(field=("ref", "r0")) == ["0", "2"]
+    assert gids(field=("ref", "r0"), completed=False) == ["0"]
+    assert not gids(field=("ref", "r2"))
+
+    t.store.set_completed("0")
+    assert not gids(field=("ref", "r0"), completed=False)
+
 
 def test_get_with_onhold_section(mocker):
     """Test get_with_onhold_section for task filtering"""
@@ -18,19 +247,22 @@ def test_get_with_onhold_section(mocker):
     mt = mocker.patch.object(t, "_tasks")
     mt().get_tasks_for_project.return_value = [
         {
+            "gid": "1",
             "completed": False,
             "memberships": [{"section": {"gid": "456"}}],
-            "modified_at": d(0),
+            "modified_at": d(0).isoformat(),
         },
         {
+            "gid": "2",
             "completed": False,
             "memberships": [{"section": {"gid": "789"}}],
-            "modified_at": d(1),
+            "modified_at": d(1).isoformat(),
         },
         {
+            "gid": "3",
             "completed": True,
             "memberships": [{"section": {"gid": "456"}}],
-            "modified_at": d(2),
+            "modified_at": d(2).isoformat(),
         },
     ]
 
@@ -68,14 +300,16 @@ def test_last_maintenance_completion_map(mocker):
 
     tasks = [
         {
+            "gid": "1",
             "completed": True,
             "modified_at": "2024-12-01T00:00:00Z",
-            "custom_fields": [{"name": "Origin ID", "text_value": "123"}],
+            "custom_fields": [{"gid": "cf", "name": "Origin ID", "text_value": "123"}],
         },
         {
+            "gid": "2",
             "completed": False,
             "modified_at": "2025-01-01T00:00:00Z",
-            "custom_fields": [{"name": "Origin ID", "text_value": "456"}],
+            "custom_fields": [{"gid": "cf", "name": "Origin ID", "text_value": "456"}],
         },
     ]
 
@@ -115,8 +349,18 @@ def test_add_maintenance_task_if_not_exists(mocker):
     mock_tasks = mocker.patch.object(t, "_tasks")
     mock_sections = mocker.patch.object(t, "_sections")
 
+    def _maint_task(gid):
+        return {
+            "gid": gid,
+            "completed": False,
+            "memberships": [{"project": {"gid": "shop_and_maintenance_tasks_gid"}}],
+            "custom_fields": [
+                {"gid": "airtable_custom_field_id", "text_value": "rec12345"}
+            ],
+        }
+
     # Test when the task already exists
-    mock_tasks().search_tasks_for_workspace.return_value = [{"gid": "existing_gid"}]
+    mock_tasks().get_tasks_for_project.return_value = [_maint_task("existing_gid")]
     task_gid = t.add_maintenance_task_if_not_exists(
         "Task Name", "Task Desc", "rec12345", ["training_needed"]
     )
@@ -128,9 +372,10 @@ def test_add_maintenance_task_if_not_exists(mocker):
         {"name": "section", "gid": "section_gid"}
     ]
 
-    # Test when the task does not exist
-    mock_tasks().search_tasks_for_workspace.return_value = []
+    # Test when the task does not exist (the existing one was completed)
+    t.complete("existing_gid")
     mock_tasks().create_task.return_value = {"gid": "new_gid"}
+    mock_tasks().get_task.return_value = _maint_task("new_gid")
     task_gid = t.add_maintenance_task_if_not_exists(
         "Task Name", "Task Desc", "rec12345", "training_needed", "section"
     )
@@ -154,6 +399,15 @@ def test_add_maintenance_task_if_not_exists(mocker):
         "section_gid", {"body": {"data": {"task": "new_gid"}}}
     )
 
+    # A repeat call finds the new task without waiting for a sync
+    assert (
+        t.add_maintenance_task_if_not_exists(
+            "Task Name", "Task Desc", "rec12345", "training_needed", "section"
+        )
+        == "new_gid"
+    )
+    mock_tasks().create_task.assert_called_once()
+
 
 def test_ensure_purchase_requests_webhook(mocker):
     """Test ensure_purchase_requests_webhook function"""
@@ -221,3 +475,38 @@ def test_ensure_purchase_requests_webhook(mocker):
 
     result = t.ensure_purchase_requests_webhook("https://example.com/webhook")
     assert result is None
+
+
+@pytest.mark.benchmark
+def test_task_store_benchmark(asana):
+    """Repeated filtered reads of a large project, served from the store and
+    kept in sync from events. Listing the project on every read instead would
+    take one API request per 100 tasks each time."""
+    n_tasks, n_reads, n_changes = 5000, 20, 5
+    asana.tasks = {
+        str(i): _task(str(i), section=f"s{i % 4}", completed=i % 3 == 0, ref=f"r{i}")
+        for i in range(n_tasks)
+    }
+    start = time.perf_counter()
+    t.store.sync(PROJECT)
+    first_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(n_reads):
+        for j in range(n_changes):
+            asana.put(_task(str(i * n_changes + j), completed=True))
+        t.store.sync(PROJECT, max_age=0)
+        got = t.store.query(PROJECT, completed=False, field=("ref", f"r{i + 200}"))
+        assert len(got) == (1 if (i + 200) % 3 else 0)
+    store_sec = time.perf_counter() - start
+
+    pages = -(-n_tasks // 100)
+    requests = pages + asana.calls["events"] + asana.calls["get"]
+    print(
+        f"{n_reads} reads of {n_tasks} tasks with {n_changes} changes between: "
+        f"first sync {first_sec:.3f}s, then {store_sec / n_reads * 1000:.1f}ms "
+        f"per read; {requests} API requests vs. {n_reads * pages} listing each time"
+    )
+    assert asana.calls["list"] == 1
+    assert asana.calls["get"] == n_reads * n_changes
+    assert requests < n_reads * pages / 2
@@ -6,6 +6,7 @@ import time
 
 from protohaven_api.app import configure_app
 from protohaven_api.automation.membership.sign_in import initialize as init_signin
+from protohaven_api.automation.reporting import ops_history
 from protohaven_api.automation.roles.roles import setup_discord_user
 from protohaven_api.config import get_config
 from protohaven_api.integrations import airtable, booked, comms, mqtt, neon, tasks
@@ -57,8 +58,15 @@ if get_config("general/precache_sign_in", as_bool=True):
         )
     airtable.cache.start()
     booked.cache.start()
+    booked.catalog.start()
     init_signin()
 
+if get_config("general/record_ops_history", as_bool=True):
+    # Delayed so the first snapshot doesn't compete with startup prefetching
+    ops_history.snapshotter.start(delay=300)
+else:
+    log.info("Not recording ops report history")
+
 if get_config("discord_bot/enabled", as_bool=True):
     threading.Thread(target=run_bot, daemon=True, args=(setup_discord_user,)).start()
 else:
@@ -100,18 +108,28 @@ else:
 
 
 def _on_reservations(cache):
-    rr = cache.get_today_reservations_by_tool()
-    log.debug(f"Reservation cache by tool: {rr}")
-    for tool_code, data in rr.items():
-        neon_id = neon.cached_neon_id_from_booked_id(int(data["user"]))
-        log.info(f"Reservation: {tool_code} {neon_id} {data}")
-        mqtt.notify_reservation(
-            tool_code,
-            data["ref"],
-            data["start"],
-            data["end"],
-            neon_id,
-        )
+    if not mqtt.get():
+        return  # Full state is published on the first refresh after connecting
+    try:
+        known_tools = set(booked.get_resource_map().keys())
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # Diffing without the tool list would treat every unreserved tool as
+        # gone. Changes are picked up by the next refresh instead.
+        log.warning(f"Could not fetch tool codes; skipping MQTT publish: {e}")
+        return
+    changed = cache.take_changed_tools(known_tools)
+    log.debug(f"Reservation changes by tool: {changed}")
+    for tool_code, views in changed.items():
+        log.info(f"Reservation state changed: {tool_code} {[v.ref for v in views]}")
+        mqtt.notify_reservation_state(tool_code, [v.as_state() for v in views])
+        for v in views:
+            mqtt.notify_reservation(
+                tool_code,
+                v.ref,
+                v.start.isoformat(),
+                v.end.isoformat(),
+                v.neon_id,
+            )
 
 
 if get_config("booked/notify_mqtt", as_bool=True):
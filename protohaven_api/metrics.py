@@ -0,0 +1,33 @@
+"""Lightweight in-process performance metrics"""
+
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """Keeps a window of recent latency samples for reporting percentiles"""
+
+    def __init__(self, n=1000):
+        self.samples: deque[float] = deque(maxlen=n)
+        self.count = 0
+        self.mu = threading.Lock()
+
+    def add(self, v: float):
+        """Records a sample, in seconds"""
+        with self.mu:
+            self.samples.append(v)
+            self.count += 1
+
+    def summary(self) -> dict:
+        """Returns count and recent p50/p95/max in milliseconds"""
+        with self.mu:
+            ss = sorted(self.samples)
+            count = self.count
+        if not ss:
+            return {"count": count}
+        return {
+            "count": count,
+            "p50_ms": round(ss[len(ss) // 2] * 1000, 3),
+            "p95_ms": round(ss[min(len(ss) - 1, int(len(ss) * 0.95))] * 1000, 3),
+            "max_ms": round(ss[-1] * 1000, 3),
+        }
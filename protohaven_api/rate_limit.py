@@ -0,0 +1,23 @@
+"""Client-side rate limiting for calls to external services (email, Discord,
+Square, Neon etc.) made from multiple threads."""
+
+import threading
+import time
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    """Spaces out calls across threads to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.mu = threading.Lock()
+        self.next = 0.0
+
+    def wait(self):
+        """Blocks until the next call is allowed"""
+        with self.mu:
+            now = time.monotonic()
+            t = max(now, self.next)
+            self.next = t + self.interval
+        if t > now:
+            time.sleep(t - now)
@@ -0,0 +1,27 @@
+"""Tests for client-side rate limiting"""
+
+import threading
+import time
+
+from protohaven_api.rate_limit import RateLimiter
+
+
+def test_rate_limiter():
+    """Calls are spaced out across threads"""
+    rl = RateLimiter(100)
+    start = time.monotonic()
+    threads = [threading.Thread(target=rl.wait) for _ in range(11)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.monotonic() - start >= 0.1
+
+
+def test_rate_limiter_unlimited(mocker):
+    """A non-positive rate never blocks"""
+    sleep = mocker.patch.object(time, "sleep")
+    rl = RateLimiter(0)
+    for _ in range(100):
+        rl.wait()
+    sleep.assert_not_called()
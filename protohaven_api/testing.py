@@ -1,14 +1,20 @@
 """Helpers for testing code"""
 
 import datetime
+import json
 import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 import yaml
+from googleapiclient.http import HttpRequest, build_http
 
 from protohaven_api.app import configure_app
 from protohaven_api.config import tz
 from protohaven_api.integrations.cronicle import Progress
+from protohaven_api.integrations.data.dev_square import Response
 
 
 class MatchStr:  # pylint: disable=too-few-public-methods
@@ -100,3 +106,237 @@ def setup_session(client, roles=True):
                 },
             }
         }
+
+
+class _StubFileHandler(BaseHTTPRequestHandler):
+    """Serves StubFileServer requests"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        """Keeps test output quiet"""
+
+    def _reply(self, code, body=b"", headers=None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Downloads a file, honoring Range requests"""
+        stub = self.server.stub  # type: ignore[attr-defined]
+        stub.hit("GET", self.path)
+        body = stub.files[self.path.split("?")[0].lstrip("/")]
+        rng = self.headers.get("Range")
+        if not rng:
+            self._reply(200, body)
+            return
+        start, end = (int(x) for x in rng.removeprefix("bytes=").split("-"))
+        end = min(end, len(body) - 1)
+        self._reply(
+            206,
+            body[start : end + 1],
+            {"Content-Range": f"bytes {start}-{end}/{len(body)}"},
+        )
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Starts a resumable upload session"""
+        stub = self.server.stub  # type: ignore[attr-defined]
+        stub.hit("POST", self.path, json.loads(self._body()))
+        with stub.mu:
+            sid = str(len(stub.uploads))
+            stub.uploads[sid] = bytearray()
+        self._reply(200, headers={"Location": f"{stub.url}/upload/{sid}"})
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Receives a chunk of a resumable upload, or reports its progress"""
+        stub = self.server.stub  # type: ignore[attr-defined]
+        body = self._body()
+        rng = self.headers["Content-Range"].removeprefix("bytes ")
+        if stub.hit("PUT", self.path, rng) in stub.fail_puts and body:
+            self._reply(503)
+            return
+        data = stub.uploads[self.path.rsplit("/", 1)[1]]
+        span, total = rng.split("/")
+        if span != "*":
+            del data[int(span.split("-")[0]) :]
+            data.extend(body)
+        if total != "*" and len(data) == int(total):
+            self._reply(200, json.dumps({"id": f"file{len(data)}"}).encode())
+        else:
+            self._reply(
+                308, headers={"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+            )
+
+
+class StubFileServer:  # pylint: disable=too-many-instance-attributes
+    """Local HTTP server standing in for Drive exports and resumable uploads,
+    and for Bookstack downloads. Every request waits `latency` seconds, and
+    the upload PUTs numbered in `fail_puts` (from 0) fail with a 503."""
+
+    def __init__(self, files: dict[str, bytes], latency=0.0, fail_puts=()):
+        self.files = files
+        self.latency = latency
+        self.fail_puts = fail_puts
+        self.uploads: dict[str, bytearray] = {}
+        self.requests: list[tuple] = []
+        self.mu = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubFileHandler)
+        self._httpd.stub = self  # type: ignore[attr-defined]
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *_):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def hit(self, *req) -> int:
+        """Records a request and applies the simulated latency; returns how
+        many earlier requests had the same method"""
+        with self.mu:
+            n = sum(r[0] == req[0] for r in self.requests)
+            self.requests.append(req)
+        time.sleep(self.latency)
+        return n
+
+    def drive(self):
+        """Returns a stand-in for the Drive v3 service that talks to this
+        server through googleapiclient's own request and media classes"""
+        url = self.url
+
+        class Files:
+            """Drive files() collection"""
+
+            def export_media(self, fileId, mimeType):  # pylint: disable=invalid-name
+                """Exports the file served at /<fileId>"""
+                assert mimeType
+                return HttpRequest(build_http(), None, f"{url}/{fileId}")
+
+            def create(self, body, media_body, **_):
+                """Starts a resumable upload"""
+                req = HttpRequest(
+                    build_http(),
+                    lambda _, content: json.loads(content),
+                    f"{url}/upload",
+                    method="POST",
+                    body=json.dumps(body),
+                    headers={"content-type": "application/json"},
+                    resumable=media_body,
+                )
+                req._sleep = lambda _: None  # pylint: disable=protected-access
+                return req
+
+        class Service:  # pylint: disable=too-few-public-methods
+            """Drive service"""
+
+            def files(self):
+                """Returns the files collection"""
+                return Files()
+
+        return Service()
+
+
+class StubSquare:  # pylint: disable=too-many-instance-attributes
+    """In-memory stand-in for the Square client's customers, catalog,
+    subscriptions and invoices APIs. Results come in pages of `page_size`,
+    every call waits `latency` seconds, and call names are recorded in
+    `calls`. Deleted catalog objects have `is_deleted` set."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        customers=(),
+        plans=(),
+        subscriptions=(),
+        invoices=(),
+        latency=0.0,
+        page_size=100,
+    ):
+        self.data = {
+            "customers": {c["id"]: c for c in customers},
+            "objects": {p["id"]: p for p in plans},
+            "subscriptions": {s["id"]: s for s in subscriptions},
+            "invoices": {i["id"]: i for i in invoices},
+        }
+        self.latency = latency
+        self.page_size = page_size
+        self.calls: list[str] = []
+        self.bodies: list[dict] = []
+        self.active = 0
+        self.max_active = 0
+        self.mu = threading.Lock()
+        # Stands in for each of the client's API groups
+        self.customers = self.catalog = self.subscriptions = self.invoices = self
+
+    def _call(self, name, body=None):
+        """Records a call and applies the simulated latency"""
+        with self.mu:
+            self.calls.append(name)
+            self.bodies.append(body or {})
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self.mu:
+                self.active -= 1
+
+    def _page(self, key, objs=None, cursor=None):
+        objs = list(self.data[key].values()) if objs is None else objs
+        start = int(cursor or 0)
+        result = {key: objs[start : start + self.page_size]}
+        if start + self.page_size < len(objs):
+            result["cursor"] = str(start + self.page_size)
+        return Response(result)
+
+    def list_customers(self, cursor=None):
+        """Lists all customers"""
+        self._call("list_customers")
+        return self._page("customers", cursor=cursor)
+
+    def search_customers(self, body):
+        """Lists customers updated since the filter's start time"""
+        self._call("search_customers", body)
+        since = body["query"]["filter"]["updated_at"]["start_at"]
+        objs = [c for c in self.data["customers"].values() if c["updated_at"] >= since]
+        return self._page("customers", objs, body.get("cursor"))
+
+    def list_catalog(self, cursor=None, types=None):
+        """Lists all subscription plan variations"""
+        assert types == "SUBSCRIPTION_PLAN_VARIATION"
+        self._call("list_catalog")
+        return self._page("objects", cursor=cursor)
+
+    def search_catalog_objects(self, body):
+        """Lists plan variations (including deleted ones) updated since
+        `begin_time`"""
+        self._call("search_catalog_objects", body)
+        objs = [
+            o
+            for o in self.data["objects"].values()
+            if o["updated_at"] >= body["begin_time"]
+        ]
+        return self._page("objects", objs, body.get("cursor"))
+
+    def search_subscriptions(self, body):
+        """Lists all subscriptions"""
+        self._call("search_subscriptions", body)
+        return self._page("subscriptions", cursor=body.get("cursor"))
+
+    def list_invoices(self, _):
+        """Lists all invoices, unpaginated like the location-wide listing"""
+        self._call("list_invoices")
+        return Response({"invoices": list(self.data["invoices"].values())})
+
+    def get_invoice(self, inv_id):
+        """Gets an invoice by ID"""
+        self._call("get_invoice")
+        return Response({"invoice": self.data["invoices"][inv_id]})